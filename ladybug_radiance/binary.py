@@ -0,0 +1,198 @@
+"""Compact binary containers of arrays used to serialize skies and studies.
+
+A container starts with a magic string and a JSON header, which holds the plain
+values of the serialized object along with the dtype, shape and offset of each
+array. The bytes of the arrays follow the header and each array is aligned to
+8 bytes such that NumPy can load them as views of the container without
+copying any data.
+"""
+import sys
+import json
+import array
+import struct
+
+try:  # first, assume we are in cPython and numpy is installed
+    import numpy as np
+except Exception:  # we are in IronPython or numpy is not installed
+    np = None
+
+from ladybug_geometry.geometry3d import Point3D, Mesh3D
+
+from .matrix import PackedBoolMatrix, SparseMatrix
+
+MAGIC = b'LBRADBIN'
+ALIGNMENT = 8  # byte alignment of each array in the container
+# typecodes of the array module that are used when NumPy is not installed
+TYPECODES = {'<f4': 'f', '<f8': 'd', '<i1': 'b', '<u1': 'B', '<i4': 'i'}
+
+
+def to_container(object_type, header, arrays=None):
+    """Get the bytes of a binary container for an object.
+
+    Args:
+        object_type: Text for the type of object in the container, which is
+            checked when the container is loaded.
+        header: A dictionary of JSON-serializable values for the object.
+        arrays: An optional dictionary with the names of arrays as keys and
+            tuples of a dtype (eg. '<f4') and an array as values. The arrays
+            can be NumPy arrays or, when NumPy is not installed, lists or
+            lists of lists. (Default: None).
+
+    Returns:
+        The bytes of the container.
+    """
+    header = dict(header)
+    header['type'] = object_type
+    header['arrays'] = {}
+    blobs, offset = [], 0
+    for name, (dtype, values) in (arrays or {}).items():
+        shape, blob = _array_bytes(dtype, values)
+        padding = -offset % ALIGNMENT
+        blobs.append(b'\x00' * padding + blob)
+        offset += padding
+        header['arrays'][name] = [dtype, list(shape), offset]
+        offset += len(blob)
+    header_bytes = json.dumps(header).encode('utf-8')
+    head = MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes
+    head += b'\x00' * (-len(head) % ALIGNMENT)
+    return head + b''.join(blobs)
+
+
+def from_container(data, object_type):
+    """Load the header and arrays of a binary container.
+
+    Args:
+        data: The bytes (or a bytearray or memoryview) of a container.
+        object_type: Text for the type of object that is expected in the container.
+
+    Returns:
+        A tuple with two items.
+
+        -   header -- A dictionary of the values in the header of the container.
+
+        -   arrays -- A dictionary of the arrays of the container. When NumPy is
+                installed, these are views of the input data, which are read-only
+                if the data is immutable. Otherwise, they are lists or lists
+                of lists.
+    """
+    view = memoryview(data)
+    assert bytes(view[:len(MAGIC)]) == MAGIC, \
+        'Data is not a ladybug-radiance binary container.'
+    head_len = struct.unpack('<I', bytes(view[len(MAGIC):len(MAGIC) + 4]))[0]
+    start = len(MAGIC) + 4
+    header = json.loads(bytes(view[start:start + head_len]).decode('utf-8'))
+    assert header['type'] == object_type, 'Expected binary container for {}. ' \
+        'Got {}.'.format(object_type, header['type'])
+    base = start + head_len + (-(start + head_len) % ALIGNMENT)
+    arrays = {}
+    for name, (dtype, shape, offset) in header.pop('arrays').items():
+        count = 1
+        for dim in shape:
+            count *= dim
+        arrays[name] = _bytes_array(view, dtype, shape, count, base + offset)
+    return header, arrays
+
+
+def matrix_to_arrays(matrix):
+    """Get the header values and arrays that represent an intersection matrix.
+
+    Args:
+        matrix: An intersection matrix as a NumPy array, PackedBoolMatrix,
+            SparseMatrix or list of lists.
+
+    Returns:
+        A tuple with a dictionary of header values and a dictionary of arrays,
+        which can be input to to_container.
+    """
+    if isinstance(matrix, PackedBoolMatrix):
+        return {'format': 'packed', 'columns': matrix.shape[1]}, \
+            {'matrix_packed': ('|u1', matrix.packed)}
+    if isinstance(matrix, SparseMatrix):
+        arrays = {
+            'matrix_data': (matrix.data.dtype.str, matrix.data),
+            'matrix_indices': (matrix.indices.dtype.str, matrix.indices),
+            'matrix_indptr': (matrix.indptr.dtype.str, matrix.indptr)
+        }
+        return {'format': 'sparse', 'columns': matrix.shape[1]}, arrays
+    if np is not None and isinstance(matrix, np.ndarray):
+        return {'format': 'dense'}, {'matrix': (matrix.dtype.str, matrix)}
+    boolean = len(matrix) != 0 and len(matrix[0]) != 0 and \
+        isinstance(matrix[0][0], bool)
+    return {'format': 'list', 'boolean': boolean}, \
+        {'matrix': ('<i1' if boolean else '<f8', matrix)}
+
+
+def matrix_from_arrays(header, arrays):
+    """Get an intersection matrix from the output of matrix_to_arrays.
+
+    Args:
+        header: The dictionary of header values output by matrix_to_arrays.
+        arrays: A dictionary of arrays, which includes those output by
+            matrix_to_arrays.
+    """
+    if header['format'] == 'packed':
+        return PackedBoolMatrix(arrays['matrix_packed'], header['columns'])
+    if header['format'] == 'sparse':
+        return SparseMatrix(arrays['matrix_data'], arrays['matrix_indices'],
+                            arrays['matrix_indptr'], header['columns'])
+    if header['format'] == 'dense':
+        return arrays['matrix']
+    matrix = arrays['matrix']
+    if np is not None:
+        matrix = matrix.tolist()
+    if header['boolean']:
+        return [[bool(v) for v in row] for row in matrix]
+    return matrix
+
+
+def mesh_to_arrays(mesh):
+    """Get a dictionary of arrays that represent the vertices and faces of a Mesh3D.
+    """
+    faces = [tuple(f) + (-1,) * (4 - len(f)) for f in mesh.faces]
+    return {
+        'mesh_vertices': ('<f8', [pt.to_array() for pt in mesh.vertices]),
+        'mesh_faces': ('<i4', faces)
+    }
+
+
+def mesh_from_arrays(arrays):
+    """Get a Mesh3D from a dictionary of arrays output by mesh_to_arrays."""
+    vertices, faces = arrays['mesh_vertices'], arrays['mesh_faces']
+    if np is not None:
+        vertices, faces = vertices.tolist(), faces.tolist()
+    faces = tuple(tuple(i for i in f if i >= 0) for f in faces)
+    return Mesh3D(tuple(Point3D(*v) for v in vertices), faces)
+
+
+def _array_bytes(dtype, values):
+    """Get the shape and bytes of an array with a given dtype."""
+    if np is not None:
+        values = np.ascontiguousarray(values, dtype=dtype)
+        return values.shape, values.tobytes()
+    if len(values) != 0 and isinstance(values[0], (list, tuple)):
+        shape = (len(values), len(values[0]))
+        values = [v for row in values for v in row]
+    else:
+        shape = (len(values),)
+    arr = array.array(TYPECODES[dtype], values)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return shape, arr.tobytes() if hasattr(arr, 'tobytes') else arr.tostring()
+
+
+def _bytes_array(view, dtype, shape, count, offset):
+    """Get an array from a memoryview of bytes."""
+    if np is not None:
+        return np.frombuffer(view, dtype, count, offset).reshape(shape)
+    arr = array.array(TYPECODES[dtype])
+    blob = bytes(view[offset:offset + count * arr.itemsize])
+    if hasattr(arr, 'frombytes'):
+        arr.frombytes(blob)
+    else:
+        arr.fromstring(blob)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    values = arr.tolist()
+    if len(shape) == 2:
+        return [values[i * shape[1]:(i + 1) * shape[1]] for i in range(shape[0])]
+    return values
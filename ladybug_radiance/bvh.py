@@ -0,0 +1,265 @@
+"""Bounding volume hierarchy for tracing rays through context geometry with NumPy.
+
+The hierarchy is built over the triangles of the context geometry by sorting them
+along a Morton (Z-order) curve and grouping consecutive triangles into leaves
+of a complete binary tree. This allows both the construction of the tree and the
+traversal of rays through it to be performed on whole arrays at once, which
+makes it possible to compute visibility between sensors and vectors without
+Radiance or any other external ray tracing engine.
+"""
+from __future__ import division
+
+try:  # first, assume we are in cPython and numpy is installed
+    import numpy as np
+except Exception:  # we are in IronPython or numpy is not installed
+    np = None
+
+from ladybug_geometry.geometry3d import Face3D, Mesh3D
+
+
+class BVH(object):
+    """A bounding volume hierarchy of triangles that can be used for occlusion tests.
+
+    Args:
+        triangles: A NumPy array with a shape of (N, 3, 3) where each item
+            contains the three vertices of a triangle.
+
+    Properties:
+        * triangles
+        * triangle_count
+        * depth
+    """
+    LEAF_SIZE = 8  # maximum number of triangles in each leaf of the tree
+    MAX_PAIRS = 2 ** 20  # maximum number of ray-node pairs processed at once
+    RAY_EPSILON = 1e-6  # minimum distance along a ray for a hit to count
+
+    __slots__ = (
+        '_triangles', '_v0', '_e1', '_e2', '_depth', '_box_min', '_box_max',
+        '_leaf_triangles')
+
+    def __init__(self, triangles):
+        """Initialize BVH."""
+        assert np is not None, 'NumPy must be installed to use the BVH.'
+        triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+        self._triangles = triangles
+        self._build()
+
+    @classmethod
+    def from_geometry(cls, context_geometry):
+        """Create a BVH from a list of ladybug geometry Face3D and/or Mesh3D.
+
+        Args:
+            context_geometry: A list of ladybug geometry Face3D and/or Mesh3D
+                to be triangulated and included in the hierarchy.
+        """
+        triangles = []
+        for geo in context_geometry:
+            if isinstance(geo, Face3D):
+                geo = geo.triangulated_mesh3d
+            elif not isinstance(geo, Mesh3D):
+                raise ValueError('Expected Face3D or Mesh3D for BVH geometry. '
+                                 'Got {}.'.format(type(geo)))
+            triangles.append(cls._mesh_triangles(geo))
+        if len(triangles) == 0:
+            return cls(np.zeros((0, 3, 3)))
+        return cls(np.concatenate(triangles))
+
+    @property
+    def triangles(self):
+        """Get a NumPy array of the triangles in the hierarchy sorted by leaf."""
+        return self._triangles
+
+    @property
+    def triangle_count(self):
+        """Get an integer for the number of triangles in the hierarchy."""
+        return len(self._triangles)
+
+    @property
+    def depth(self):
+        """Get an integer for the number of levels in the tree below the root."""
+        return self._depth
+
+    def occluded(self, origins, directions):
+        """Get whether each of a set of rays is blocked by the triangles.
+
+        Args:
+            origins: A NumPy array with a shape of (N, 3) for the start point
+                of each ray.
+            directions: A NumPy array with a shape of (N, 3) for the direction
+                of each ray. These do not have to be normalized.
+
+        Returns:
+            A NumPy array of booleans with a length of N. True indicates that
+            the ray hits one of the triangles and False indicates that it does not.
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        hit = np.zeros(len(origins), dtype=bool)
+        if len(self._triangles) == 0 or len(origins) == 0:
+            return hit
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_dirs = 1.0 / directions
+
+        # traverse the tree depth first, visiting the nearer child of each node first
+        # so that blocked rays are found early and dropped from the farther children
+        ray_ids = np.arange(len(origins))
+        stack = [(ray_ids, np.zeros(len(origins), dtype=np.int64), 0)]
+        while stack:
+            rays, nodes, level = stack.pop()
+            not_hit = ~hit[rays]  # ignore rays that were found to be blocked
+            rays, nodes = rays[not_hit], nodes[not_hit]
+            if len(rays) == 0:
+                continue
+            in_box = self._ray_box_hit(
+                origins[rays], inv_dirs[rays],
+                self._box_min[nodes], self._box_max[nodes])
+            rays, nodes = rays[in_box], nodes[in_box]
+            if len(rays) == 0:
+                continue
+            if level == self._depth:  # test the rays against the leaf triangles
+                self._leaf_hits(origins, directions, rays, nodes, hit)
+                continue
+            left = nodes * 2 + 1
+            left_first = self._left_is_near(origins[rays], directions[rays], left)
+            near = np.where(left_first, left, left + 1)
+            far = np.where(left_first, left + 1, left)
+            for child in (far, near):
+                for st in reversed(range(0, len(rays), self.MAX_PAIRS)):
+                    end = st + self.MAX_PAIRS
+                    stack.append((rays[st:end], child[st:end], level + 1))
+        return hit
+
+    def _leaf_hits(self, origins, directions, rays, nodes, hit):
+        """Test rays against the triangles of leaf nodes and mark blocked rays."""
+        leaf_ids = nodes - (2 ** self._depth - 1)
+        tri_ids = self._leaf_triangles[leaf_ids].ravel()
+        rays = np.repeat(rays, self.LEAF_SIZE)
+        valid = tri_ids >= 0
+        rays, tri_ids = rays[valid], tri_ids[valid]
+
+        # perform the Moller-Trumbore intersection test for all rays at once
+        dirs, e1, e2 = directions[rays], self._e1[tri_ids], self._e2[tri_ids]
+        p_vec = self._cross(dirs, e2)
+        det = np.einsum('ij,ij->i', e1, p_vec)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_det = 1.0 / det
+            t_vec = origins[rays] - self._v0[tri_ids]
+            u = np.einsum('ij,ij->i', t_vec, p_vec) * inv_det
+            q_vec = self._cross(t_vec, e1)
+            v = np.einsum('ij,ij->i', dirs, q_vec) * inv_det
+            t = np.einsum('ij,ij->i', e2, q_vec) * inv_det
+            blocked = (det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1) & \
+                (t > self.RAY_EPSILON)
+        hit[rays[blocked]] = True
+
+    def _build(self):
+        """Build the tree from the triangles assigned to this object."""
+        triangles = self._triangles
+        tri_count = len(triangles)
+        leaf_count = max(int(np.ceil(tri_count / self.LEAF_SIZE)), 1)
+        depth = int(np.ceil(np.log2(leaf_count))) if leaf_count > 1 else 0
+        full_count = 2 ** depth
+
+        # sort the triangles along a Morton curve so that each leaf is compact
+        if tri_count != 0:
+            order = np.argsort(self._morton_codes(triangles.mean(axis=1)), kind='stable')
+            triangles = triangles[order]
+        self._triangles = triangles
+        self._v0 = triangles[:, 0]
+        self._e1 = triangles[:, 1] - triangles[:, 0]
+        self._e2 = triangles[:, 2] - triangles[:, 0]
+
+        # assign the triangles to leaves and compute the leaf bounding boxes
+        leaf_tris = np.full(full_count * self.LEAF_SIZE, -1, dtype=np.int64)
+        leaf_tris[:tri_count] = np.arange(tri_count)
+        leaf_tris = leaf_tris.reshape(full_count, self.LEAF_SIZE)
+        tri_min, tri_max = triangles.min(axis=1), triangles.max(axis=1)
+        if tri_count != 0:  # pad the boxes so rays grazing their edges are not missed
+            tol = self.RAY_EPSILON * max(np.abs(triangles).max(), 1)
+            tri_min, tri_max = tri_min - tol, tri_max + tol
+        pad_min = np.full((full_count * self.LEAF_SIZE, 3), np.inf)
+        pad_max = np.full((full_count * self.LEAF_SIZE, 3), -np.inf)
+        pad_min[:tri_count], pad_max[:tri_count] = tri_min, tri_max
+        level_min = pad_min.reshape(full_count, self.LEAF_SIZE, 3).min(axis=1)
+        level_max = pad_max.reshape(full_count, self.LEAF_SIZE, 3).max(axis=1)
+
+        # compute the bounding boxes of each level of the tree from the bottom up
+        mins, maxs = [level_min], [level_max]
+        while len(level_min) > 1:
+            level_min = np.minimum(level_min[0::2], level_min[1::2])
+            level_max = np.maximum(level_max[0::2], level_max[1::2])
+            mins.append(level_min)
+            maxs.append(level_max)
+        self._box_min = np.concatenate(mins[::-1])
+        self._box_max = np.concatenate(maxs[::-1])
+        self._leaf_triangles = leaf_tris
+        self._depth = depth
+
+    def _left_is_near(self, origins, directions, left):
+        """Get a boolean array for whether left children are nearer along the rays."""
+        with np.errstate(invalid='ignore'):  # empty boxes have undefined centers
+            l_cent = self._box_min[left] + self._box_max[left]
+            r_cent = self._box_min[left + 1] + self._box_max[left + 1]
+            dist = np.einsum('ij,ij->i', l_cent - r_cent, directions)
+        return ~(dist > 0)
+
+    @staticmethod
+    def _ray_box_hit(origins, inv_dirs, box_min, box_max):
+        """Get a boolean array for whether rays hit axis-aligned bounding boxes."""
+        with np.errstate(invalid='ignore', over='ignore'):
+            t1 = (box_min - origins) * inv_dirs
+            t2 = (box_max - origins) * inv_dirs
+            # NaN results come from rays parallel to a box that start on its plane
+            t_near = np.nanmax(np.minimum(t1, t2), axis=1)
+            t_far = np.nanmin(np.maximum(t1, t2), axis=1)
+        # empty boxes have inverted bounds and can never be hit
+        return (t_far >= t_near) & (t_far >= 0) & (box_min[:, 0] <= box_max[:, 0])
+
+    @staticmethod
+    def _cross(a, b):
+        """Get the row-wise cross product of two arrays with a shape of (N, 3)."""
+        result = np.empty_like(a)
+        result[:, 0] = a[:, 1] * b[:, 2] - a[:, 2] * b[:, 1]
+        result[:, 1] = a[:, 2] * b[:, 0] - a[:, 0] * b[:, 2]
+        result[:, 2] = a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]
+        return result
+
+    @staticmethod
+    def _morton_codes(points):
+        """Get an array of 30-bit Morton codes for an array of points."""
+        p_min, p_max = points.min(axis=0), points.max(axis=0)
+        extents = np.where(p_max - p_min > 0, p_max - p_min, 1)
+        grid = ((points - p_min) / extents * 1023).astype(np.int64)
+        codes = np.zeros(len(points), dtype=np.int64)
+        for i in range(3):
+            v = grid[:, i]
+            v = (v * 0x00010001) & 0xFF0000FF
+            v = (v * 0x00000101) & 0x0F00F00F
+            v = (v * 0x00000011) & 0xC30C30C3
+            v = (v * 0x00000005) & 0x49249249
+            codes |= v << (2 - i)
+        return codes
+
+    @staticmethod
+    def _mesh_triangles(mesh):
+        """Get an array of triangles with a shape of (N, 3, 3) from a Mesh3D."""
+        verts = np.array([pt.to_array() for pt in mesh.vertices], dtype=np.float64)
+        tris = []
+        for face in mesh.faces:
+            tris.append((face[0], face[1], face[2]))
+            if len(face) == 4:
+                tris.append((face[2], face[3], face[0]))
+        if len(tris) == 0:
+            return np.zeros((0, 3, 3))
+        return verts[np.array(tris, dtype=np.int64)]
+
+    def ToString(self):
+        """Overwrite .NET ToString."""
+        return self.__repr__()
+
+    def __len__(self):
+        return len(self._triangles)
+
+    def __repr__(self):
+        """BVH object representation."""
+        return 'BVH [{} triangles]'.format(len(self._triangles))
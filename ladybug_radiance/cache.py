@@ -0,0 +1,219 @@
+"""Content-addressed, size-bounded cache of simulation files on disk.
+
+Each entry of the cache is a folder named after the hash of the inputs that
+produced its files. Entries are written to a staging folder and moved into place
+once complete such that several processes can safely share one cache folder.
+When the cache grows beyond its maximum size, the least recently used entries
+are deleted.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+
+try:  # first, assume we are in cPython and numpy is installed
+    import numpy as np
+except Exception:  # we are in IronPython or numpy is not installed
+    np = None
+
+from ladybug_geometry.geometry3d import Face3D, Mesh3D
+
+
+class FileCache(object):
+    """A folder of cached simulation files, which are keyed by a hash of their inputs.
+
+    Args:
+        folder: Path to the folder where the cache entries are stored. This
+            folder will be created if it does not exist.
+        max_size: An integer for the maximum size of the cache in bytes. Once
+            this size is exceeded, the least recently used entries will be
+            deleted. (Default: 1 GB).
+
+    Properties:
+        * folder
+        * max_size
+        * size
+        * keys
+    """
+    __slots__ = ('_folder', '_max_size')
+    STAGING_PREFIX = '.staging_'
+
+    def __init__(self, folder, max_size=1024 ** 3):
+        """Initialize FileCache."""
+        folder = os.path.abspath(folder)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:  # folder was created by another process
+                assert os.path.isdir(folder), \
+                    'Failed to create cache folder: {}'.format(folder)
+        self._folder = folder
+        self.max_size = max_size
+
+    @property
+    def folder(self):
+        """Get the path to the folder where the cache entries are stored."""
+        return self._folder
+
+    @property
+    def max_size(self):
+        """Get or set an integer for the maximum size of the cache in bytes."""
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value):
+        value = int(value)
+        assert value >= 0, 'FileCache max_size must be greater than or equal to ' \
+            '0. Got {}.'.format(value)
+        self._max_size = value
+
+    @property
+    def size(self):
+        """Get an integer for the total size of all entries in the cache in bytes."""
+        return sum(self._entry_size(os.path.join(self._folder, k)) for k in self.keys)
+
+    @property
+    def keys(self):
+        """Get a list of the keys of all complete entries in the cache."""
+        return [k for k in os.listdir(self._folder)
+                if not k.startswith(self.STAGING_PREFIX) and
+                os.path.isdir(os.path.join(self._folder, k))]
+
+    def get(self, key):
+        """Get the path to the folder of a cache entry.
+
+        Args:
+            key: Text for the key of the entry.
+
+        Returns:
+            The path to the folder of the entry or None if the entry is not
+            in the cache.
+        """
+        entry = os.path.join(self._folder, key)
+        if not os.path.isdir(entry):
+            return None
+        try:  # mark the entry as recently used
+            os.utime(entry, None)
+        except OSError:  # entry was evicted by another process
+            return None
+        return entry
+
+    def stage(self):
+        """Get the path to a new, empty folder where the files of an entry can be written.
+
+        Once all files are written, the staging folder should be passed to
+        the add method in order to make it an entry of the cache.
+        """
+        return tempfile.mkdtemp(prefix=self.STAGING_PREFIX, dir=self._folder)
+
+    def add(self, key, staging_folder):
+        """Add a staging folder of complete files to the cache as an entry.
+
+        Args:
+            key: Text for the key of the entry.
+            staging_folder: Path to a folder returned from the stage method,
+                which contains all of the files of the entry.
+
+        Returns:
+            The path to the folder of the entry.
+        """
+        entry = os.path.join(self._folder, key)
+        try:
+            os.rename(staging_folder, entry)
+        except OSError:  # another process already added the same entry
+            shutil.rmtree(staging_folder, ignore_errors=True)
+        self.evict(keep=key)
+        return entry
+
+    def evict(self, keep=None):
+        """Delete the least recently used entries until the cache fits its max_size.
+
+        Args:
+            keep: Optional text for the key of an entry that should not be
+                deleted, typically because it is about to be used. (Default: None).
+        """
+        entries = []
+        for key in self.keys:
+            entry = os.path.join(self._folder, key)
+            try:
+                entries.append((os.path.getmtime(entry), key, self._entry_size(entry)))
+            except OSError:  # entry was evicted by another process
+                pass
+        total = sum(e[2] for e in entries)
+        for _, key, e_size in sorted(entries):
+            if total <= self._max_size:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self._folder, key), ignore_errors=True)
+            total -= e_size
+
+    def clear(self):
+        """Delete all entries of the cache."""
+        for key in self.keys:
+            shutil.rmtree(os.path.join(self._folder, key), ignore_errors=True)
+
+    @staticmethod
+    def _entry_size(entry):
+        """Get the size of all files in an entry folder in bytes."""
+        total = 0
+        for root, _, files in os.walk(entry):
+            for f in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, f))
+                except OSError:  # file was deleted by another process
+                    pass
+        return total
+
+    def ToString(self):
+        """Overwrite .NET ToString."""
+        return self.__repr__()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return os.path.isdir(os.path.join(self._folder, key))
+
+    def __repr__(self):
+        """FileCache object representation."""
+        return 'FileCache [{} entries]'.format(len(self))
+
+
+def hash_values(*values):
+    """Get a hash string for a set of values that can be used as a cache key.
+
+    Args:
+        *values: Any number of numbers, strings, tuples of numbers or
+            NumPy arrays to be hashed together.
+    """
+    hasher = hashlib.sha1()
+    for val in values:
+        if np is not None and isinstance(val, np.ndarray):
+            hasher.update(str(val.dtype).encode('utf-8'))
+            hasher.update(str(val.shape).encode('utf-8'))
+            hasher.update(np.ascontiguousarray(val).tobytes())
+        else:
+            hasher.update(repr(val).encode('utf-8'))
+        hasher.update(b'|')
+    return hasher.hexdigest()
+
+
+def geometry_hash(geometry):
+    """Get a hash string for a list of ladybug geometry Face3D and/or Mesh3D.
+
+    Args:
+        geometry: A list of ladybug geometry Face3D and/or Mesh3D.
+    """
+    values = []
+    for geo in geometry:
+        if isinstance(geo, Face3D):
+            values.append(('Face3D',) + tuple(v for pt in geo.vertices for v in pt))
+        elif isinstance(geo, Mesh3D):
+            if np is not None:
+                values.append(
+                    np.array([pt.to_array() for pt in geo.vertices], dtype=np.float64))
+            else:
+                values.append(tuple(v for pt in geo.vertices for v in pt))
+            values.append(('Mesh3D',) + tuple(geo.faces))
+    return hash_values(*values)
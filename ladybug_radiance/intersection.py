@@ -1,9 +1,13 @@
 """Function to compute the intersection between vectors and points."""
 from __future__ import division
 import os
+import shutil
 import subprocess
 import tempfile
+import threading
+import shlex
 import math
+import mmap
 
 try:  # first, assume we are in cPython and numpy is installed
     from typing import Tuple
@@ -12,11 +16,17 @@ except Exception:  # we are in IronPython or numpy is not installed
     np, Tuple = None, None
 
 from ladybug_geometry.interop.obj import OBJ
-from ladybug_geometry.geometry3d import Face3D, Mesh3D
+from ladybug_geometry.geometry3d import Vector3D, Face3D, Mesh3D
 from ladybug.futil import write_to_file_by_name
 from ladybug.viewsphere import view_sphere
 
 from .config import folders
+from .cache import FileCache, hash_values, geometry_hash
+from .parallel import run_in_threads
+from .bvh import BVH
+from .matrix import PackedBoolMatrix, SparseMatrix
+from .binary import to_container, from_container, matrix_to_arrays, \
+    matrix_from_arrays
 
 if folders.radbin_path is not None:
     OCONV_EXE = os.path.join(folders.radbin_path, 'oconv.exe') if \
@@ -28,12 +38,29 @@ if folders.radbin_path is not None:
 else:
     OCONV_EXE, RCONTRIB_EXE, OBJ2MESH_EXE = None, None, None
 OCTREE_RES = 32768  # resolution of the octree to use
+OCTREE_CACHE_SIZE = 1024 ** 3  # maximum size of an octree_cache folder in bytes
+MATRIX_CACHE_SIZE = 4 * 1024 ** 3  # maximum size of a matrix_cache folder in bytes
+MATRIX_CACHE_VERSION = 1  # version of the matrix_cache entries, used in their keys
 BLACK = 'void plastic black 0 0 5 0.0 0.0 0.0 0.0 0.0'
+BACKENDS = ('radiance', 'numpy')
+MATRIX_FORMATS = ('dense', 'packed', 'sparse', 'auto')
+SPARSE_DENSITY = 0.1  # maximum fraction of non-zero values for auto to pick sparse
+RCONTRIB_PAR = \
+    '-V- -aa 0.0 -y {} -I -f{} -ab 0 -dc 1.0 -dt 0.0 -dj 0.0 -dr 0 -M "{}"'
+WORKER_SENSORS = 2 ** 17  # maximum number of sensors traced by one rcontrib process
+GEO_CHUNK = 2 ** 16  # number of polygons written to geometry.rad at once
+STREAM_CHUNK = 2 ** 24  # number of bytes read at once from a streamed rcontrib
+RAY_BATCH = 2 ** 18  # maximum number of rays traced at once by the numpy backend
+REFINE_ANGLE = 18  # degrees around a high density patch to the low density patches
+FTINY = 1e-6  # cosine at or below which a vector is behind a sensor, as in Radiance
+RGB_CONVERSION = np.array([14713, 0, 0]) if np is not None else None
 
 
 def intersection_matrix(
         vectors, points, normals, context_geometry,
-        offset_distance=0, numericalize=False, sim_folder=None, use_radiance_mesh=False
+        offset_distance=0, numericalize=False, sim_folder=None, use_radiance_mesh=False,
+        backend='radiance', octree_cache=None, stream=False, workers=1,
+        matrix_format='dense', max_distance=None, matrix_cache=None
     ):
     """Compute the intersection matrix between vectors and points.
 
@@ -56,29 +83,482 @@ def intersection_matrix(
             can be useful for computing radiation and irradiance while the booleans
             are more helpful for direct sun and view studies. (Default: False).
         sim_folder: An optional path to a folder where the simulation files
-            will be written. If None, a temporary directory will be
-            used. (Default: None).
+            will be written. If None, a unique temporary directory will be used
+            and it will be deleted once the simulation is complete. Calls that run
+            at the same time should not share the same sim_folder. (Default: None).
         use_radiance_mesh: A boolean to note whether input Mesh3D should be translated
             to Radiance Meshes for simulation or whether they should simply have
             their faces translated to Radiance polygons. For complex context geometry,
             Radiance meshes will use less memory but they take a longer time
             to prepare compared to polygons. (Default: False).
+        backend: Text for the engine used to trace the rays. Choose from the following.
+            (Default: radiance).
+
+            * radiance - write the scene to files and trace it with rcontrib
+            * numpy - trace the rays in-process through a NumPy BVH of the context
+
+        octree_cache: An optional path to a folder where the compiled octree of
+            the context_geometry and vectors is cached for use by later calls with
+            the same geometry and vectors. Entries of the cache are keyed by a hash
+            of the geometry, vectors and octree resolution and the least recently
+            used entries are deleted once the folder exceeds OCTREE_CACHE_SIZE.
+            If None, the octree is compiled for every call. This input is
+            only used by the radiance backend. (Default: None).
+        stream: A boolean to note whether the sensors should be written as binary
+            numbers directly to the input of rcontrib and the results read directly
+            from its output (True) instead of passing through sensors.pts and
+            results.mtx files on disk (False). Streaming avoids large amounts of
+            file I/O for studies with many sensors and requires NumPy. This input
+            is only used by the radiance backend. (Default: False).
+        workers: A positive integer for the number of rcontrib processes to run
+            in parallel against the same octree. The sensors are split into chunks,
+            which are never larger than WORKER_SENSORS in order to limit the
+            memory used by each process, and the results of the chunks are
+            stitched back together in order. This input is only used by the
+            radiance backend and requires NumPy. (Default: 1).
+        matrix_format: Text for the format of the output matrix when NumPy is
+            installed. Choose from the following. (Default: dense).
+
+            * dense - a NumPy array of booleans or numbers
+            * packed - a PackedBoolMatrix, which stores each boolean as a single
+              bit and can only be used when numericalize is False
+            * sparse - a SparseMatrix, which stores only the non-zero values
+            * auto - a SparseMatrix if the fraction of non-zero values is at
+              most SPARSE_DENSITY and a NumPy array otherwise
+
+        max_distance: An optional number for the maximum distance from the sensors
+            at which context_geometry can block the vectors. When specified, any
+            context_geometry that cannot block the vectors from any of the sensors,
+            either because it lies outside the directions of the vectors or
+            because it lies entirely beyond this distance, is removed before
+            tracing. Infinity can be used to remove geometry using only the
+            directions of the vectors. No geometry is removed when an octree_cache
+            is used with the radiance backend such that the cached octree can be
+            shared by any sensors. If None, all of the context_geometry is
+            traced. (Default: None).
+        matrix_cache: An optional path to a folder where the output matrix is
+            stored for use by later calls, including those of other processes,
+            with the same vectors, points, normals, context_geometry and options
+            that affect the matrix. Entries of the cache are keyed by a hash of
+            these inputs and are loaded as memory-mapped files without tracing
+            any rays. The least recently used entries are deleted once the
+            folder exceeds MATRIX_CACHE_SIZE. If None, the matrix is traced
+            for every call. (Default: None).
 
     Returns:
         A lists of lists, which can be used to account for context shade surrounding
         visualizations or geometry. The matrix will have a length equal to the points
         (and normals). Each sub-list consists of booleans and has a length equal to
         the number of vectors. True indicates that a certain patch is seen and False
-        indicates that the match is blocked.
+        indicates that the match is blocked. When NumPy is installed, the matrix
+        is a NumPy array, PackedBoolMatrix or SparseMatrix according to the
+        matrix_format.
     """
-    # set a default sim folder if None is specified
+    # trace the rays in-process if the numpy backend is requested
+    assert backend in BACKENDS, 'Intersection backend "{}" is not recognized. ' \
+        'Choose from: {}.'.format(backend, ', '.join(BACKENDS))
+    assert workers >= 1, 'Intersection workers must be at least 1. ' \
+        'Got {}.'.format(workers)
+    assert matrix_format in MATRIX_FORMATS, 'Intersection matrix_format "{}" is ' \
+        'not recognized. Choose from: {}.'.format(
+            matrix_format, ', '.join(MATRIX_FORMATS))
+    assert matrix_format != 'packed' or not numericalize, \
+        'A packed intersection matrix_format cannot be numericalized.'
+
+    # load the matrix from the cache or trace it and add it to the cache
+    if matrix_cache is not None:
+        key = _matrix_key(
+            vectors, points, normals, context_geometry, offset_distance,
+            numericalize, backend, matrix_format, max_distance, None)
+        return _cached_matrix(
+            matrix_cache, key, intersection_matrix, vectors, points, normals,
+            context_geometry, offset_distance, numericalize, sim_folder,
+            use_radiance_mesh, backend, octree_cache, stream, workers, matrix_format,
+            max_distance)
+
+    # remove the context geometry that cannot block any of the rays
+    if max_distance is not None and (backend == 'numpy' or octree_cache is None):
+        ray_pts = points if offset_distance == 0 else \
+            [pt.move(vec * offset_distance) for pt, vec in zip(points, normals)]
+        context_geometry, _ = cull_context_geometry(
+            context_geometry, ray_pts, vectors, normals, max_distance)
+    if backend == 'numpy':
+        return _numpy_intersection_matrix(
+            vectors, points, normals, context_geometry, offset_distance, numericalize,
+            matrix_format)
+
+    # run the simulation in a unique temporary folder if None is specified
+    rad_args = (vectors, points, normals, context_geometry, offset_distance,
+                numericalize, use_radiance_mesh, octree_cache, stream, workers,
+                matrix_format)
     if sim_folder is None:
-        sim_folder = tempfile.gettempdir()
-    else:
-        if not os.path.isdir(sim_folder):
+        sim_folder = tempfile.mkdtemp(prefix='ladybug_radiance_')
+        try:
+            return _radiance_intersection_matrix(sim_folder, *rad_args)
+        finally:
+            shutil.rmtree(sim_folder, ignore_errors=True)
+    sim_folder = os.path.abspath(sim_folder)
+    if not os.path.isdir(sim_folder):
+        try:
             os.makedirs(sim_folder)
+        except OSError:  # folder was created by another thread or process
+            assert os.path.isdir(sim_folder), \
+                'Failed to create sim_folder: {}'.format(sim_folder)
+    return _radiance_intersection_matrix(sim_folder, *rad_args)
+
+
+def sky_intersection_matrix(
+        sky_matrix, points, normals, context_geometry,
+        offset_distance=0, numericalize=False, sim_folder=None, use_radiance_mesh=False,
+        backend='radiance', octree_cache=None, stream=False, workers=1,
+        matrix_format='dense', max_distance=None, hierarchical=False,
+        matrix_cache=None
+    ):
+    """Compute the intersection matrix between a sky matrix through points.
+
+    Args:
+        sky_matrix: A SkyMatrix object, which provides the vectors to be projected
+            from the points through the context_geometry.
+        points: A list of ladybug geometry Point3D representing the sensors
+            to be studied.
+        normals: A list of ladybug geometry Vector3D that matches the length of
+            the points list and indicate the normal direction of each point.
+        context_geometry: A list of ladybug geometry Face3D that can block the
+            vectors projected from the test points.
+        offset_distance: An optional number to offset the sensor points before
+            the vectors are cast through the context_geometry. (Default: 0).
+        numericalize: A boolean to note whether the output matrix should contain
+            numbers representing the cosine of the angle between the normal and
+            each vector or it should simply be a matrix of booleans for whether
+            the vector is seen by the surface (True) or not (False). Numbers
+            can be useful for computing radiation and irradiance while the booleans
+            are more helpful for direct sun and view studies. (Default: False).
+        sim_folder: An optional path to a folder where the simulation files
+            will be written. If None, a unique temporary directory will be used
+            and it will be deleted once the simulation is complete. Calls that run
+            at the same time should not share the same sim_folder. (Default: None).
+        use_radiance_mesh: A boolean to note whether input Mesh3D should be translated
+            to Radiance Meshes for simulation or whether they should simply have
+            their faces translated to Radiance polygons. For complex context geometry,
+            Radiance meshes will use less memory but they take a longer time
+            to prepare compared to polygons. (Default: False).
+        backend: Text for the engine used to trace the rays. Choose from the following.
+            (Default: radiance).
+
+            * radiance - write the scene to files and trace it with rcontrib
+            * numpy - trace the rays in-process through a NumPy BVH of the context
+
+        octree_cache: An optional path to a folder where the compiled octree of
+            the context_geometry and vectors is cached for use by later calls with
+            the same geometry and vectors. Entries of the cache are keyed by a hash
+            of the geometry, vectors and octree resolution and the least recently
+            used entries are deleted once the folder exceeds OCTREE_CACHE_SIZE.
+            If None, the octree is compiled for every call. This input is
+            only used by the radiance backend. (Default: None).
+        stream: A boolean to note whether the sensors should be written as binary
+            numbers directly to the input of rcontrib and the results read directly
+            from its output (True) instead of passing through sensors.pts and
+            results.mtx files on disk (False). Streaming avoids large amounts of
+            file I/O for studies with many sensors and requires NumPy. This input
+            is only used by the radiance backend. (Default: False).
+        workers: A positive integer for the number of rcontrib processes to run
+            in parallel against the same octree. The sensors are split into chunks,
+            which are never larger than WORKER_SENSORS in order to limit the
+            memory used by each process, and the results of the chunks are
+            stitched back together in order. This input is only used by the
+            radiance backend and requires NumPy. (Default: 1).
+        matrix_format: Text for the format of the output matrix when NumPy is
+            installed. Choose from the following. (Default: dense).
+
+            * dense - a NumPy array of booleans or numbers
+            * packed - a PackedBoolMatrix, which stores each boolean as a single
+              bit and can only be used when numericalize is False
+            * sparse - a SparseMatrix, which stores only the non-zero values
+            * auto - a SparseMatrix if the fraction of non-zero values is at
+              most SPARSE_DENSITY and a NumPy array otherwise
+
+        max_distance: An optional number for the maximum distance from the sensors
+            at which context_geometry can block the vectors. When specified, any
+            context_geometry that cannot block the vectors from any of the sensors,
+            either because it lies outside the directions of the vectors or
+            because it lies entirely beyond this distance, is removed before
+            tracing. Infinity can be used to remove geometry using only the
+            directions of the vectors. No geometry is removed when an octree_cache
+            is used with the radiance backend such that the cached octree can be
+            shared by any sensors. If None, all of the context_geometry is
+            traced. (Default: None).
+        matrix_cache: An optional path to a folder where the output matrix is
+            stored for use by later calls, including those of other processes,
+            with the same vectors, points, normals, context_geometry and options
+            that affect the matrix. Entries of the cache are keyed by a hash of
+            these inputs and are loaded as memory-mapped files without tracing
+            any rays. The least recently used entries are deleted once the
+            folder exceeds MATRIX_CACHE_SIZE. If None, the matrix is traced
+            for every call. (Default: None).
+        hierarchical: A boolean to note whether the intersection with a high
+            density sky_matrix should be computed hierarchically. In this case,
+            the vectors of the low density (Tregenza) patches are traced first and
+            each high density (Reinhart) patch takes the visibility of the
+            Tregenza patches within REFINE_ANGLE of it when those in front of the
+            sensor are all seen or all blocked. Only the high density patches
+            with mixed visibility around them are traced, which uses far fewer
+            rays for sensors that see open sky or are under large overhangs.
+            The result is approximate since context geometry that is small enough
+            to lie entirely between the Tregenza patches within REFINE_ANGLE of a
+            Reinhart patch can be missed. Only the numpy backend traces the mixed
+            pairs of sensors and patches alone. The radiance backend traces every
+            mixed patch for every sensor with any mixed patches and so it
+            usually gets little benefit. This input is only used for high
+            density skies when NumPy is installed. (Default: False).
+
+    Returns:
+        A lists of lists, which can be used to account for context shade surrounding
+        visualizations or geometry. The matrix will have a length equal to the points
+        (and normals). Each sub-list consists of booleans and has a length equal
+        to the number of sky patches times 2 (indicating sky patches and ground patches).
+        True indicates that a certain patch is seen and False indicates that the
+        match is blocked. When NumPy is installed, the matrix is a NumPy array,
+        PackedBoolMatrix or SparseMatrix according to the matrix_format.
+    """
+    # process the sky into an acceptable format
+    vectors = sky_vectors(sky_matrix)
+    if hierarchical and sky_matrix.high_density and np is not None:
+        coarse_vectors = _patch_vectors(False, sky_matrix.north)
+        h_args = (coarse_vectors, vectors, points, normals, context_geometry,
+                  offset_distance, numericalize, sim_folder, use_radiance_mesh,
+                  backend, octree_cache, stream, workers, matrix_format, max_distance)
+        if matrix_cache is None:
+            return _hierarchical_intersection_matrix(*h_args)
+        key = _matrix_key(
+            vectors, points, normals, context_geometry, offset_distance,
+            numericalize, backend, matrix_format, max_distance, REFINE_ANGLE)
+        return _cached_matrix(
+            matrix_cache, key, _hierarchical_intersection_matrix, *h_args)
+    # compute the intersection matrix
+    return intersection_matrix(
+        vectors, points, normals, context_geometry,
+        offset_distance, numericalize, sim_folder, use_radiance_mesh, backend,
+        octree_cache, stream, workers, matrix_format, max_distance, matrix_cache)
+
+
+def update_intersection_matrix(
+        int_mtx, vectors, points, normals, old_geometry, new_geometry,
+        offset_distance=0, numericalize=False, sim_folder=None,
+        use_radiance_mesh=False, backend='radiance'):
+    """Update an intersection matrix after a change to its context geometry.
+
+    The geometry that was added and removed is found by comparing the old and
+    new context geometry and only the rays that pass through the bounding boxes
+    of this changed geometry are traced again. Rays that were seen can only be
+    blocked by the added geometry while rays that were blocked can only become
+    seen where geometry was removed. So the time to update the matrix is
+    proportional to the size of the change rather than the size of the scene.
+
+    Args:
+        int_mtx: An intersection matrix, which was computed with the old_geometry
+            and all of the other inputs to this function. NumPy arrays,
+            PackedBoolMatrix and SparseMatrix are updated in place.
+        vectors: A list of ladybug geometry Vector3D used to compute the int_mtx.
+        points: A list of ladybug geometry Point3D used to compute the int_mtx.
+        normals: A list of ladybug geometry Vector3D used to compute the int_mtx.
+        old_geometry: A list of ladybug geometry Face3D and/or Mesh3D for the
+            context geometry used to compute the int_mtx.
+        new_geometry: A list of ladybug geometry Face3D and/or Mesh3D for the
+            new context geometry.
+        offset_distance: An optional number to offset the sensor points before
+            the vectors are cast through the context_geometry. (Default: 0).
+        numericalize: A boolean to note whether the int_mtx contains the cosine
+            of the angle between the normal and each vector (True) or
+            booleans (False). (Default: False).
+        sim_folder: An optional path to a folder where the simulation files
+            will be written. If None, a unique temporary directory will
+            be used. (Default: None).
+        use_radiance_mesh: A boolean to note whether input Mesh3D should be translated
+            to Radiance Meshes for simulation. (Default: False).
+        backend: Text for the engine used to trace the rays. Choose from the following.
+            (Default: radiance).
+
+            * radiance - trace all vectors again for the sensors with changed rays
+            * numpy - trace only the changed rays through a NumPy BVH
+
+    Returns:
+        The updated intersection matrix. If NumPy is not installed, this is a new
+        list of lists for the matrix, which is computed with all of the sensors.
+    """
+    assert backend in BACKENDS, 'Intersection backend "{}" is not recognized. ' \
+        'Choose from: {}.'.format(backend, ', '.join(BACKENDS))
+    added, removed = _geometry_difference(old_geometry, new_geometry)
+    if len(added) == 0 and len(removed) == 0:
+        return int_mtx
+    if np is None or isinstance(int_mtx, list):  # compute the whole matrix again
+        return intersection_matrix(
+            vectors, points, normals, new_geometry, offset_distance, numericalize,
+            sim_folder, use_radiance_mesh, backend)
+
+    # get the rays and the bounding boxes of the changed geometry
+    pts = np.array([pt.to_array() for pt in points], dtype=np.float64).reshape(-1, 3)
+    nrms = np.array([v.to_array() for v in normals], dtype=np.float64).reshape(-1, 3)
+    vecs = np.array([v.to_array() for v in vectors], dtype=np.float64).reshape(-1, 3)
+    if offset_distance != 0:  # account for the offset distance
+        pts = pts + nrms * offset_distance
+    vecs = vecs / np.linalg.norm(vecs, axis=1)[:, None]
+    added_boxes, removed_boxes = _geometry_boxes(added), _geometry_boxes(removed)
+    if backend == 'numpy':
+        added_bvh = BVH.from_geometry(added) if len(added) != 0 else None
+        new_bvh = BVH.from_geometry(new_geometry) if len(removed) != 0 else None
+
+    # find the rays that may have changed in batches of sensors
+    retrace_rows = []
+    row_count = max(RAY_BATCH // max(len(vecs), 1), 1)
+    for st in range(0, len(pts), row_count):
+        c_pts = pts[st:st + row_count]
+        rows = int_mtx[st:st + row_count].copy() if isinstance(int_mtx, np.ndarray) \
+            else int_mtx.rows(st, st + row_count)
+        cos_mtx = np.dot(nrms[st:st + row_count], vecs.T)
+        block_test = (rows > 0) & _rays_hit_boxes(c_pts, vecs, added_boxes)
+        unblock_test = (rows == 0) & (cos_mtx > FTINY) & \
+            _rays_hit_boxes(c_pts, vecs, removed_boxes)
+        if backend == 'radiance':
+            changed = (block_test | unblock_test).any(axis=1)
+            retrace_rows.extend((np.nonzero(changed)[0] + st).tolist())
+            continue
+
+        # trace the rays that may have changed through the BVH
+        pt_ids, vec_ids = np.nonzero(block_test)
+        if len(pt_ids) != 0:
+            blocked = added_bvh.occluded(c_pts[pt_ids], vecs[vec_ids])
+            rows[pt_ids[blocked], vec_ids[blocked]] = 0
+        pt_ids, vec_ids = np.nonzero(unblock_test)
+        if len(pt_ids) != 0:
+            seen = ~new_bvh.occluded(c_pts[pt_ids], vecs[vec_ids])
+            pt_ids, vec_ids = pt_ids[seen], vec_ids[seen]
+            rows[pt_ids, vec_ids] = cos_mtx[pt_ids, vec_ids]
+        changed = np.nonzero((block_test | unblock_test).any(axis=1))[0]
+        _set_matrix_rows(int_mtx, changed + st, rows[changed])
+
+    # trace all vectors again with Radiance for the sensors with changed rays
+    if len(retrace_rows) != 0:
+        new_rows = intersection_matrix(
+            vectors, [points[i] for i in retrace_rows],
+            [normals[i] for i in retrace_rows], new_geometry, offset_distance,
+            numericalize, sim_folder, use_radiance_mesh, backend)
+        _set_matrix_rows(int_mtx, np.array(retrace_rows), new_rows)
+    return int_mtx
+
+
+def cull_context_geometry(
+        context_geometry, points, vectors, normals=None, max_distance=None):
+    """Remove the context geometry that cannot block any rays from points along vectors.
+
+    The test is conservative such that geometry is only removed when it is
+    impossible for it to block a ray. The bounding box of each geometry is
+    expanded by the bounding box around the points (a Minkowski difference), which
+    turns the question of whether any ray from any point hits the geometry box
+    into whether a ray from the origin hits the expanded box. Geometry is then
+    removed if none of the vectors hit its expanded box within the max_distance.
+
+    Args:
+        context_geometry: A list of ladybug geometry Face3D and/or Mesh3D.
+        points: A list of ladybug geometry Point3D for the origins of the rays.
+        vectors: A list of ladybug geometry Vector3D for the directions of the rays.
+        normals: An optional list of ladybug geometry Vector3D that matches the
+            length of the points list. If provided, vectors that are behind all
+            of the normals will not be used to test the geometry. (Default: None).
+        max_distance: An optional number for the maximum length of the rays. If
+            None, the rays are assumed to be infinitely long. (Default: None).
+
+    Returns:
+        A tuple with two values.
+
+        -   kept_geometry -- A list of the Face3D and Mesh3D in the context_geometry
+                that can block at least one of the rays.
+
+        -   removed_count -- An integer for the number of geometries that were
+                removed from the context_geometry.
+    """
+    context_geometry = list(context_geometry)
+    if np is None or len(context_geometry) == 0 or len(points) == 0:
+        return context_geometry, 0
+    pts = np.array([pt.to_array() for pt in points], dtype=np.float64).reshape(-1, 3)
+    vecs = np.array([v.to_array() for v in vectors], dtype=np.float64).reshape(-1, 3)
+    if normals is not None and len(vecs) != 0:
+        vecs = vecs[_front_facing_columns(normals, vectors)]
+    if len(vecs) == 0:  # no ray can be cast
+        return [], len(context_geometry)
+    vecs = vecs / np.linalg.norm(vecs, axis=1)[:, None]
+    dist = np.inf if max_distance is None else float(max_distance)
+
+    # expand the box of each geometry by the box around the points
+    boxes = _geometry_boxes(context_geometry)
+    rel_min = np.array([b[0] for b in boxes]) - pts.max(axis=0)
+    rel_max = np.array([b[1] for b in boxes]) - pts.min(axis=0)
+
+    # remove geometry outside the range of coordinates that the rays can reach
+    with np.errstate(invalid='ignore'):
+        reach_max = np.where(vecs.max(axis=0) > 0, vecs.max(axis=0) * dist, 0)
+        reach_min = np.where(vecs.min(axis=0) < 0, vecs.min(axis=0) * dist, 0)
+    keep = np.all((rel_min <= reach_max) & (rel_max >= reach_min), axis=1)
+    closest = np.maximum(rel_min, np.minimum(rel_max, 0))  # closest point to origin
+    keep &= np.linalg.norm(closest, axis=1) <= dist
+
+    # remove geometry that is not hit by any of the rays within the max_distance
+    with np.errstate(divide='ignore'):
+        inv_dirs = 1.0 / vecs
+    geo_ids = np.nonzero(keep)[0]
+    box_count = max(RAY_BATCH // len(vecs), 1)
+    for st in range(0, len(geo_ids), box_count):
+        ids = geo_ids[st:st + box_count]
+        with np.errstate(invalid='ignore', over='ignore'):
+            t1 = rel_min[ids][:, None, :] * inv_dirs[None, :, :]
+            t2 = rel_max[ids][:, None, :] * inv_dirs[None, :, :]
+            # NaN results come from rays parallel to a box that start on its plane
+            t_near = np.nanmax(np.minimum(t1, t2), axis=2)
+            t_far = np.nanmin(np.maximum(t1, t2), axis=2)
+        hit = (t_far >= t_near) & (t_far >= 0) & (t_near <= dist)
+        keep[ids] = hit.any(axis=1)
+
+    kept_geometry = [geo for geo, k in zip(context_geometry, keep) if k]
+    return kept_geometry, len(context_geometry) - len(kept_geometry)
+
+
+def _radiance_intersection_matrix(
+        sim_folder, vectors, points, normals, context_geometry, offset_distance,
+        numericalize, use_radiance_mesh, octree_cache, stream, workers, matrix_format):
+    """Compute the intersection matrix by tracing rays with Radiance's rcontrib.
+
+    All files are written to the sim_folder and referenced with absolute paths
+    while the Radiance commands are run with their own working directory. So the
+    working directory of the current process is never changed and calls with
+    different sim_folders can safely run in parallel threads or processes.
+    Vectors that are behind or along the horizon of every sensor can never be
+    seen so they are left out of the octree (or the modifiers collected from a
+    cached octree) and their columns of the matrix are filled with zeros.
+
+    Args:
+        sim_folder: An absolute path to an existing folder where the simulation
+            files will be written.
+        vectors: A list of ladybug geometry Vector3D to be projected from the points.
+        points: A list of ladybug geometry Point3D for the sensors.
+        normals: A list of ladybug geometry Vector3D for the normals of the points.
+        context_geometry: A list of ladybug geometry Face3D and/or Mesh3D that
+            can block the vectors projected from the test points.
+        offset_distance: A number to offset the sensor points before the vectors
+            are cast through the context_geometry.
+        numericalize: A boolean to note whether the output matrix should contain
+            cosine values (True) or booleans (False).
+        use_radiance_mesh: A boolean to note whether input Mesh3D should be
+            translated to Radiance Meshes.
+        octree_cache: An optional path to a folder where the compiled octree is cached.
+        stream: A boolean to note whether the sensors and results are streamed
+            through the input and output of rcontrib.
+        workers: A positive integer for the number of parallel rcontrib processes.
+        matrix_format: Text for the format of the output matrix.
 
-    # get the environment variables and update the current working directory
+    Returns:
+        A list of lists if NumPy is not installed. Otherwise, a NumPy array,
+        PackedBoolMatrix or SparseMatrix according to the matrix_format.
+    """
+    # get the environment variables
     assert OCONV_EXE is not None, 'No Radiance installation was found.'
     g_env = os.environ.copy()
     if folders.env:
@@ -87,46 +567,367 @@ def intersection_matrix(
                 g_env['PATH'] = os.pathsep.join((v, g_env['PATH']))
             if k.strip().upper() == 'RAYPATH':
                 g_env['RAYPATH'] = os.pathsep.join((v, sim_folder))
-    cur_dir = os.getcwd()
-    os.chdir(sim_folder)
 
-    # write the geometry to .rad files
-    geo_strs = [BLACK]
-    base_geo = 'black polygon {} 0 0 {} {}'
-    meshes_for_obj = []
-    for i, geo in enumerate(context_geometry):
-        if isinstance(geo, Face3D):
-            coords = tuple(str(v) for pt in geo.vertices for v in pt.to_array())
-            poly_id = 'poly_{}'.format(i)
-            geo_str = base_geo.format(poly_id, len(coords), ' '.join(coords))
-            geo_strs.append(geo_str)
-        elif isinstance(geo, Mesh3D):
-            meshes_for_obj.append(geo)
-    if len(meshes_for_obj) != 0:
-        if use_radiance_mesh:
-            transl_obj = OBJ.from_mesh3ds(meshes_for_obj)
-            transl_obj.material_structure = (('black', 0),)
-            obj_file = 'scene_mesh.obj'
-            transl_obj.to_file(sim_folder, obj_file)
-            scene_msh = 'scene_mesh.msh'
-            cmd = '"{}" -r {} "{}" > "{}"'.format(
-                OBJ2MESH_EXE, OCTREE_RES, obj_file, scene_msh)
-            cmd = cmd.replace('\\', '/')
-            process = subprocess.Popen(cmd, stderr=subprocess.PIPE, shell=True, env=g_env)
-            output = process.communicate()
-            if output[1]:
-                print(output[1])
-            geo_str = 'black mesh scene_mesh\n1 {}\n0\n0'.format(scene_msh)
-            geo_strs.append(geo_str)
+    # only trace the vectors that are in front of at least one sensor
+    columns, all_vectors = None, vectors
+    if np is not None:
+        columns = _front_facing_columns(normals, vectors)
+        if len(columns) == len(vectors):
+            columns = None
+        elif len(columns) == 0:  # no vector can be seen by any sensor
+            return _MatrixBuilder(
+                len(points), len(vectors), numericalize, matrix_format).matrix
+
+    # create the octree or get it from the cache
+    if octree_cache is None:
+        if columns is not None:  # leave the culled vectors out of the octree
+            vectors = [vectors[i] for i in columns]
+        scene_oct = _write_octree(
+            vectors, context_geometry, sim_folder, use_radiance_mesh, g_env)
+        vec_mod_file = os.path.join(sim_folder, 'vectors.mod')
+    else:
+        cache = FileCache(octree_cache, OCTREE_CACHE_SIZE)
+        oct_key = hash_values(
+            geometry_hash(context_geometry), tuple(tuple(v) for v in vectors),
+            OCTREE_RES, bool(use_radiance_mesh))
+        oct_folder = cache.get(oct_key)
+        if oct_folder is None:
+            staging = cache.stage()
+            _write_octree(vectors, context_geometry, staging, use_radiance_mesh, g_env)
+            oct_folder = cache.add(oct_key, staging)
+        scene_oct = os.path.join(oct_folder, 'scene.oct')
+        # any Radiance mesh of the octree is found relative to the cache entry
+        g_env['RAYPATH'] = os.pathsep.join((g_env.get('RAYPATH', '.'), oct_folder))
+        # the cached octree has all vectors so only the culled ones are collected
+        vec_mod_file = os.path.join(oct_folder, 'vectors.mod')
+        if columns is not None:
+            vectors = [vectors[i] for i in columns]
+            vec_mod_file = os.path.join(sim_folder, 'vectors_front.mod')
+            write_to_file_by_name(
+                sim_folder, 'vectors_front.mod',
+                '\n'.join('vec_light{}'.format(i) for i in columns))
+
+    # offset the sensor points
+    if offset_distance != 0:  # account for the offset distance
+        points = [pt.move(vec * offset_distance) for pt, vec in zip(points, normals)]
+
+    # use Radiance to perform conversions on text files as we're in IronPython
+    if np is None:
+        assert matrix_format == 'dense', \
+            'NumPy must be installed to use a {} matrix_format.'.format(matrix_format)
+        pts_file, output_mtx = _write_sensors(points, normals, sim_folder)
+        rc_options = RCONTRIB_PAR.format(len(points), 'af', vec_mod_file)
+        cmd = '"{}" {} "{}" < "{}"'.format(RCONTRIB_EXE, rc_options, scene_oct, pts_file)
+        cmd = '{} | rmtxop -fa - -c 14713 0 0 | getinfo -  > {}'.format(cmd, output_mtx)
+        cmd = cmd.replace('\\', '/')
+        process = subprocess.Popen(
+            cmd, stderr=subprocess.PIPE, shell=True, env=g_env,
+            cwd=os.path.dirname(scene_oct))
+        output = process.communicate()
+        if output[1]:
+            print(output[1])
+        int_mtx = []
+        with open(output_mtx, 'r') as rf:
+            if numericalize:
+                for row in rf:
+                    int_mtx.append([float(v) for v in row.split()])
+            else:
+                for row in rf:
+                    int_mtx.append([bool(float(v)) for v in row.split()])
+        return int_mtx
+
+    # split the sensors into chunks and trace them with parallel rcontrib processes
+    builder = _MatrixBuilder(
+        len(points), len(all_vectors), numericalize, matrix_format, columns)
+    chunk_size = max(min(int(math.ceil(len(points) / workers)), WORKER_SENSORS), 1)
+    chunks = [(st, min(st + chunk_size, len(points)))
+              for st in range(0, len(points), chunk_size)]
+
+    def _trace_chunk(chunk_i, st, end):
+        c_pts, c_nrms = points[st:end], normals[st:end]
+        if stream:
+            _stream_rcontrib(
+                scene_oct, vec_mod_file, c_pts, c_nrms, len(vectors), g_env,
+                builder, st)
         else:
-            for geo in meshes_for_obj:
-                for fi, f_geo in enumerate(geo.face_vertices):
-                    coords = tuple(str(v) for pt in f_geo for v in pt.to_array())
-                    poly_id = 'poly_{}_{}'.format(i, fi)
-                    geo_str = base_geo.format(poly_id, len(coords), ' '.join(coords))
-                    geo_strs.append(geo_str)
-    scene_file = 'geometry.rad'
-    write_to_file_by_name(sim_folder, scene_file, '\n'.join(geo_strs))
+            suffix = '' if len(chunks) == 1 else '_{}'.format(chunk_i)
+            _file_rcontrib(
+                scene_oct, vec_mod_file, c_pts, c_nrms, sim_folder, g_env,
+                builder, st, suffix)
+    run_in_threads(_trace_chunk, [(i,) + c for i, c in enumerate(chunks)], workers)
+
+    return builder.matrix
+
+
+def _matrix_key(vectors, points, normals, context_geometry, *options):
+    """Get the key of an intersection matrix in a matrix_cache.
+
+    Args:
+        vectors: A list of ladybug geometry Vector3D for the columns of the matrix.
+        points: A list of ladybug geometry Point3D for the sensors of the matrix.
+        normals: A list of ladybug geometry Vector3D for the normals of the sensors.
+        context_geometry: A list of ladybug geometry Face3D and/or Mesh3D.
+        *options: Any number of other values that affect the matrix.
+    """
+    if np is not None:
+        arrays = [np.array([v.to_array() for v in vals], dtype=np.float64)
+                  for vals in (vectors, points, normals)]
+    else:
+        arrays = [tuple(tuple(v) for v in vals) for vals in (vectors, points, normals)]
+    return hash_values(
+        MATRIX_CACHE_VERSION, geometry_hash(context_geometry), np is not None,
+        *(arrays + list(options)))
+
+
+def _cached_matrix(matrix_cache, key, function, *args):
+    """Get an intersection matrix from a matrix_cache or compute it and add it.
+
+    Args:
+        matrix_cache: Path to the folder of the cache.
+        key: Text for the key of the matrix in the cache, which is typically
+            the output of _matrix_key.
+        function: A function to compute the matrix if it is not in the cache.
+        *args: The arguments of the function.
+    """
+    cache = FileCache(matrix_cache, MATRIX_CACHE_SIZE)
+    entry = cache.get(key)
+    if entry is not None:
+        try:
+            return _read_matrix_file(os.path.join(entry, 'matrix.bin'))
+        except (IOError, OSError, ValueError):  # entry was evicted by another process
+            pass
+    int_mtx = function(*args)
+    staging = cache.stage()
+    header, arrays = matrix_to_arrays(int_mtx)
+    with open(os.path.join(staging, 'matrix.bin'), 'wb') as mtx_file:
+        mtx_file.write(to_container('IntersectionMatrix', header, arrays))
+    cache.add(key, staging)
+    return int_mtx
+
+
+def _read_matrix_file(file_path):
+    """Load an intersection matrix from a binary container file.
+
+    When NumPy is installed, the file is memory-mapped such that the matrix is
+    only read from disk as it is used. The mapping is copy-on-write so that
+    the matrix can be updated in memory without changing the file.
+    """
+    with open(file_path, 'rb') as mtx_file:
+        if np is None:
+            data = mtx_file.read()
+        else:
+            data = mmap.mmap(mtx_file.fileno(), 0, access=mmap.ACCESS_COPY)
+    return matrix_from_arrays(*from_container(data, 'IntersectionMatrix'))
+
+
+def sky_vectors(sky_matrix):
+    """Get the vectors of the sky and ground patches of a sky matrix.
+
+    Args:
+        sky_matrix: A SkyMatrix object, which provides the density of the
+            patches and the north direction.
+
+    Returns:
+        A tuple of ladybug geometry Vector3D with the vectors of the sky patches
+        followed by the vectors of the ground patches.
+    """
+    return _patch_vectors(sky_matrix.high_density, sky_matrix.north)
+
+
+def _patch_vectors(high_density, north):
+    """Get the vectors of the sky and ground patches for a density and north angle."""
+    lb_vecs = view_sphere.reinhart_dome_vectors if high_density \
+        else view_sphere.tregenza_dome_vectors
+    if north != 0:
+        north_angle = math.radians(north)
+        lb_vecs = tuple(vec.rotate_xy(north_angle) for vec in lb_vecs)
+    lb_grnd_vecs = tuple(vec.reverse() for vec in lb_vecs)
+    return lb_vecs + lb_grnd_vecs
+
+
+def cluster_vectors(vectors, angular_tolerance=0):
+    """Group vectors with nearly the same direction into clusters.
+
+    The unit sphere is divided into a grid of cubes, which are small enough that
+    all vectors in the same cube lie within the angular_tolerance of one another.
+    Each cluster is represented by the average direction of its vectors such that
+    only one vector per cluster needs to be traced.
+
+    Args:
+        vectors: A list of ladybug geometry Vector3D to be clustered.
+        angular_tolerance: A number for the maximum angle in degrees between the
+            vectors of the same cluster. If 0, only vectors with exactly the same
+            direction are clustered. (Default: 0).
+
+    Returns:
+        A tuple with three values.
+
+        -   cluster_vectors -- A tuple of ladybug geometry Vector3D with one unit
+                vector for the average direction of each cluster.
+
+        -   cluster_ids -- A list of integers with one value for each of the input
+                vectors, which notes the index of the cluster it belongs to.
+
+        -   max_error -- A number for the maximum angle in degrees between any
+                input vector and the vector of its cluster.
+    """
+    assert angular_tolerance >= 0, 'Vector angular_tolerance must be greater ' \
+        'than or equal to 0. Got {}.'.format(angular_tolerance)
+    # the size of the grid cubes so that their diagonal spans the tolerance
+    cell = 2 * math.sin(math.radians(angular_tolerance) / 2) / math.sqrt(3)
+    if np is None:  # group the vectors in a dictionary
+        cl_ids, cl_sums, cluster_ids = {}, [], []
+        for vec in vectors:
+            vec = vec.normalize()
+            key = tuple(math.floor(v / cell) for v in vec) if cell != 0 else tuple(vec)
+            if key not in cl_ids:
+                cl_ids[key] = len(cl_sums)
+                cl_sums.append(Vector3D(0, 0, 0))
+            cluster_ids.append(cl_ids[key])
+            cl_sums[cl_ids[key]] = cl_sums[cl_ids[key]] + vec
+        cl_vecs = tuple(v.normalize() for v in cl_sums)
+        max_error = 0
+        for vec, c_id in zip(vectors, cluster_ids):
+            max_error = max(max_error, math.degrees(vec.angle(cl_vecs[c_id])))
+        return cl_vecs, cluster_ids, max_error
+
+    # group the vectors with numpy
+    vecs = np.array([v.to_array() for v in vectors], dtype=np.float64).reshape(-1, 3)
+    vecs = vecs / np.linalg.norm(vecs, axis=1)[:, None]
+    keys = np.floor(vecs / cell).astype(np.int64) if cell != 0 else vecs
+    _, first, cluster_ids = np.unique(
+        keys, axis=0, return_index=True, return_inverse=True)
+    cluster_ids = cluster_ids.ravel()
+    # number the clusters in the order that they first appear in the vectors
+    order = np.argsort(first, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    cluster_ids = rank[cluster_ids]
+    cl_sums = np.zeros((len(order), 3), dtype=np.float64)
+    np.add.at(cl_sums, cluster_ids, vecs)
+    cl_vecs = cl_sums / np.linalg.norm(cl_sums, axis=1)[:, None]
+    cos_err = np.einsum('ij,ij->i', vecs, cl_vecs[cluster_ids])
+    max_error = float(np.degrees(np.arccos(np.clip(cos_err, -1, 1))).max()) \
+        if len(vecs) != 0 else 0
+    return tuple(Vector3D(*v) for v in cl_vecs), cluster_ids.tolist(), max_error
+
+
+def _hierarchical_intersection_matrix(
+        coarse_vectors, vectors, points, normals, context_geometry,
+        offset_distance, numericalize, sim_folder, use_radiance_mesh, backend,
+        octree_cache, stream, workers, matrix_format, max_distance):
+    """Compute an intersection matrix by refining the visibility of coarser vectors.
+
+    The coarse_vectors are traced for all of the sensors and each of the vectors
+    takes the visibility of the coarse vectors within REFINE_ANGLE of it that are
+    in front of the sensor. Only the pairs of sensors and vectors where these
+    coarse vectors have mixed visibility (or where there are none) are traced.
+    The result is approximate since geometry that lies entirely between the coarse
+    vectors around a vector can be missed. The numpy backend traces only the
+    mixed pairs. rcontrib always traces all of its vectors for each sensor, so
+    the radiance backend traces the submatrix of every sensor and vector with
+    any mixed pair, which saves little over tracing the full matrix.
+    The arguments are the same as those of intersection_matrix with the addition
+    of the coarse_vectors.
+    """
+    # trace the coarse vectors for all of the sensors
+    coarse_mtx = intersection_matrix(
+        coarse_vectors, points, normals, context_geometry, offset_distance, False,
+        sim_folder, use_radiance_mesh, backend, octree_cache, stream, workers,
+        'dense', max_distance)
+    pts = np.array([pt.to_array() for pt in points], dtype=np.float64).reshape(-1, 3)
+    nrms = np.array([v.to_array() for v in normals], dtype=np.float64).reshape(-1, 3)
+    vecs = np.array([v.to_array() for v in vectors], dtype=np.float64).reshape(-1, 3)
+    c_vecs = np.array([v.to_array() for v in coarse_vectors], dtype=np.float64)
+    if offset_distance != 0:  # account for the offset distance
+        pts = pts + nrms * offset_distance
+    vecs = vecs / np.linalg.norm(vecs, axis=1)[:, None]
+    c_vecs = c_vecs / np.linalg.norm(c_vecs, axis=1)[:, None]
+
+    # get the coarse vectors around each vector, padded with the nearest one
+    c_cos = np.dot(vecs, c_vecs.T)
+    order = np.argsort(-c_cos, axis=1, kind='stable')
+    near = np.take_along_axis(c_cos, order, axis=1) >= \
+        math.cos(math.radians(REFINE_ANGLE))
+    nbr_count = max(int(near.sum(axis=1).max()), 1)
+    nbrs = np.where(near[:, :nbr_count], order[:, :nbr_count], order[:, :1])
+
+    # find the pairs of sensors and vectors with mixed visibility around them
+    pair_rows, pair_cols = [], []
+    row_count = max(RAY_BATCH // (len(vecs) * nbr_count), 1)
+    for st in range(0, len(pts), row_count):
+        c_nrms = nrms[st:st + row_count]
+        # coarse vectors behind the sensor are not seen but tell nothing about
+        # the context geometry so only those in front of the sensor are compared
+        c_front = (np.dot(c_nrms, c_vecs.T) > FTINY)[:, nbrs]
+        c_vis = coarse_mtx[st:st + row_count][:, nbrs]
+        any_seen = (c_vis & c_front).any(axis=2)
+        any_blocked = (~c_vis & c_front).any(axis=2)
+        front = np.dot(c_nrms, vecs.T) > FTINY
+        mixed = front & (any_seen == any_blocked)
+        rows, cols = np.nonzero(mixed)
+        pair_rows.append(rows + st)
+        pair_cols.append(cols)
+    pair_rows = np.concatenate(pair_rows) if pair_rows else np.zeros(0, np.int64)
+    pair_cols = np.concatenate(pair_cols) if pair_cols else np.zeros(0, np.int64)
+
+    # trace the mixed pairs of sensors and vectors
+    if len(pair_rows) == 0:
+        pair_seen = np.zeros(0, dtype=bool)
+    elif backend == 'numpy':
+        if max_distance is not None:
+            ray_pts = points if offset_distance == 0 else \
+                [pt.move(vec * offset_distance) for pt, vec in zip(points, normals)]
+            context_geometry, _ = cull_context_geometry(
+                context_geometry, ray_pts, vectors, normals, max_distance)
+        bvh = BVH.from_geometry(context_geometry)
+        pair_seen = np.concatenate([
+            ~bvh.occluded(pts[pair_rows[st:st + RAY_BATCH]],
+                          vecs[pair_cols[st:st + RAY_BATCH]])
+            for st in range(0, len(pair_rows), RAY_BATCH)])
+    else:  # trace the vectors and sensors that have any mixed pairs
+        rows, cols = np.unique(pair_rows), np.unique(pair_cols)
+        sub_mtx = intersection_matrix(
+            [vectors[i] for i in cols], [points[i] for i in rows],
+            [normals[i] for i in rows], context_geometry, offset_distance, False,
+            sim_folder, use_radiance_mesh, backend, octree_cache, stream, workers,
+            'dense', max_distance)
+        pair_seen = sub_mtx[
+            np.searchsorted(rows, pair_rows), np.searchsorted(cols, pair_cols)]
+
+    # assemble the matrix from the coarse visibility and the traced pairs
+    builder = _MatrixBuilder(len(points), len(vectors), numericalize, matrix_format)
+    row_count = max(RAY_BATCH // max(len(vecs), 1), 1)
+    for st in range(0, len(pts), row_count):
+        cos_mtx = np.dot(nrms[st:st + row_count], vecs.T)
+        c_front = (np.dot(nrms[st:st + row_count], c_vecs.T) > FTINY)[:, nbrs]
+        seen = (coarse_mtx[st:st + row_count][:, nbrs] & c_front).any(axis=2)
+        p_st, p_end = np.searchsorted(pair_rows, [st, st + row_count])
+        seen[pair_rows[p_st:p_end] - st, pair_cols[p_st:p_end]] = pair_seen[p_st:p_end]
+        seen &= cos_mtx > FTINY
+        builder.add_rows(st, np.where(seen, cos_mtx, 0) if numericalize else seen)
+    return builder.matrix
+
+
+def _write_octree(vectors, context_geometry, folder, use_radiance_mesh, env):
+    """Write the context geometry and vectors to .rad files and compile them to an octree.
+
+    The modifiers of the vectors are also written to a vectors.mod file next to
+    the octree, which can be used to collect the contribution of each vector.
+
+    Args:
+        vectors: A list of ladybug geometry Vector3D to be written as light sources.
+        context_geometry: A list of ladybug geometry Face3D and/or Mesh3D.
+        folder: Path to the folder where the files will be written.
+        use_radiance_mesh: A boolean to note whether input Mesh3D should be
+            translated to Radiance Meshes.
+        env: A dictionary of environment variables for the Radiance commands.
+
+    Returns:
+        The path to the compiled scene.oct file.
+    """
+    # write the geometry to a .rad file
+    scene_file = _write_geometry(context_geometry, folder, use_radiance_mesh, env)
 
     # write the vectors to a file
     vec_mod = 'void light {} 0 0 3 1.0 1.0 1.0'
@@ -141,122 +942,518 @@ def intersection_matrix(
         vec_str = base_vec.format(mod_id, source_id, dir_coords)
         vec_strs.append(vec_str)
     vec_file, vec_mod_file = 'vectors.rad', 'vectors.mod'
-    write_to_file_by_name(sim_folder, vec_file, '\n'.join(vec_strs))
-    write_to_file_by_name(sim_folder, vec_mod_file, '\n'.join(vec_mods))
-
-    # create the .pts file
-    if offset_distance != 0:  # account for the offset distance
-        points = [pt.move(vec * offset_distance) for pt, vec in zip(points, normals)]
-    sensors = []
-    for pt, vec in zip(points, normals):
-        sen_str = '%s %s' % (' '.join(str(v) for v in pt), ' '.join(str(v) for v in vec))
-        sensors.append(sen_str)
-    pts_file = 'sensors.pts'
-    write_to_file_by_name(sim_folder, pts_file, '\n'.join(sensors))
+    write_to_file_by_name(folder, vec_file, '\n'.join(vec_strs))
+    write_to_file_by_name(folder, vec_mod_file, '\n'.join(vec_mods))
 
     # create the octree
     scene_oct = 'scene.oct'
     cmd = '"{}" -r {} "{}" "{}" > "{}"'.format(
         OCONV_EXE, OCTREE_RES, vec_file, scene_file, scene_oct)
     cmd = cmd.replace('\\', '/')
-    process = subprocess.Popen(cmd, stderr=subprocess.PIPE, shell=True, env=g_env)
+    process = subprocess.Popen(
+        cmd, stderr=subprocess.PIPE, shell=True, env=env, cwd=folder)
     output = process.communicate()
     if output[1]:
         print(output[1])
+    return os.path.join(folder, scene_oct)
 
-    # run the ray tracing command
-    output_mtx = 'results.mtx'
-    rad_par = '-V- -aa 0.0 -y {} -I -faf -ab 0 -dc 1.0 -dt 0.0 -dj 0.0 -dr 0 -M "{}"'
-    rc_options = rad_par.format(
-        len(points), os.path.join(os.path.abspath(sim_folder), vec_mod_file))
-    if np is None:  # use Radiance to perform conversions on text files
-        cmd = '"{}" {} "{}" < "{}"'.format(RCONTRIB_EXE, rc_options, scene_oct, pts_file)
-        cmd = '{} | rmtxop -fa - -c 14713 0 0 | getinfo -  > {}'.format(cmd, output_mtx)
-    else:  # leave files as binary so they can be processed with numpy
-        cmd = '"{}" {} "{}" < "{}" > "{}"'.format(
-            RCONTRIB_EXE, rc_options, scene_oct, pts_file, output_mtx)
+
+def _write_geometry(context_geometry, folder, use_radiance_mesh, env):
+    """Write context geometry to a geometry.rad file in large buffered chunks.
+
+    The coordinates of Mesh3D faces are formatted as text for whole arrays of
+    vertices at once with NumPy and each vertex is only formatted once no matter
+    how many faces it belongs to. The file is written in chunks of GEO_CHUNK
+    polygons such that the text of the full scene is never held in memory.
+
+    Args:
+        context_geometry: A list of ladybug geometry Face3D and/or Mesh3D.
+        folder: Path to the folder where the file will be written.
+        use_radiance_mesh: A boolean to note whether input Mesh3D should be
+            translated to Radiance Meshes.
+        env: A dictionary of environment variables for the Radiance commands.
+
+    Returns:
+        The name of the geometry.rad file within the folder.
+    """
+    scene_file = 'geometry.rad'
+    base_geo = 'black polygon {} 0 0 {} {}'
+    with open(os.path.join(folder, scene_file), 'w') as outf:
+        outf.write(BLACK)
+
+        def _write_lines(lines):
+            if len(lines) != 0:
+                outf.write('\n')
+                outf.write('\n'.join(lines))
+
+        # write the Face3D as polygons
+        geo_strs, meshes_for_obj = [], []
+        for i, geo in enumerate(context_geometry):
+            if isinstance(geo, Face3D):
+                coords = tuple(str(v) for pt in geo.vertices for v in pt.to_array())
+                poly_id = 'poly_{}'.format(i)
+                geo_strs.append(base_geo.format(poly_id, len(coords), ' '.join(coords)))
+                if len(geo_strs) == GEO_CHUNK:
+                    _write_lines(geo_strs)
+                    geo_strs = []
+            elif isinstance(geo, Mesh3D):
+                meshes_for_obj.append(geo)
+        _write_lines(geo_strs)
+        if len(meshes_for_obj) == 0:
+            return scene_file
+
+        # write the Mesh3D as a Radiance mesh
+        if use_radiance_mesh:
+            transl_obj = OBJ.from_mesh3ds(meshes_for_obj)
+            transl_obj.material_structure = (('black', 0),)
+            obj_file = 'scene_mesh.obj'
+            transl_obj.to_file(folder, obj_file)
+            scene_msh = 'scene_mesh.msh'
+            cmd = '"{}" -r {} "{}" > "{}"'.format(
+                OBJ2MESH_EXE, OCTREE_RES, obj_file, scene_msh)
+            cmd = cmd.replace('\\', '/')
+            process = subprocess.Popen(
+                cmd, stderr=subprocess.PIPE, shell=True, env=env, cwd=folder)
+            output = process.communicate()
+            if output[1]:
+                print(output[1])
+            _write_lines(['black mesh scene_mesh\n1 {}\n0\n0'.format(scene_msh)])
+            return scene_file
+
+        # write the faces of the Mesh3D as polygons
+        for geo in meshes_for_obj:
+            if np is None:  # format the coordinates of each face one by one
+                for st in range(0, len(geo.faces), GEO_CHUNK):
+                    geo_strs = []
+                    for fi, f_geo in enumerate(geo.face_vertices[st:st + GEO_CHUNK]):
+                        coords = tuple(str(v) for pt in f_geo for v in pt.to_array())
+                        poly_id = 'poly_{}_{}'.format(i, fi + st)
+                        geo_strs.append(
+                            base_geo.format(poly_id, len(coords), ' '.join(coords)))
+                    _write_lines(geo_strs)
+                continue
+            vert_strs = _vertex_strings(geo.vertices)
+            for st in range(0, len(geo.faces), GEO_CHUNK):
+                _write_lines(_face_polygons(
+                    geo.faces[st:st + GEO_CHUNK], vert_strs, 'poly_{}_'.format(i), st))
+    return scene_file
+
+
+def _vertex_strings(vertices):
+    """Get a NumPy array of the Radiance coordinate strings of a list of Point3D.
+
+    Args:
+        vertices: A list of ladybug geometry Point3D.
+
+    Returns:
+        A NumPy array of objects with one string of 3 coordinates for each vertex.
+    """
+    verts = np.array([pt.to_array() for pt in vertices], dtype=np.float64)
+    coords = verts.reshape(-1, 3).astype(str).astype(object)
+    return coords[:, 0] + ' ' + coords[:, 1] + ' ' + coords[:, 2]
+
+
+def _face_polygons(faces, vert_strs, id_prefix, start=0):
+    """Get a list of Radiance polygon strings for the faces of a Mesh3D.
+
+    The strings of the triangles and quads are joined for all faces at once.
+
+    Args:
+        faces: A list of tuples with 3 or 4 integers for the vertices of each face.
+        vert_strs: A NumPy array of coordinate strings for each vertex of the mesh,
+            as output from _vertex_strings.
+        id_prefix: Text to be placed before the index of each face in the
+            identifier of its polygon.
+        start: Integer for the index of the first face within the mesh. (Default: 0).
+
+    Returns:
+        A list of Radiance polygon strings in the order of the faces.
+    """
+    face_ids = np.arange(start, start + len(faces)).astype(str).astype(object)
+    face_strs = np.empty(len(faces), dtype=object)
+    for v_count in (3, 4):
+        face_i = [j for j, f in enumerate(faces) if len(f) == v_count]
+        if len(face_i) == 0:
+            continue
+        f_verts = vert_strs[np.array([faces[j] for j in face_i], dtype=np.int64)]
+        f_strs = 'black polygon ' + id_prefix + face_ids[face_i] + \
+            ' 0 0 {} '.format(v_count * 3) + f_verts[:, 0]
+        for k in range(1, v_count):
+            f_strs = f_strs + ' ' + f_verts[:, k]
+        face_strs[face_i] = f_strs
+    return face_strs.tolist()
+
+
+def _write_sensors(points, normals, folder, suffix=''):
+    """Write sensors to a .pts file and get the paths to it and the output matrix.
+
+    Args:
+        points: A list of ladybug geometry Point3D for the sensors.
+        normals: A list of ladybug geometry Vector3D for the sensor normals.
+        folder: Path to the folder where the files are written.
+        suffix: Optional text to be appended to the file names. (Default: '').
+
+    Returns:
+        A tuple with the path to the .pts file and the path to the .mtx file
+        where the results should be written.
+    """
+    sensors = []
+    for pt, vec in zip(points, normals):
+        sen_str = '%s %s' % (' '.join(str(v) for v in pt), ' '.join(str(v) for v in vec))
+        sensors.append(sen_str)
+    pts_file = 'sensors{}.pts'.format(suffix)
+    write_to_file_by_name(folder, pts_file, '\n'.join(sensors))
+    output_mtx = 'results{}.mtx'.format(suffix)
+    return os.path.join(folder, pts_file), os.path.join(folder, output_mtx)
+
+
+def _file_rcontrib(
+        scene_oct, vec_mod_file, points, normals, folder, env, builder, start=0,
+        suffix=''):
+    """Run rcontrib with the sensors read from a .pts file and results written to .mtx.
+
+    The results file is memory-mapped and added to the builder one block of rows
+    at a time such that the full matrix of RGB values is never held in memory.
+
+    Args:
+        scene_oct: Path to the octree of the scene.
+        vec_mod_file: Path to the file with the modifiers of the vectors.
+        points: A list of ladybug geometry Point3D for the sensors.
+        normals: A list of ladybug geometry Vector3D for the sensor normals.
+        folder: Path to the folder where the files are written.
+        env: A dictionary of environment variables for the Radiance command.
+        builder: A _MatrixBuilder to which the rows of the results are added.
+        start: Integer for the index of the builder row where the results of
+            the first point are added. (Default: 0).
+        suffix: Optional text to be appended to the file names. (Default: '').
+    """
+    pts_file, output_mtx = _write_sensors(points, normals, folder, suffix)
+    rc_options = RCONTRIB_PAR.format(len(points), 'af', vec_mod_file)
+    cmd = '"{}" {} "{}" < "{}" > "{}"'.format(
+        RCONTRIB_EXE, rc_options, scene_oct, pts_file, output_mtx)
     cmd = cmd.replace('\\', '/')
-    process = subprocess.Popen(cmd, stderr=subprocess.PIPE, shell=True, env=g_env)
+    process = subprocess.Popen(
+        cmd, stderr=subprocess.PIPE, shell=True, env=env,
+        cwd=os.path.dirname(scene_oct))
     output = process.communicate()
     if output[1]:
         print(output[1])
+    rgb_mtx = binary_to_array(output_mtx, memory_map=True)
+    row_count = max(STREAM_CHUNK * len(rgb_mtx) // max(rgb_mtx.nbytes, 1), 1)
+    for st in range(0, len(rgb_mtx), row_count):
+        builder.add_rows(start + st, np.dot(rgb_mtx[st:st + row_count], RGB_CONVERSION))
+    del rgb_mtx  # release the memory map so that the file can be overwritten
 
-    # put back the current working directory and load the intersection matrix
-    os.chdir(cur_dir)
-    if np is None:  # use text parsing methods as we're in IronPython
-        int_mtx = []
-        with open(os.path.join(sim_folder, output_mtx), 'r') as rf:
-            if numericalize:
-                for row in rf:
-                    int_mtx.append([float(v) for v in row.split()])
-            else:
-                for row in rf:
-                    int_mtx.append([bool(float(v)) for v in row.split()])
-    else:  # we are in cPython and we should use more efficient numpy methods
-        int_mtx = binary_to_array(os.path.join(sim_folder, output_mtx))
-        conversion = np.array([14713, 0, 0])
-        int_mtx = np.dot(int_mtx, conversion)
-        if not numericalize:
-            int_mtx = int_mtx.astype(dtype=bool)
 
-    return int_mtx
+def _stream_rcontrib(
+        scene_oct, vec_mod_file, points, normals, vector_count, env, builder, start=0):
+    """Run rcontrib with sensors written to its stdin and results read from its stdout.
 
+    The results are added to the builder one block of rows at a time as they are
+    read such that the full matrix of numbers is never held in memory.
 
-def sky_intersection_matrix(
-        sky_matrix, points, normals, context_geometry,
-        offset_distance=0, numericalize=False, sim_folder=None, use_radiance_mesh=False
-    ):
-    """Compute the intersection matrix between a sky matrix through points.
+    Args:
+        scene_oct: Path to the octree of the scene.
+        vec_mod_file: Path to the file with the modifiers of the vectors.
+        points: A list of ladybug geometry Point3D for the sensors.
+        normals: A list of ladybug geometry Vector3D for the sensor normals.
+        vector_count: Integer for the number of vectors in the octree.
+        env: A dictionary of environment variables for the Radiance command.
+        builder: A _MatrixBuilder to which the rows of the results are added.
+        start: Integer for the index of the builder row where the results of
+            the first point are added. (Default: 0).
+    """
+    # serialize the sensors as double-precision records that rcontrib can read
+    sensors = np.array(
+        [tuple(pt) + tuple(vec) for pt, vec in zip(points, normals)], dtype=np.float64)
+    rc_options = RCONTRIB_PAR.format(len(sensors), 'df', vec_mod_file)
+    cmds = [RCONTRIB_EXE] + shlex.split(rc_options.replace('\\', '/')) + \
+        ['-h-', scene_oct]
+    process = subprocess.Popen(
+        cmds, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        env=env, cwd=os.path.dirname(scene_oct))
+
+    # write the sensors and collect the errors in threads to avoid full pipes
+    def _write_sensors():
+        try:
+            process.stdin.write(sensors.tobytes())
+        finally:
+            process.stdin.close()
+    errors = []
+    threads = [
+        threading.Thread(target=_write_sensors),
+        threading.Thread(target=lambda: errors.append(process.stderr.read()))
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    # read the float RGB values into a buffer one block of rows at a time
+    row_count = max(STREAM_CHUNK // max(vector_count * 12, 1), 1)
+    buffer = np.empty((row_count, vector_count, 3), dtype=np.float32)
+    read_rows = 0
+    for st in range(0, len(sensors), row_count):
+        rows = buffer[:min(row_count, len(sensors) - st)]
+        view, read_count = memoryview(rows.reshape(-1).view(np.uint8)), 0
+        while read_count < len(view):
+            count = process.stdout.readinto(view[read_count:])
+            if not count:
+                break
+            read_count += count
+        if read_count < len(view):
+            break
+        builder.add_rows(start + st, np.dot(rows, RGB_CONVERSION))
+        read_rows += len(rows)
+    process.wait()
+    for thread in threads:
+        thread.join()
+    if errors and errors[0]:
+        print(errors[0])
+    assert process.returncode == 0, 'rcontrib failed with code {}.'.format(
+        process.returncode)
+    # a short output would otherwise leave the rows of the last sensors empty
+    stderr = errors[0].decode('utf-8', 'replace') if errors and errors[0] else ''
+    assert read_rows == len(sensors), 'rcontrib only output the results of {} of ' \
+        '{} sensors.\n{}'.format(read_rows, len(sensors), stderr)
+
+
+class _MatrixBuilder(object):
+    """Assemble an intersection matrix in a given format from blocks of rows.
 
     Args:
-        sky_matrix: A SkyMatrix object, which provides the vectors to be projected
-            from the points through the context_geometry.
-        points: A list of ladybug geometry Point3D representing the sensors
-            to be studied.
-        normals: A list of ladybug geometry Vector3D that matches the length of
-            the points list and indicate the normal direction of each point.
-        context_geometry: A list of ladybug geometry Face3D that can block the
-            vectors projected from the test points.
+        row_count: Integer for the number of rows of the matrix.
+        column_count: Integer for the number of columns of the matrix.
+        numericalize: Boolean to note whether the values of the matrix are
+            numbers (True) or booleans (False).
+        matrix_format: Text for the format of the matrix. Choose from dense,
+            packed, sparse and auto.
+        columns: An optional array of integers for the columns of the matrix
+            that are included in the blocks of rows. All other columns will be
+            filled with zeros. If None, the blocks include all of the
+            columns. (Default: None).
+    """
+    __slots__ = ('_column_count', '_numericalize', '_matrix_format', '_columns',
+                 '_values', '_lock')
+
+    def __init__(self, row_count, column_count, numericalize, matrix_format,
+                 columns=None):
+        self._column_count = column_count
+        self._numericalize = numericalize
+        self._matrix_format = matrix_format
+        self._columns = columns
+        self._lock = threading.Lock()
+        if matrix_format == 'packed':
+            self._values = np.zeros(
+                (row_count, (column_count + 7) // 8), dtype=np.uint8)
+        elif matrix_format == 'sparse':  # blocks are stacked once they are all added
+            self._values = {}
+        else:
+            d_type = np.float64 if numericalize else bool
+            self._values = np.zeros((row_count, column_count), dtype=d_type)
+
+    def add_rows(self, start, rows):
+        """Add a block of rows to the matrix.
+
+        Args:
+            start: Integer for the index of the first row of the block.
+            rows: A NumPy array of numbers for the rows, where any value greater
+                than zero is considered seen.
+        """
+        if self._columns is not None:  # fill the skipped columns with zeros
+            all_rows = np.zeros((len(rows), self._column_count), dtype=rows.dtype)
+            all_rows[:, self._columns] = rows
+            rows = all_rows
+        if self._matrix_format == 'packed':
+            rows = np.packbits(rows > 0, axis=1)
+        elif not self._numericalize:
+            rows = rows > 0
+        if self._matrix_format == 'sparse':
+            block = SparseMatrix.from_array(rows)
+            with self._lock:
+                self._values[start] = block
+        else:
+            self._values[start:start + len(rows)] = rows
+
+    @property
+    def matrix(self):
+        """Get the assembled intersection matrix."""
+        if self._matrix_format == 'packed':
+            return PackedBoolMatrix(self._values, self._column_count)
+        if self._matrix_format == 'sparse':
+            if len(self._values) == 0:
+                d_type = np.float64 if self._numericalize else bool
+                return SparseMatrix.from_array(np.zeros((0, self._column_count), d_type))
+            return SparseMatrix.from_row_blocks(
+                [self._values[st] for st in sorted(self._values)])
+        if self._matrix_format == 'auto':
+            size = self._values.size
+            if size != 0 and np.count_nonzero(self._values) / size <= SPARSE_DENSITY:
+                return SparseMatrix.from_array(self._values)
+        return self._values
+
+
+def _front_facing_columns(normals, vectors):
+    """Get the indices of the vectors with a positive cosine to at least one normal.
+
+    Vectors that lie behind or along the horizon of every sensor can never be
+    seen and do not need to be traced.
+
+    Args:
+        normals: A list of ladybug geometry Vector3D for the sensor normals.
+        vectors: A list of ladybug geometry Vector3D to be projected from the sensors.
+
+    Returns:
+        A NumPy array of integers for the indices of the front-facing vectors.
+    """
+    nrms = np.array([v.to_array() for v in normals], dtype=np.float64).reshape(-1, 3)
+    vecs = np.array([v.to_array() for v in vectors], dtype=np.float64).reshape(-1, 3)
+    seen = np.zeros(len(vecs), dtype=bool)
+    row_count = max(RAY_BATCH // max(len(vecs), 1), 1)
+    for st in range(0, len(nrms), row_count):
+        seen |= (np.dot(nrms[st:st + row_count], vecs.T) > FTINY).any(axis=0)
+    return np.nonzero(seen)[0]
+
+
+def _geometry_difference(old_geometry, new_geometry):
+    """Get the geometry that was added and removed between two lists of geometry.
+
+    Args:
+        old_geometry: A list of ladybug geometry Face3D and/or Mesh3D.
+        new_geometry: A list of ladybug geometry Face3D and/or Mesh3D.
+
+    Returns:
+        A tuple with two lists. The first contains the geometry of new_geometry
+        that is not in old_geometry and the second contains the geometry of
+        old_geometry that is not in new_geometry.
+    """
+    old_keys = [geometry_hash([geo]) for geo in old_geometry]
+    new_keys = [geometry_hash([geo]) for geo in new_geometry]
+    old_counts, new_counts = {}, {}
+    for key in old_keys:
+        old_counts[key] = old_counts.get(key, 0) + 1
+    for key in new_keys:
+        new_counts[key] = new_counts.get(key, 0) + 1
+
+    def _extra(geometry, keys, counts, other_counts):
+        extra, seen = [], {}
+        for geo, key in zip(geometry, keys):
+            seen[key] = seen.get(key, 0) + 1
+            if seen[key] > other_counts.get(key, 0):
+                extra.append(geo)
+        return extra
+    added = _extra(new_geometry, new_keys, new_counts, old_counts)
+    removed = _extra(old_geometry, old_keys, old_counts, new_counts)
+    return added, removed
+
+
+def _geometry_boxes(geometry):
+    """Get a list of padded bounding boxes for a list of Face3D and/or Mesh3D.
+
+    Args:
+        geometry: A list of ladybug geometry Face3D and/or Mesh3D.
+
+    Returns:
+        A list of tuples with two NumPy arrays for the minimum and maximum
+        corner of the box around each geometry.
+    """
+    boxes = []
+    for geo in geometry:
+        b_min, b_max = np.array(geo.min.to_array()), np.array(geo.max.to_array())
+        tol = BVH.RAY_EPSILON * max(np.abs(np.concatenate([b_min, b_max])).max(), 1)
+        boxes.append((b_min - tol, b_max + tol))
+    return boxes
+
+
+def _rays_hit_boxes(origins, directions, boxes):
+    """Get a matrix for whether rays from each origin along each direction hit boxes.
+
+    Args:
+        origins: A NumPy array with a shape of (N, 3) for the ray origins.
+        directions: A NumPy array with a shape of (M, 3) for the ray directions.
+        boxes: A list of tuples with the minimum and maximum corner of each box.
+
+    Returns:
+        A NumPy array of booleans with a shape of (N, M), which is True where
+        the ray hits at least one of the boxes.
+    """
+    hit = np.zeros((len(origins), len(directions)), dtype=bool)
+    if len(boxes) == 0:
+        return hit
+    with np.errstate(divide='ignore'):
+        inv_dirs = 1.0 / directions
+    for b_min, b_max in boxes:
+        with np.errstate(invalid='ignore', over='ignore'):
+            t1 = (b_min - origins)[:, None, :] * inv_dirs[None, :, :]
+            t2 = (b_max - origins)[:, None, :] * inv_dirs[None, :, :]
+            # NaN results come from rays parallel to a box that start on its plane
+            t_near = np.nanmax(np.minimum(t1, t2), axis=2)
+            t_far = np.nanmin(np.maximum(t1, t2), axis=2)
+        hit |= (t_far >= t_near) & (t_far >= 0)
+    return hit
+
+
+def _set_matrix_rows(int_mtx, row_ids, rows):
+    """Replace rows of a NumPy array, PackedBoolMatrix or SparseMatrix in place."""
+    if len(row_ids) == 0:
+        return
+    if isinstance(int_mtx, np.ndarray):
+        int_mtx[row_ids] = rows
+    else:
+        rows = rows.to_array() if hasattr(rows, 'to_array') else rows
+        int_mtx.set_rows(row_ids, rows)
+
+
+def _numpy_intersection_matrix(
+        vectors, points, normals, context_geometry, offset_distance=0,
+        numericalize=False, matrix_format='dense'):
+    """Compute the intersection matrix by tracing rays through a NumPy BVH.
+
+    The result matches that of Radiance's rcontrib with each vector treated as
+    a distant light source. So vectors behind the normal of a sensor are never
+    seen and numericalized values are the cosine between the normal and the vector.
+
+    Args:
+        vectors: A list of ladybug geometry Vector3D to be projected from the points.
+        points: A list of ladybug geometry Point3D for the sensors.
+        normals: A list of ladybug geometry Vector3D for the normals of the points.
+        context_geometry: A list of ladybug geometry Face3D and/or Mesh3D that
+            can block the vectors projected from the test points.
         offset_distance: An optional number to offset the sensor points before
             the vectors are cast through the context_geometry. (Default: 0).
         numericalize: A boolean to note whether the output matrix should contain
-            numbers representing the cosine of the angle between the normal and
-            each vector or it should simply be a matrix of booleans for whether
-            the vector is seen by the surface (True) or not (False). Numbers
-            can be useful for computing radiation and irradiance while the booleans
-            are more helpful for direct sun and view studies. (Default: False).
-        sim_folder: An optional path to a folder where the simulation files
-            will be written. If None, a temporary directory will be
-            used. (Default: None).
-        use_radiance_mesh: A boolean to note whether input Mesh3D should be translated
-            to Radiance Meshes for simulation or whether they should simply have
-            their faces translated to Radiance polygons. For complex context geometry,
-            Radiance meshes will use less memory but they take a longer time
-            to prepare compared to polygons. (Default: False).
+            cosine values (True) or booleans (False). (Default: False).
+        matrix_format: Text for the format of the output matrix. Choose from
+            dense, packed, sparse and auto. (Default: dense).
 
     Returns:
-        A lists of lists, which can be used to account for context shade surrounding
-        visualizations or geometry. The matrix will have a length equal to the points
-        (and normals). Each sub-list consists of booleans and has a length equal
-        to the number of sky patches times 2 (indicating sky patches and ground patches).
-        True indicates that a certain patch is seen and False indicates that the
-        match is blocked.
+        A NumPy array, PackedBoolMatrix or SparseMatrix with a row for each
+        point and a column for each vector.
     """
-    # process the sky into an acceptable format
-    lb_vecs = view_sphere.reinhart_dome_vectors if sky_matrix.high_density \
-        else view_sphere.tregenza_dome_vectors
-    if sky_matrix.north != 0:
-        north_angle = math.radians(sky_matrix.north)
-        lb_vecs = tuple(vec.rotate_xy(north_angle) for vec in lb_vecs)
-    lb_grnd_vecs = tuple(vec.reverse() for vec in lb_vecs)
-    vectors = lb_vecs + lb_grnd_vecs
-    # compute the intersection matrix
-    return intersection_matrix(
-        vectors, points, normals, context_geometry,
-        offset_distance, numericalize, sim_folder, use_radiance_mesh)
+    assert np is not None, 'NumPy must be installed to use the numpy backend.'
+    pts = np.array([pt.to_array() for pt in points], dtype=np.float64).reshape(-1, 3)
+    nrms = np.array([v.to_array() for v in normals], dtype=np.float64).reshape(-1, 3)
+    vecs = np.array([v.to_array() for v in vectors], dtype=np.float64).reshape(-1, 3)
+    if offset_distance != 0:  # account for the offset distance
+        pts = pts + nrms * offset_distance
+    vecs = vecs / np.linalg.norm(vecs, axis=1)[:, None]
+
+    # trace the rays in batches of sensors, skipping vectors behind the sensor normal
+    bvh = BVH.from_geometry(context_geometry)
+    builder = _MatrixBuilder(len(pts), len(vecs), numericalize, matrix_format)
+    row_count = max(RAY_BATCH // max(len(vecs), 1), 1)
+    for st in range(0, len(pts), row_count):
+        rows = np.dot(nrms[st:st + row_count], vecs.T)
+        rows[rows <= FTINY] = 0
+        pt_ids, vec_ids = np.nonzero(rows)
+        blocked = bvh.occluded(pts[st:st + row_count][pt_ids], vecs[vec_ids])
+        rows[pt_ids[blocked], vec_ids[blocked]] = 0
+        builder.add_rows(st, rows)
+    return builder.matrix
 
 
-def binary_to_array(binary_file, nrows=None, ncols= None, ncomp=None, line_count=0):
+def binary_to_array(
+        binary_file, nrows=None, ncols=None, ncomp=None, line_count=0,
+        memory_map=False):
     """Read a Radiance binary file as a NumPy array.
 
     Args:
@@ -266,25 +1463,31 @@ def binary_to_array(binary_file, nrows=None, ncols= None, ncomp=None, line_count
         ncomp: Number of components of each element in the Radiance file.
         line_count: Number of lines to skip in the input file. Usually used to
             skip the header.
+        memory_map: A boolean to note whether the values should be memory-mapped
+            from the file (True) instead of being read into memory (False).
+            Memory-mapped arrays only load the parts of the file that are accessed,
+            which makes it possible to process files larger than the available
+            memory one block of rows at a time. (Default: False).
 
     Returns:
-        A NumPy array.
+        A NumPy array or, if memory_map is True, a read-only NumPy memmap.
     """
     with open(binary_file, 'rb') as reader:
-        if (nrows or ncols or ncomp) is None:
-            # get nrows, ncols and header line count
-            nrows, ncols, ncomp, line_count = binary_mtx_dimension(binary_file)
-        # skip first n lines from reader
-        for i in range(line_count):
-            reader.readline()
-
-        array = np.fromfile(reader, dtype=np.float32)
-        if ncomp != 1:
-            array = array.reshape(nrows, ncols, ncomp)
+        if nrows is None or ncols is None or ncomp is None:
+            # get nrows, ncols and ncomp while skipping the header
+            nrows, ncols, ncomp, line_count = _read_binary_header(reader)
         else:
-            array = array.reshape(nrows, ncols)
+            # skip first n lines from reader
+            for i in range(line_count):
+                reader.readline()
+        shape = (nrows, ncols) if ncomp == 1 else (nrows, ncols, ncomp)
 
-    return array
+        if memory_map:
+            return np.memmap(
+                binary_file, dtype=np.float32, mode='r', offset=reader.tell(),
+                shape=shape)
+        array = np.fromfile(reader, dtype=np.float32)
+        return array.reshape(shape)
 
 
 def binary_mtx_dimension(filepath):
@@ -299,38 +1502,49 @@ def binary_mtx_dimension(filepath):
     Returns:
         A tuple with 4 integers. nrows, ncols, ncomp, line_count
     """
-    try:
-        inf = open(filepath, 'rb', encoding='utf-8')
-    except Exception:
-        inf = open(filepath, 'rb')
-    try:
-        first_line = next(inf).rstrip().decode('utf-8')
-        if first_line[:10] != '#?RADIANCE':
-            error_message = \
-                'File with Radiance header must start with #?RADIANCE\n' \
-                'Not {}.'.format(first_line)
-            raise ValueError(error_message)
-
-        header_lines = [first_line]
-        nrows = ncols = ncomp = None
-        for line in inf:
-            line = line.rstrip().decode('utf-8')
-            header_lines.append(line)
-            if line[:6] == 'NROWS=':
-                nrows = int(line.split('=')[-1])
-            if line[:6] == 'NCOLS=':
-                ncols = int(line.split('=')[-1])
-            if line[:6] == 'NCOMP=':
-                ncomp = int(line.split('=')[-1])
-            if line[:7] == 'FORMAT=':
-                break
+    with open(filepath, 'rb') as inf:
+        return _read_binary_header(inf)
+
+
+def _read_binary_header(reader):
+    """Read the header of a binary Radiance file from a reader opened in binary mode.
+
+    After this function runs, the reader is positioned at the start of the data.
+
+    Args:
+        reader: A file object at the start of the Radiance file.
+
+    Returns:
+        A tuple with 4 integers. nrows, ncols, ncomp, line_count
+    """
+    first_line = reader.readline().rstrip().decode('utf-8')
+    if first_line[:10] != '#?RADIANCE':
+        error_message = \
+            'File with Radiance header must start with #?RADIANCE\n' \
+            'Not {}.'.format(first_line)
+        raise ValueError(error_message)
+
+    line_count = 1
+    nrows = ncols = ncomp = None
+    while True:
+        line = reader.readline()
+        if not line:  # end of file before the end of the header
+            break
+        line_count += 1
+        line = line.rstrip().decode('utf-8')
+        if not line:  # an empty line marks the end of the header
+            break
+        if line[:6] == 'NROWS=':
+            nrows = int(line.split('=')[-1])
+        if line[:6] == 'NCOLS=':
+            ncols = int(line.split('=')[-1])
+        if line[:6] == 'NCOMP=':
+            ncomp = int(line.split('=')[-1])
 
-        if not nrows or not ncols:
-            error_message = \
-                'NROWS or NCOLS was not found in the Radiance header.\nNROWS ' \
-                'is {} and NCOLS is {}.\nThe header must have both ' \
-                'elements.'.format(nrows, ncols)
-            raise ValueError(error_message)
-        return nrows, ncols, ncomp, len(header_lines) + 1
-    finally:
-        inf.close()
+    if not nrows or not ncols:
+        error_message = \
+            'NROWS or NCOLS was not found in the Radiance header.\nNROWS ' \
+            'is {} and NCOLS is {}.\nThe header must have both ' \
+            'elements.'.format(nrows, ncols)
+        raise ValueError(error_message)
+    return nrows, ncols, ncomp, line_count
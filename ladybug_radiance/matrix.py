@@ -0,0 +1,472 @@
+"""Compact representations of intersection matrices.
+
+The classes in this module mimic the parts of the NumPy array interface that
+are used to post-process intersection matrices (len, indexing, iteration,
+sum and dot) such that they can be used in place of a dense NumPy array
+while using a fraction of the memory.
+"""
+from __future__ import division
+
+try:  # first, assume we are in cPython and numpy is installed
+    import numpy as np
+except Exception:  # we are in IronPython or numpy is not installed
+    np = None
+
+
+class PackedBoolMatrix(object):
+    """A matrix of booleans with each value stored as a single bit.
+
+    Args:
+        packed: A NumPy array of uint8 with one row for each row of the matrix,
+            as output from np.packbits(array, axis=1).
+        column_count: An integer for the number of columns in the unpacked matrix.
+
+    Properties:
+        * packed
+        * shape
+        * dtype
+        * nbytes
+    """
+    ROW_CHUNK = 2 ** 12  # number of rows unpacked at once for sums and products
+    __slots__ = ('_packed', '_column_count')
+
+    def __init__(self, packed, column_count):
+        """Initialize PackedBoolMatrix."""
+        assert np is not None, 'NumPy must be installed to use a PackedBoolMatrix.'
+        packed = np.asarray(packed, dtype=np.uint8)
+        assert packed.ndim == 2, 'PackedBoolMatrix packed array must be ' \
+            '2-dimensional. Got {} dimensions.'.format(packed.ndim)
+        assert packed.shape[1] * 8 >= column_count, 'PackedBoolMatrix ' \
+            'column_count [{}] is too large for the packed array.'.format(column_count)
+        self._packed = packed
+        self._column_count = int(column_count)
+
+    @classmethod
+    def from_array(cls, array):
+        """Create a PackedBoolMatrix from a 2-dimensional array of booleans or numbers.
+
+        Args:
+            array: A 2-dimensional NumPy array or list of lists. Any non-zero
+                values will be interpreted as True.
+        """
+        array = np.asarray(array)
+        if array.ndim == 1:
+            array = array.reshape(len(array), -1)
+        return cls(np.packbits(array.astype(bool), axis=1), array.shape[1])
+
+    @property
+    def packed(self):
+        """Get the NumPy array of uint8 that stores the bits of the matrix."""
+        return self._packed
+
+    @property
+    def shape(self):
+        """Get a tuple for the number of rows and columns of the unpacked matrix."""
+        return (len(self._packed), self._column_count)
+
+    @property
+    def dtype(self):
+        """Get the NumPy data type of the unpacked values of the matrix."""
+        return np.dtype(bool)
+
+    @property
+    def nbytes(self):
+        """Get an integer for the number of bytes used to store the matrix."""
+        return self._packed.nbytes
+
+    def rows(self, start=0, stop=None):
+        """Get a range of rows of the matrix as an unpacked NumPy array of booleans.
+
+        Args:
+            start: Integer for the index of the first row. (Default: 0).
+            stop: Integer for the index after the last row. If None, all rows
+                after the start will be returned. (Default: None).
+        """
+        unpacked = np.unpackbits(
+            self._packed[start:stop], axis=1, count=self._column_count)
+        return unpacked.view(bool)
+
+    def to_array(self):
+        """Get the full matrix as an unpacked NumPy array of booleans."""
+        return self.rows()
+
+    def set_rows(self, row_ids, rows):
+        """Replace several rows of the matrix in place.
+
+        Args:
+            row_ids: A list of integers for the indices of the rows to replace.
+            rows: A 2-dimensional NumPy array of booleans or numbers with one row
+                for each of the row_ids. Any non-zero values will be
+                interpreted as True.
+        """
+        rows = np.asarray(rows).reshape(len(row_ids), self._column_count)
+        self._packed[np.asarray(row_ids, dtype=np.int64)] = \
+            np.packbits(rows.astype(bool), axis=1)
+
+    def take_columns(self, columns):
+        """Get a new PackedBoolMatrix with a selection of the columns of this one.
+
+        Args:
+            columns: A list of integers for the indices of the columns of this
+                matrix that make up the columns of the new matrix. Indices can
+                be repeated to duplicate columns.
+        """
+        columns = np.asarray(columns, dtype=np.int64)
+        packed = np.zeros((len(self._packed), (len(columns) + 7) // 8), dtype=np.uint8)
+        for st in range(0, len(self._packed), self.ROW_CHUNK):
+            packed[st:st + self.ROW_CHUNK] = np.packbits(
+                self.rows(st, st + self.ROW_CHUNK)[:, columns], axis=1)
+        return PackedBoolMatrix(packed, len(columns))
+
+    def sum(self, axis=None):
+        """Get the sum of the True values of the matrix.
+
+        Args:
+            axis: An integer for the axis along which values are summed. 1 sums the
+                values of each row, 0 sums the values of each column and None
+                sums all values of the matrix. (Default: None).
+        """
+        if axis == 1 or axis == -1:
+            return _POPCOUNT[self._packed].sum(axis=1, dtype=np.int64)
+        col_sums = np.zeros(self._column_count, dtype=np.int64)
+        for st in range(0, len(self._packed), self.ROW_CHUNK):
+            col_sums += self.rows(st, st + self.ROW_CHUNK).sum(axis=0)
+        return col_sums if axis == 0 else int(col_sums.sum())
+
+    def dot(self, other):
+        """Get the product of this matrix with a vector or matrix of numbers.
+
+        The rows are unpacked in chunks such that the full matrix is never
+        held in memory.
+
+        Args:
+            other: A NumPy array of numbers with a length equal to the number of
+                columns of this matrix. This can either be a 1-dimensional vector
+                or a 2-dimensional matrix.
+        """
+        other = np.asarray(other)
+        result = np.zeros((len(self._packed),) + other.shape[1:],
+                          dtype=np.result_type(other.dtype, np.int8))
+        for st in range(0, len(self._packed), self.ROW_CHUNK):
+            result[st:st + self.ROW_CHUNK] = \
+                np.dot(self.rows(st, st + self.ROW_CHUNK), other)
+        return result
+
+    def cosine_dot(self, other, normals, vectors):
+        """Get the product with a vector after weighting each value by a cosine.
+
+        Each True value of the matrix is replaced with the cosine of the angle
+        between the normal of its row and the vector of its column (or zero for
+        a negative cosine) before it is multiplied. This yields the same result
+        as the dot product of a numericalized intersection matrix without ever
+        storing the cosine values.
+
+        Args:
+            other: A NumPy array of numbers with a length equal to the number of
+                columns of this matrix. This can either be a 1-dimensional vector
+                or a 2-dimensional matrix.
+            normals: A NumPy array with a shape of (rows, 3) for the normalized
+                normal of each row of the matrix.
+            vectors: A NumPy array with a shape of (columns, 3) for the
+                normalized vector of each column of the matrix.
+        """
+        other, normals = np.asarray(other), np.asarray(normals, dtype=np.float64)
+        vectors = np.asarray(vectors, dtype=np.float64)
+        result = np.zeros((len(self._packed),) + other.shape[1:], dtype=np.float64)
+        for st in range(0, len(self._packed), self.ROW_CHUNK):
+            cos_mtx = np.dot(normals[st:st + self.ROW_CHUNK], vectors.T)
+            cos_mtx[~self.rows(st, st + self.ROW_CHUNK) | (cos_mtx < 0)] = 0
+            result[st:st + self.ROW_CHUNK] = np.dot(cos_mtx, other)
+        return result
+
+    def ToString(self):
+        """Overwrite .NET ToString."""
+        return self.__repr__()
+
+    def __len__(self):
+        return len(self._packed)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return PackedBoolMatrix(self._packed[key], self._column_count)
+        rows = self._packed[key]
+        if rows.ndim == 1:  # a single row
+            return np.unpackbits(rows, count=self._column_count).view(bool)
+        return np.unpackbits(rows, axis=1, count=self._column_count).view(bool)
+
+    def __iter__(self):
+        for st in range(0, len(self._packed), self.ROW_CHUNK):
+            for row in self.rows(st, st + self.ROW_CHUNK):
+                yield row
+
+    def __repr__(self):
+        """PackedBoolMatrix object representation."""
+        return 'PackedBoolMatrix [{} x {}]'.format(*self.shape)
+
+
+class SparseMatrix(object):
+    """A matrix stored in compressed sparse row (CSR) format.
+
+    Only the non-zero values of the matrix are stored along with their column
+    indices and the index of the first value of each row. This makes it efficient
+    for intersection matrices where most of the vectors are blocked or lie
+    behind the sensors.
+
+    Args:
+        data: A NumPy array of the non-zero values of the matrix in row order.
+        indices: A NumPy array of integers for the column index of each value in data.
+        indptr: A NumPy array of integers with a length of the number of rows plus
+            one. The values of row i are data[indptr[i]:indptr[i + 1]].
+        column_count: An integer for the number of columns in the matrix.
+
+    Properties:
+        * data
+        * indices
+        * indptr
+        * shape
+        * dtype
+        * nbytes
+        * density
+    """
+    ROW_CHUNK = 2 ** 12  # number of rows converted at once to and from dense arrays
+    __slots__ = ('_data', '_indices', '_indptr', '_column_count')
+
+    def __init__(self, data, indices, indptr, column_count):
+        """Initialize SparseMatrix."""
+        assert np is not None, 'NumPy must be installed to use a SparseMatrix.'
+        self._data = np.asarray(data)
+        self._indices = np.asarray(indices)
+        self._indptr = np.asarray(indptr, dtype=np.int64)
+        assert len(self._data) == len(self._indices) == self._indptr[-1], \
+            'SparseMatrix data, indices and indptr do not match one another.'
+        self._column_count = int(column_count)
+
+    @classmethod
+    def from_array(cls, array):
+        """Create a SparseMatrix from the non-zero values of a 2-dimensional array.
+
+        Args:
+            array: A 2-dimensional NumPy array or list of lists of booleans or numbers.
+        """
+        array = np.asarray(array)
+        if array.ndim == 1:
+            array = array.reshape(len(array), -1)
+        index_type = np.int32 if array.shape[1] < 2 ** 31 else np.int64
+        data, indices, counts = [], [], []
+        for st in range(0, len(array), cls.ROW_CHUNK):
+            rows = array[st:st + cls.ROW_CHUNK]
+            row_ids, col_ids = np.nonzero(rows)
+            data.append(rows[row_ids, col_ids])
+            indices.append(col_ids.astype(index_type))
+            counts.append(np.bincount(row_ids, minlength=len(rows)))
+        return cls._from_parts(data, indices, counts, array.shape[1], array.dtype)
+
+    @classmethod
+    def from_row_blocks(cls, blocks):
+        """Create a SparseMatrix by stacking several SparseMatrix on top of each other.
+
+        Args:
+            blocks: A list of SparseMatrix with the same number of columns,
+                which will be stacked in the order they are provided.
+        """
+        assert len(blocks) != 0, 'At least one block is needed to create a SparseMatrix.'
+        return cls._from_parts(
+            [b._data for b in blocks], [b._indices for b in blocks],
+            [np.diff(b._indptr) for b in blocks], blocks[0]._column_count,
+            blocks[0]._data.dtype)
+
+    @property
+    def data(self):
+        """Get a NumPy array of the non-zero values of the matrix."""
+        return self._data
+
+    @property
+    def indices(self):
+        """Get a NumPy array of the column indices of the non-zero values."""
+        return self._indices
+
+    @property
+    def indptr(self):
+        """Get a NumPy array for the index in data of the first value of each row."""
+        return self._indptr
+
+    @property
+    def shape(self):
+        """Get a tuple for the number of rows and columns of the matrix."""
+        return (len(self._indptr) - 1, self._column_count)
+
+    @property
+    def dtype(self):
+        """Get the NumPy data type of the values of the matrix."""
+        return self._data.dtype
+
+    @property
+    def nbytes(self):
+        """Get an integer for the number of bytes used to store the matrix."""
+        return self._data.nbytes + self._indices.nbytes + self._indptr.nbytes
+
+    @property
+    def density(self):
+        """Get a number between 0 and 1 for the fraction of values that are non-zero.
+        """
+        size = self.shape[0] * self.shape[1]
+        return len(self._data) / size if size != 0 else 0
+
+    def rows(self, start=0, stop=None):
+        """Get a range of rows of the matrix as a dense NumPy array.
+
+        Args:
+            start: Integer for the index of the first row. (Default: 0).
+            stop: Integer for the index after the last row. If None, all rows
+                after the start will be returned. (Default: None).
+        """
+        start, stop, _ = slice(start, stop).indices(self.shape[0])
+        stop = max(stop, start)
+        result = np.zeros((stop - start, self._column_count), dtype=self._data.dtype)
+        v_st, v_end = self._indptr[start], self._indptr[stop]
+        row_ids = self._row_ids(start, stop) - start
+        result[row_ids, self._indices[v_st:v_end]] = self._data[v_st:v_end]
+        return result
+
+    def to_array(self):
+        """Get the full matrix as a dense NumPy array."""
+        return self.rows()
+
+    def set_rows(self, row_ids, rows):
+        """Replace several rows of the matrix in place.
+
+        Args:
+            row_ids: A list of unique integers for the indices of the rows to replace.
+            rows: A 2-dimensional NumPy array with one row for each of the row_ids.
+        """
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        rows = np.asarray(rows, dtype=self._data.dtype).reshape(
+            len(row_ids), self._column_count)
+        new_mtx = SparseMatrix.from_array(rows)
+        # merge the values of the rows that are kept with those of the new rows
+        keep = np.ones(self.shape[0], dtype=bool)
+        keep[row_ids] = False
+        old_rows = self._row_ids()
+        old_values = keep[old_rows]
+        value_rows = np.concatenate([old_rows[old_values], row_ids[new_mtx._row_ids()]])
+        order = np.argsort(value_rows, kind='stable')
+        counts = np.diff(self._indptr)
+        counts[row_ids] = np.diff(new_mtx._indptr)
+        self._data = np.concatenate([self._data[old_values], new_mtx._data])[order]
+        self._indices = np.concatenate(
+            [self._indices[old_values], new_mtx._indices.astype(self._indices.dtype)]
+        )[order]
+        self._indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._indptr[1:])
+
+    def take_columns(self, columns):
+        """Get a new SparseMatrix with a selection of the columns of this one.
+
+        Args:
+            columns: A list of integers for the indices of the columns of this
+                matrix that make up the columns of the new matrix. Indices can
+                be repeated to duplicate columns.
+        """
+        columns = np.asarray(columns, dtype=np.int64)
+        blocks = [SparseMatrix.from_array(self.rows(st, st + self.ROW_CHUNK)[:, columns])
+                  for st in range(0, self.shape[0], self.ROW_CHUNK)]
+        if len(blocks) == 0:
+            return SparseMatrix.from_array(np.zeros((0, len(columns)), self._data.dtype))
+        return SparseMatrix.from_row_blocks(blocks)
+
+    def sum(self, axis=None):
+        """Get the sum of the values of the matrix.
+
+        Args:
+            axis: An integer for the axis along which values are summed. 1 sums the
+                values of each row, 0 sums the values of each column and None
+                sums all values of the matrix. (Default: None).
+        """
+        if axis == 1 or axis == -1:
+            if self._data.dtype == bool:
+                return np.diff(self._indptr)
+            return np.bincount(
+                self._row_ids(), weights=self._data, minlength=self.shape[0])
+        if axis == 0:
+            col_sums = np.bincount(
+                self._indices, weights=self._data, minlength=self._column_count)
+            return col_sums.astype(np.int64) if self._data.dtype == bool else col_sums
+        return self._data.sum()
+
+    def dot(self, other):
+        """Get the product of this matrix with a vector or matrix of numbers.
+
+        Only the non-zero values of the matrix are multiplied by a vector. A matrix
+        is multiplied by chunks of ROW_CHUNK rows, which are converted to dense
+        arrays such that each chunk is a single matrix product. This is much faster
+        than multiplying the values of each column of the matrix separately and
+        uses little memory.
+
+        Args:
+            other: A NumPy array of numbers with a length equal to the number of
+                columns of this matrix. This can either be a 1-dimensional vector
+                or a 2-dimensional matrix.
+        """
+        other = np.asarray(other)
+        if other.ndim == 1:
+            return np.bincount(self._row_ids(), weights=self._data * other[self._indices],
+                               minlength=self.shape[0])
+        other = other.astype(np.float64, copy=False)
+        result = np.zeros((self.shape[0], other.shape[1]), dtype=np.float64)
+        for st in range(0, self.shape[0], self.ROW_CHUNK):
+            end = min(st + self.ROW_CHUNK, self.shape[0])
+            if self._indptr[st] != self._indptr[end]:  # skip chunks without values
+                result[st:end] = np.dot(self.rows(st, end), other)
+        return result
+
+    def _row_ids(self, start=0, stop=None):
+        """Get a NumPy array with the row index of each value between two rows."""
+        stop = self.shape[0] if stop is None else stop
+        counts = np.diff(self._indptr[start:stop + 1])
+        return np.repeat(np.arange(start, stop), counts)
+
+    @classmethod
+    def _from_parts(cls, data, indices, counts, column_count, d_type):
+        """Create a SparseMatrix from lists of data, indices and row value counts."""
+        counts = np.concatenate(counts) if len(counts) != 0 else np.zeros(0, np.int64)
+        indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        data = np.concatenate(data) if len(data) != 0 else np.zeros(0, d_type)
+        indices = np.concatenate(indices) if len(indices) != 0 \
+            else np.zeros(0, np.int32)
+        return cls(data, indices, indptr, column_count)
+
+    def ToString(self):
+        """Overwrite .NET ToString."""
+        return self.__repr__()
+
+    def __len__(self):
+        return len(self._indptr) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.shape[0])
+            assert step == 1, 'SparseMatrix rows can only be sliced with a step of 1.'
+            stop = max(stop, start)
+            v_st, v_end = self._indptr[start], self._indptr[stop]
+            return SparseMatrix(
+                self._data[v_st:v_end], self._indices[v_st:v_end],
+                self._indptr[start:stop + 1] - v_st, self._column_count)
+        if key < 0:
+            key += self.shape[0]
+        return self.rows(key, key + 1)[0]
+
+    def __iter__(self):
+        for st in range(0, self.shape[0], self.ROW_CHUNK):
+            for row in self.rows(st, st + self.ROW_CHUNK):
+                yield row
+
+    def __repr__(self):
+        """SparseMatrix object representation."""
+        return 'SparseMatrix [{} x {}] [{} values]'.format(
+            self.shape[0], self.shape[1], len(self._data))
+
+
+# number of True bits in each possible value of a uint8
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1) \
+    if np is not None else None
@@ -0,0 +1,36 @@
+"""Functions to run many independent tasks at once."""
+import threading
+
+
+def run_in_threads(function, arguments, workers=1):
+    """Call a function for each set of arguments using a pool of threads.
+
+    Args:
+        function: The function to be called.
+        arguments: A list of tuples for the arguments of each call.
+        workers: Integer for the number of threads to use. (Default: 1).
+    """
+    if workers <= 1 or len(arguments) <= 1:
+        for args in arguments:
+            function(*args)
+        return
+    queue, errors, lock = list(reversed(arguments)), [], threading.Lock()
+
+    def _worker():
+        while not errors:
+            with lock:
+                if not queue:
+                    return
+                args = queue.pop()
+            try:
+                function(*args)
+            except Exception as e:
+                errors.append(e)
+    threads = [threading.Thread(target=_worker) for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
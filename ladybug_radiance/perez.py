@@ -0,0 +1,235 @@
+"""Perez all-weather sky model for computing the radiation of sky patches with NumPy.
+
+The functions of this module follow the same steps as Radiance's gendaymtx
+command when it is run with solar radiance output (-O1), such that sky matrices
+can be computed in-process for all time steps at once and without Radiance.
+This includes the sun position equations of Radiance, the Perez sky
+clearness and brightness parameters and the distribution of the direct sun
+over the four sky patches that are nearest to the sun.
+
+More information on the Perez all-weather sky model can be found in:
+Perez, R., Seals, R., and Michalsky, J. (1993). All-Weather Model for Sky
+Luminance Distribution - Preliminary Configuration and Validation. Solar
+Energy, 50(3), 235-245.
+"""
+from __future__ import division
+import math
+
+try:  # first, assume we are in cPython and numpy is installed
+    import numpy as np
+except Exception:  # we are in IronPython or numpy is not installed
+    np = None
+
+# coefficients a, b, c, d and e (four each) of the Perez model for each sky clearness
+PEREZ_COEFFICIENTS = (
+    (1.3525, -0.2576, -0.2690, -1.4366, -0.7670, 0.0007, 1.2734, -0.1233,
+     2.8000, 0.6004, 1.2375, 1.0000, 1.8734, 0.6297, 0.9738, 0.2809,
+     0.0356, -0.1246, -0.5718, 0.9938),
+    (-1.2219, -0.7730, 1.4148, 1.1016, -0.2054, 0.0367, -3.9128, 0.9156,
+     6.9750, 0.1774, 6.4477, -0.1239, -1.5798, -0.5081, -1.7812, 0.1080,
+     0.2624, 0.0672, -0.2190, -0.4285),
+    (-1.1000, -0.2515, 0.8952, 0.0156, 0.2782, -0.1812, -4.5000, 1.1766,
+     24.7219, -13.0812, -37.7000, 34.8438, -5.0000, 1.5218, 3.9229, -2.6204,
+     -0.0156, 0.1597, 0.4199, -0.5562),
+    (-0.5484, -0.6654, -0.2672, 0.7117, 0.7234, -0.6219, -5.6812, 2.6297,
+     33.3389, -18.3000, -62.2500, 52.0781, -3.5000, 0.0016, 1.1477, 0.1062,
+     0.4659, -0.3296, -0.0876, -0.0329),
+    (-0.6000, -0.3566, -2.5000, 2.3250, 0.2937, 0.0496, -5.6812, 1.8415,
+     21.0000, -4.7656, -21.5906, 7.2492, -3.5000, -0.1554, 1.4062, 0.3988,
+     0.0032, 0.0766, -0.0656, -0.1294),
+    (-1.0156, -0.3670, 1.0078, 1.4051, 0.2875, -0.5328, -3.8500, 3.3750,
+     14.0000, -0.9999, -7.1406, 7.5469, -3.4000, -0.1078, -1.0750, 1.5702,
+     -0.0672, 0.4016, 0.3017, -0.4844),
+    (-1.0000, 0.0211, 0.5025, -0.5119, -0.3000, 0.1922, 0.7023, -1.6317,
+     19.0000, -5.0000, 1.2438, -1.9094, -4.0000, 0.0250, 0.3844, 0.2656,
+     1.0468, -0.3788, -2.4517, 1.4656),
+    (-1.0500, 0.0289, 0.4260, 0.3590, -0.3250, 0.1156, 0.7781, 0.0025,
+     31.0625, -14.5000, -46.1148, 55.3750, -7.2312, 0.4050, 13.3500, 0.6234,
+     1.5000, -0.6426, 1.8564, 0.5636)
+)
+CLEARNESS_BINS = (1.065, 1.230, 1.500, 1.950, 2.800, 4.500, 6.200)
+TREGENZA_PATCHES_PER_ROW = (30, 30, 24, 24, 18, 12, 6)
+SOLAR_CONSTANT = 1367.0  # extraterrestrial solar irradiance in W/m2
+SKY_COLOR = (0.960, 1.004, 1.118)  # default sky color of gendaymtx
+RGB_WEIGHTS = (0.265074126, 0.670114631, 0.064811243)  # RGB to broadband weights
+SUN_PATCHES = 4  # number of patches nearest to the sun that share the direct sun
+MONTH_DAYS = (0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+
+
+def patch_directions(high_density=False):
+    """Get the altitudes, azimuths and solid angles of the patches of the sky dome.
+
+    The patches are ordered from the horizon to the zenith and, within each row,
+    clockwise from North when viewed from above, which matches the order of
+    the dome vectors of the ladybug view_sphere.
+
+    Args:
+        high_density: A boolean to note whether the patches of the Reinhart sky
+            (True) or the Tregenza sky (False) are returned. (Default: False).
+
+    Returns:
+        A tuple with three NumPy arrays for the altitudes (radians), the azimuths
+        (radians from North towards East) and the solid angles (steradians)
+        of the sky patches.
+    """
+    sub_div = 2 if high_density else 1
+    row_count = len(TREGENZA_PATCHES_PER_ROW) * sub_div
+    alpha = (math.pi / 2) / (row_count + 0.5)  # angular height of each row
+    altitudes, azimuths, solid_angles = [], [], []
+    for i in range(row_count):
+        in_row = TREGENZA_PATCHES_PER_ROW[i // sub_div] * sub_div
+        altitudes.append(np.full(in_row, alpha * (i + 0.5)))
+        azimuths.append(2 * math.pi * np.arange(in_row) / in_row)
+        dom = 2 * math.pi * (math.sin(alpha * (i + 1)) - math.sin(alpha * i)) / in_row
+        solid_angles.append(np.full(in_row, dom))
+    altitudes.append(np.array([math.pi / 2]))  # the zenith patch
+    azimuths.append(np.array([0.]))
+    solid_angles.append(np.array([2 * math.pi * (1 - math.cos(alpha * 0.5))]))
+    return np.concatenate(altitudes), np.concatenate(azimuths), \
+        np.concatenate(solid_angles)
+
+
+def solar_position(latitude, longitude, time_zone, months, days, hours):
+    """Get the position of the sun with the equations used by Radiance.
+
+    Args:
+        latitude: A number for the latitude of the location in degrees.
+        longitude: A number for the longitude of the location in degrees, which
+            is positive to the East of Greenwich.
+        time_zone: A number for the time zone of the location in hours, which is
+            positive to the East of Greenwich.
+        months: A list of integers for the month of each time step (1-12).
+        days: A list of integers for the day of the month of each time step.
+        hours: A list of numbers for the hour of each time step in standard time.
+
+    Returns:
+        A tuple with three NumPy arrays for the altitude of the sun (radians),
+        the azimuth of the sun (radians from North towards East) and the day
+        of the year of each time step.
+    """
+    lat = math.radians(latitude)
+    # Radiance measures longitude and time zone meridian as positive to the West
+    s_longitude, s_meridian = math.radians(-longitude), math.radians(-time_zone * 15)
+    julian = np.array(MONTH_DAYS)[np.asarray(months, dtype=np.int64) - 1] + \
+        np.asarray(days, dtype=np.int64)
+    # solar declination and solar time
+    s_dec = 0.4093 * np.sin((2 * math.pi / 368) * (julian - 81))
+    s_time = np.asarray(hours, dtype=np.float64) + \
+        0.170 * np.sin((4 * math.pi / 373) * (julian - 80)) - \
+        0.129 * np.sin((2 * math.pi / 355) * (julian - 8)) + \
+        12 * (s_meridian - s_longitude) / math.pi
+    hr_angle = s_time * (math.pi / 12)
+    altitude = np.arcsin(np.sin(lat) * np.sin(s_dec) -
+                         np.cos(lat) * np.cos(s_dec) * np.cos(hr_angle))
+    azimuth = -np.arctan2(
+        np.cos(s_dec) * np.sin(hr_angle),
+        -np.cos(lat) * np.sin(s_dec) - np.sin(lat) * np.cos(s_dec) * np.cos(hr_angle))
+    return altitude, azimuth + math.pi, julian
+
+
+def perez_sky_matrix(
+        latitude, longitude, time_zone, months, days, hours,
+        direct_normal_irradiance, diffuse_horizontal_irradiance, high_density=False):
+    """Get the irradiance from each sky patch for several time steps.
+
+    Args:
+        latitude: A number for the latitude of the location in degrees.
+        longitude: A number for the longitude of the location in degrees, which
+            is positive to the East of Greenwich.
+        time_zone: A number for the time zone of the location in hours, which is
+            positive to the East of Greenwich.
+        months: A list of integers for the month of each time step (1-12).
+        days: A list of integers for the day of the month of each time step.
+        hours: A list of numbers for the hour of each time step in standard time.
+        direct_normal_irradiance: A list of numbers for the direct normal
+            irradiance in W/m2 at each time step.
+        diffuse_horizontal_irradiance: A list of numbers for the diffuse
+            horizontal irradiance in W/m2 at each time step.
+        high_density: A boolean to note whether the patches of the Reinhart sky
+            (True) or the Tregenza sky (False) are used. (Default: False).
+
+    Returns:
+        A tuple with two NumPy arrays, which each have one row per time step
+        and one column per sky patch (ordered as the output of patch_directions).
+        The first is for the direct irradiance and the second is for the diffuse
+        irradiance in W/m2 from each sky patch, which is the radiance of the
+        patch multiplied by its solid angle.
+    """
+    assert np is not None, 'NumPy must be installed to use the Perez sky model.'
+    dni = np.asarray(direct_normal_irradiance, dtype=np.float64)
+    dhi = np.asarray(diffuse_horizontal_irradiance, dtype=np.float64)
+    p_alt, p_azi, p_dom = patch_directions(high_density)
+    altitude, azimuth, julian = solar_position(
+        latitude, longitude, time_zone, months, days, hours)
+    # keep the sun zenith above the horizon and away from the zenith patch
+    sun_zenith = np.clip(math.pi / 2 - altitude, math.radians(3), math.pi / 2)
+
+    # compute the sky clearness and brightness
+    sz_cubed = sun_zenith ** 3
+    with np.errstate(divide='ignore', invalid='ignore'):
+        clearness = ((dhi + dni) / dhi + 1.041 * sz_cubed) / (1 + 1.041 * sz_cubed)
+    clearness = np.clip(np.nan_to_num(clearness, nan=1.0), 1.0, 11.9)
+    air_mass = np.where(
+        sun_zenith > math.radians(85),
+        1 / (np.cos(sun_zenith) +
+             0.15 * (93.885 - np.degrees(sun_zenith)) ** -1.253),
+        1 / np.cos(sun_zenith))
+    day_angle = (julian - 1) * (2 * math.pi / 365)
+    eccentricity = 1.00011 + 0.034221 * np.cos(day_angle) + \
+        0.00128 * np.sin(day_angle) + 0.000719 * np.cos(2 * day_angle) + \
+        0.000077 * np.sin(2 * day_angle)
+    brightness = np.maximum(dhi * air_mass / (SOLAR_CONSTANT * eccentricity), 0.01)
+    brightness = np.where((clearness > 1.065) & (clearness < 2.8),
+                          np.maximum(brightness, 0.2), brightness)
+
+    # compute the Perez parameters for each time step
+    index = np.searchsorted(CLEARNESS_BINS, clearness, side='right')
+    coeff = np.array(PEREZ_COEFFICIENTS)[index].reshape(-1, 5, 4)
+    sz, delta = sun_zenith[:, None], brightness[:, None]
+    params = coeff[:, :, 0] + coeff[:, :, 1] * sz + \
+        delta * (coeff[:, :, 2] + coeff[:, :, 3] * sz)
+    first = index == 0  # the overcast sky uses different equations for c and d
+    c0, d0 = coeff[first, 2], coeff[first, 3]
+    sz, delta = sun_zenith[first], brightness[first]
+    params[first, 2] = np.exp((delta * (c0[:, 0] + c0[:, 1] * sz)) ** c0[:, 2]) - \
+        c0[:, 3]
+    params[first, 3] = -np.exp(delta * (d0[:, 0] + d0[:, 1] * sz)) + d0[:, 2] + \
+        delta * d0[:, 3]
+
+    # compute the relative luminance of each sky patch
+    zeta = math.pi / 2 - p_alt
+    cos_gamma = np.cos(zeta) * np.cos(sun_zenith)[:, None] + np.sin(zeta) * \
+        np.sin(sun_zenith)[:, None] * np.cos(p_azi - azimuth[:, None])
+    gamma = np.arccos(np.clip(cos_gamma, -1, 1))
+    a, b, c, d, e = [params[:, i:i + 1] for i in range(5)]
+    lum = (1 + a * np.exp(b / np.cos(zeta))) * \
+        (1 + c * np.exp(d * gamma) + e * np.cos(gamma) ** 2)
+    lum = np.maximum(lum, 0)
+    # normalize the luminance to the diffuse horizontal irradiance
+    rel_horiz = np.dot(lum, np.sin(p_alt) * p_dom)
+    uniform = rel_horiz <= 1e-6  # make the sky uniform if it has no luminance
+    lum[uniform], rel_horiz[uniform] = 1, math.pi
+    sky_bright = sum(w * c for w, c in zip(RGB_WEIGHTS, SKY_COLOR))
+    diffuse = lum * p_dom * (dhi * sky_bright / rel_horiz)[:, None]
+
+    # distribute the direct sun over the patches nearest to the sun
+    sun_vecs = _direction_vectors(altitude, azimuth)
+    dots = np.dot(sun_vecs, _direction_vectors(p_alt, p_azi).T)
+    near = np.argpartition(-dots, SUN_PATCHES - 1, axis=1)[:, :SUN_PATCHES]
+    weights = 1 / (1.002 - np.take_along_axis(dots, near, axis=1))
+    weights *= (dni / weights.sum(axis=1))[:, None]
+    direct = np.zeros_like(diffuse)
+    np.put_along_axis(direct, near, weights, axis=1)
+
+    # time steps without diffuse irradiance are excluded as they are by gendaymtx
+    no_sky = dhi <= 1e-4
+    direct[no_sky], diffuse[no_sky] = 0, 0
+    return direct, diffuse
+
+
+def _direction_vectors(altitudes, azimuths):
+    """Get an array of unit vectors from arrays of altitudes and azimuths."""
+    cos_alt = np.cos(altitudes)
+    return np.stack(
+        [cos_alt * np.sin(azimuths), cos_alt * np.cos(azimuths), np.sin(altitudes)],
+        axis=-1)
@@ -3,28 +3,44 @@
 Creating this matrix is a necessary pre-step before doing incident radiation
 analysis or generating a visualizations like a radiation rose.
 
-This class uses Radiance's gendaymtx function to calculate the radiation
-for each patch of the sky. Gendaymtx is written by Ian Ashdown and Greg Ward.
-More information can be found in Radiance manual at:
+This class uses either Radiance's gendaymtx function or an equivalent NumPy
+implementation of the Perez sky model to calculate the radiation for each patch
+of the sky. Gendaymtx is written by Ian Ashdown and Greg Ward. More information
+can be found in Radiance manual at:
 http://www.radiance-online.org/learning/documentation/manual-pages/pdfs/gendaymtx.pdf
 """
 from __future__ import division
 import os
+import shutil
 import subprocess
 import sys
+import tempfile
 
+try:  # first, assume we are in cPython and numpy is installed
+    import numpy as np
+except Exception:  # we are in IronPython or numpy is not installed
+    np = None
+
+from ladybug.dt import DateTime
 from ladybug.epw import EPW
 from ladybug.wea import Wea
 from ladybug.viewsphere import view_sphere
 from ladybug.config import folders as lb_folders
 
 from .config import folders
+from .binary import to_container, from_container
+from .cache import FileCache, hash_values
+from .perez import perez_sky_matrix
+from .parallel import run_in_threads
 
 if folders.radbin_path is not None:
     GENDAYMTX_EXE = os.path.join(folders.radbin_path, 'gendaymtx.exe') if \
         os.name == 'nt' else os.path.join(folders.radbin_path, 'gendaymtx')
 else:
     GENDAYMTX_EXE = None
+SKY_BACKENDS = ('radiance', 'numpy')
+SKY_CACHE_VERSION = 2  # increment when a change alters the computed sky values
+SKY_CACHE_SIZE = 256 * 1024 ** 2  # maximum size of the sky cache folder in bytes
 
 
 class SkyMatrix(object):
@@ -43,19 +59,33 @@ class SkyMatrix(object):
             time for incident radiation studies. (Default: False).
         ground_reflectance: A number between 0 and 1 to note the average ground
             reflectance that is associated with the sky matrix. (Default: 0.2).
+        backend: Text for the engine used to compute the radiation of the sky
+            patches. Choose from the following. (Default: radiance).
+
+            * radiance - write the Wea to a file and run it through gendaymtx
+            * numpy - compute the Perez sky model in-process for all time steps,
+              which requires NumPy and matches gendaymtx to within about 2% of
+              the brightest patch but not exactly
 
     Properties:
         * wea
         * north
         * high_density
         * ground_reflectance
+        * backend
         * benefit_matrix
         * folder
+        * use_cache
+        * cache_folder
         * wea_duration
         * direct_values
         * diffuse_values
+        * direct_array
+        * diffuse_array
         * metadata
         * data
+        * hourly_direct_values
+        * hourly_diffuse_values
     """
     # constants for converting RGB values output by gendaymtx to broadband radiation
     PATCHES_PER_ROW = {
@@ -70,17 +100,25 @@ class SkyMatrix(object):
     SEPARATOR = b' ' if sys.version_info > (3, 0) else ' '
 
     __slots__ = (
-        '_wea', '_north', '_high_density', '_ground_reflectance', '_folder',
-        '_direct_values', '_diffuse_values', '_benefit_matrix', '_metadata')
+        '_wea', '_north', '_high_density', '_ground_reflectance', '_backend',
+        '_folder', '_use_cache', '_cache_folder', '_direct_values', '_diffuse_values',
+        '_benefit_matrix', '_metadata', '_hourly_values', '_hourly_sums',
+        '_wea_duration', '_value_tuples')
 
-    def __init__(self, wea, north=0, high_density=False, ground_reflectance=0.2):
+    def __init__(self, wea, north=0, high_density=False, ground_reflectance=0.2,
+                 backend='radiance'):
         """Initialize SkyMatrix."""
         self.wea = wea
         self.north = north
         self.high_density = high_density
         self.ground_reflectance = ground_reflectance
+        self.backend = backend
         self.benefit_matrix = None
         self.folder = None
+        self.use_cache = False
+        self.cache_folder = None
+        self._wea_duration = None
+        self._value_tuples = None
 
     @classmethod
     def from_components(
@@ -169,16 +207,8 @@ class SkyMatrix(object):
         else:
             dni, dhi = direct_normal_irradiance, diffuse_horizontal_irradiance
         # create the benefit matrix
-        t_low = balance_temperature - balance_offset
-        t_high = balance_temperature + balance_offset
-        benefit_mtx = []
-        for t in temperature:
-            if t < t_low:  # low temperatures mean radiation is beneficial
-                benefit_mtx.append(True)
-            elif t > t_high:  # high temperatures mean radiation is harmful
-                benefit_mtx.append(False)
-            else:  # the temperature is neutral, meaning radiation has no effect
-                benefit_mtx.append(None)
+        benefit_mtx = cls.benefit_matrix_from_temperature(
+            temperature, balance_temperature, balance_offset)
         # create the wea and return the SkyMatrix
         wea = Wea(location, dni, dhi)
         sky_mtx = cls(wea, north, high_density, ground_reflectance)
@@ -212,6 +242,68 @@ class SkyMatrix(object):
             epw.location, epw.direct_normal_radiation, epw.diffuse_horizontal_radiation,
             hoys, north, high_density, ground_reflectance)
 
+    @classmethod
+    def batch_from_epw(
+            cls, epw_files, workers=1, hoys=None, north=0, high_density=False,
+            ground_reflectance=0.2, backend='radiance', balance_temperature=None,
+            balance_offset=2, folder=None, use_cache=False):
+        """Compute SkyMatrices for several epw files in parallel processes.
+
+        Each epw file is parsed and its sky is computed in a pool of worker
+        processes. The SkyMatrices are yielded as soon as they are finished,
+        which may not be the order of the input epw_files.
+
+        Args:
+            epw_files: A list of full paths to epw weather files.
+            workers: A positive integer for the number of processes used to
+                compute the skies. If 1, the skies will be computed one after
+                the other in the current process. (Default: 1).
+            hoys: A list of numbers between 0 and 8760 that represent the hours of the
+                year for which to generate the sky matrices. If None, the matrices
+                will be for the entire year. (Default: None).
+            north: A number between -360 and 360 for the counterclockwise difference
+                between the North and the positive Y-axis in degrees. (Default: 0).
+            high_density: A Boolean to indicate whether the higher-density Reinhart
+                sky matrices should be generated. (Default: False).
+            ground_reflectance: A number between 0 and 1 to note the average ground
+                reflectance that is associated with the sky matrices. (Default: 0.2).
+            backend: Text for the engine used to compute the skies (radiance or
+                numpy). (Default: radiance).
+            balance_temperature: An optional temperature in Celsius between which
+                radiation switches from being a benefit to a harm. If set, the
+                skies will be benefit/harm skies using the dry bulb temperature of
+                each epw file. If None, all radiation contributes positively to
+                the skies. (Default: None).
+            balance_offset: The temperature offset from the balance temperature
+                in Celsius where radiation is neither harmful nor helpful. (Default: 2).
+            folder: An optional folder for the SkyMatrices, where the sky cache
+                is located. The Radiance commands of each sky are executed in their
+                own temporary sub-folder, which is deleted once the sky is computed,
+                while the sky cache is shared by all of them. (Default: None).
+            use_cache: A boolean to note whether computed skies are stored in and
+                loaded from the sky cache. (Default: False).
+
+        Returns:
+            A generator of tuples with two items each. The first is the path of
+            the epw file and the second is its computed SkyMatrix.
+        """
+        assert workers >= 1, 'SkyMatrix batch workers must be at least 1. ' \
+            'Got {}.'.format(workers)
+        settings = (hoys, north, high_density, ground_reflectance, backend,
+                    balance_temperature, balance_offset, folder, use_cache)
+        arguments = [(epw_file,) + settings for epw_file in epw_files]
+        if workers == 1 or len(arguments) <= 1:
+            for args in arguments:
+                yield _batch_sky_from_epw(args)
+            return
+        import multiprocessing  # not available in IronPython
+        pool = multiprocessing.Pool(min(workers, len(arguments)))
+        try:
+            for result in pool.imap_unordered(_batch_sky_from_epw, arguments):
+                yield result
+        finally:
+            pool.terminate()
+
     @classmethod
     def from_epw_benefit(cls, epw_file, balance_temperature=15, balance_offset=2,
                          hoys=None, north=0, high_density=False, ground_reflectance=0.2):
@@ -322,9 +414,83 @@ class SkyMatrix(object):
             wea = wea.filter_by_hoys(hoys)
         return cls(wea, north, high_density, ground_reflectance)
 
+    @classmethod
+    def from_bytes(cls, data):
+        """Create a computed SkyMatrix from bytes output by the to_bytes method.
+
+        The resulting SkyMatrix has the values, metadata and benefit_matrix of the
+        original one but it has no Wea. So it can be used in studies and
+        visualizations but its sky cannot be computed again and its
+        benefit_matrix cannot be changed.
+
+        Args:
+            data: The bytes (or a bytearray) output by the to_bytes method.
+        """
+        header, arrays = from_container(data, 'SkyMatrix')
+        sky = cls.__new__(cls)
+        sky._wea, sky._wea_duration = None, header['wea_duration']
+        sky._north = header['north']
+        sky._high_density = header['high_density']
+        sky._ground_reflectance = header['ground_reflectance']
+        sky._backend = header['backend']
+        sky._folder, sky._use_cache, sky._cache_folder = None, False, None
+        sky._hourly_values, sky._hourly_sums = None, None
+        sky._value_tuples = None
+        # with NumPy, the float32 values are views of the data without copies
+        to_list = (lambda a: a.tolist()) if np is not None else list
+        sky._direct_values, sky._diffuse_values = arrays['direct'], arrays['diffuse']
+        if np is None:
+            sky._direct_values = tuple(sky._direct_values)
+            sky._diffuse_values = tuple(sky._diffuse_values)
+        if 'benefit' in arrays:
+            sky._benefit_matrix = [None if b == 0 else b == 1
+                                   for b in to_list(arrays['benefit'])]
+        else:
+            sky._benefit_matrix = None
+        metadata = header['metadata']
+        sky._metadata = tuple(metadata[:2]) + \
+            tuple(DateTime.from_array(dt) for dt in metadata[2:4]) + tuple(metadata[4:])
+        return sky
+
+    @staticmethod
+    def benefit_matrix_from_temperature(
+            temperature, balance_temperature=15, balance_offset=2):
+        """Get a benefit_matrix from temperature values and a balance temperature.
+
+        Setting the result as the benefit_matrix of a SkyMatrix that already has
+        its time-resolved values will not require the sky to be computed again.
+        So this is an efficient way to test several balance temperatures.
+
+        Args:
+            temperature: A list or data collection of temperature values in Celsius,
+                which will be used to establish whether radiation is desired or
+                not for each time step.
+            balance_temperature: The temperature in Celsius between which radiation
+                switches from being a benefit to a harm. (Default 15C).
+            balance_offset: The temperature offset from the balance temperature
+                in Celsius where radiation is neither harmful nor helpful. (Default: 2).
+
+        Returns:
+            A list with a True, False or None value for each temperature value.
+        """
+        t_low = balance_temperature - balance_offset
+        t_high = balance_temperature + balance_offset
+        benefit_mtx = []
+        for t in temperature:
+            if t < t_low:  # low temperatures mean radiation is beneficial
+                benefit_mtx.append(True)
+            elif t > t_high:  # high temperatures mean radiation is harmful
+                benefit_mtx.append(False)
+            else:  # the temperature is neutral, meaning radiation has no effect
+                benefit_mtx.append(None)
+        return benefit_mtx
+
     @property
     def wea(self):
-        """Get or set a Wea object for the sky matrix."""
+        """Get or set a Wea object for the sky matrix.
+
+        This is None for a SkyMatrix that was created with from_bytes.
+        """
         return self._wea
 
     @wea.setter
@@ -335,6 +501,8 @@ class SkyMatrix(object):
         self._direct_values = None
         self._diffuse_values = None
         self._metadata = None
+        self._hourly_values = None
+        self._hourly_sums = None
 
     @property
     def north(self):
@@ -365,6 +533,8 @@ class SkyMatrix(object):
         self._direct_values = None
         self._diffuse_values = None
         self._metadata = None
+        self._hourly_values = None
+        self._hourly_sums = None
 
     @property
     def ground_reflectance(self):
@@ -380,6 +550,25 @@ class SkyMatrix(object):
             ' Got {}.'.format(value)
         self._ground_reflectance = value
 
+    @property
+    def backend(self):
+        """Get or set text for the engine used to compute the sky (radiance or numpy).
+        """
+        return self._backend
+
+    @backend.setter
+    def backend(self, value):
+        assert value in SKY_BACKENDS, 'SkyMatrix backend "{}" is not recognized. ' \
+            'Choose from: {}.'.format(value, ', '.join(SKY_BACKENDS))
+        assert value != 'numpy' or np is not None, \
+            'NumPy must be installed to use the numpy SkyMatrix backend.'
+        self._backend = value
+        self._direct_values = None
+        self._diffuse_values = None
+        self._metadata = None
+        self._hourly_values = None
+        self._hourly_sums = None
+
     @property
     def benefit_matrix(self):
         """Get or set list of True/False values for whether Wea datetimes are beneficial.
@@ -397,6 +586,8 @@ class SkyMatrix(object):
 
     @benefit_matrix.setter
     def benefit_matrix(self, value):
+        assert self._wea is not None, 'The benefit_matrix of a SkyMatrix loaded ' \
+            'from bytes cannot be changed since it has no Wea to compute the sky again.'
         if value is not None:
             assert isinstance(value, (list, tuple)), \
                 'SkyMatrix.benefit_matrix must be a list. Not {}'.format(type(value))
@@ -407,6 +598,7 @@ class SkyMatrix(object):
         self._direct_values = None
         self._diffuse_values = None
         self._metadata = None
+        self._hourly_sums = None
 
     @property
     def folder(self):
@@ -425,6 +617,37 @@ class SkyMatrix(object):
                 'SkyMatrix folder does not exist: {}'.format(type(value))
         self._folder = value
 
+    @property
+    def use_cache(self):
+        """Get or set a boolean for whether computed skies are cached on disk.
+
+        When True, the direct and diffuse values of each computed sky are stored
+        in a sky_cache sub-folder of the SkyMatrix folder. The entries are keyed
+        by a hash of the irradiance values, datetimes, location, benefit_matrix,
+        density and backend such that any later SkyMatrix with the same inputs
+        loads its values from the cache instead of computing the sky again.
+        """
+        return self._use_cache
+
+    @use_cache.setter
+    def use_cache(self, value):
+        self._use_cache = bool(value)
+
+    @property
+    def cache_folder(self):
+        """Get or set the folder where computed skies are cached when use_cache is True.
+
+        If None, it will be the sky_cache sub-folder of the SkyMatrix folder. The
+        cache can safely be shared by several processes.
+        """
+        if self._cache_folder is None:
+            return os.path.join(self.folder, 'sky_cache')
+        return self._cache_folder
+
+    @cache_folder.setter
+    def cache_folder(self, value):
+        self._cache_folder = value
+
     @property
     def wea_duration(self):
         """Get the duration of the Wea in hours.
@@ -432,18 +655,40 @@ class SkyMatrix(object):
         This is useful for converting the radiation values of the sky patches (kWh/m2)
         into irradiance (W/m2).
         """
+        if self._wea is None:
+            return self._wea_duration
         return len(self.wea) / self.wea.timestep
 
     @property
     def direct_values(self):
         """Get the direct radiation values for each of the sky patches."""
+        return self._tuple_values()[0]
+
+    @property
+    def diffuse_values(self):
+        """Get the diffuse radiation values for each of the sky patches."""
+        return self._tuple_values()[1]
+
+    @property
+    def direct_array(self):
+        """Get a NumPy array of the direct radiation values for each of the sky patches.
+
+        This is the array in which the values are stored, which is returned
+        without being copied.
+        """
+        assert np is not None, 'NumPy must be installed to get SkyMatrix arrays.'
         if self._direct_values is None:
             self.compute_sky()
         return self._direct_values
 
     @property
-    def diffuse_values(self):
-        """Get the diffuse radiation values for each of the sky patches."""
+    def diffuse_array(self):
+        """Get a NumPy array of the diffuse radiation values for each of the sky patches.
+
+        This is the array in which the values are stored, which is returned
+        without being copied.
+        """
+        assert np is not None, 'NumPy must be installed to get SkyMatrix arrays.'
         if self._diffuse_values is None:
             self.compute_sky()
         return self._diffuse_values
@@ -462,12 +707,233 @@ class SkyMatrix(object):
         The first list contains metadata, followed by direct values and then
         diffuse values.
         """
-        if self._metadata is None:
-            self.compute_sky()
-        return (self._metadata, self._direct_values, self._diffuse_values)
+        direct, diffuse = self._tuple_values()
+        return (self._metadata, direct, diffuse)
+
+    @property
+    def hourly_direct_values(self):
+        """Get a NumPy array of the direct radiation of the sky patches at each time step.
+
+        The array is float32 with one row for each time step of the Wea and one
+        column for each sky patch. Values are in kWh/m2 and they do not account
+        for the benefit_matrix.
+        """
+        if self._hourly_values is None:
+            self.compute_hourly_sky()
+        return self._hourly_values[0]
+
+    @property
+    def hourly_diffuse_values(self):
+        """Get a NumPy array of the diffuse radiation of sky patches at each time step.
+
+        The array is float32 with one row for each time step of the Wea and one
+        column for each sky patch. Values are in kWh/m2 and they do not account
+        for the benefit_matrix.
+        """
+        if self._hourly_values is None:
+            self.compute_hourly_sky()
+        return self._hourly_values[1]
 
     def compute_sky(self):
         """Compute the values of the sky matrix."""
+        assert self._wea is not None, 'SkyMatrix has no Wea and cannot be computed.'
+        # if the time-resolved values have been requested, they are only summed
+        from_hourly = self._hourly_values is not None and \
+            self.benefit_matrix is not None
+        # load the values from the cache if they have been computed before
+        cache, sky_key, entry = None, None, None
+        if self.use_cache and not from_hourly:
+            cache = FileCache(self.cache_folder, SKY_CACHE_SIZE)
+            sky_key = self._cache_key()
+            entry = cache.get(sky_key)
+        cached_values = None
+        if entry is not None:
+            try:
+                cached_values = self._read_cache_entry(entry)
+            except (IOError, OSError, ValueError):  # entry was evicted by another process
+                entry = None
+        if from_hourly:
+            self._direct_values, self._diffuse_values = self._compute_from_hourly()
+        elif cached_values is not None:
+            self._direct_values, self._diffuse_values = cached_values
+        elif self.backend == 'numpy':
+            self._direct_values, self._diffuse_values = self._compute_perez()
+        else:
+            self._direct_values, self._diffuse_values = self._compute_gendaymtx()
+        if np is not None:  # store the values as arrays from which tuples are derived
+            self._direct_values = np.asarray(self._direct_values, dtype=np.float64)
+            self._diffuse_values = np.asarray(self._diffuse_values, dtype=np.float64)
+        if cache is not None and entry is None:  # add the values to the cache
+            staging = cache.stage()
+            self._write_cache_entry(staging)
+            cache.add(sky_key, staging)
+
+        # collect sky metadata like the north, which will be used by other operations
+        metadata = [self.north, self.ground_reflectance]
+        dts = self.wea.direct_normal_irradiance.datetimes
+        metadata.extend([dts[0], dts[-1]])
+        for key, val in self.wea.direct_normal_irradiance.header.metadata.items():
+            metadata.append('{} : {}'.format(key, val))
+        self._metadata = tuple(metadata)
+
+    def compute_hourly_sky(self):
+        """Compute the time-resolved values of the sky matrix.
+
+        This sets the hourly_direct_values and hourly_diffuse_values, from which
+        the cumulative values of any subset of the Wea time steps can be
+        derived with the period_values method.
+        """
+        assert np is not None, 'NumPy must be installed to compute an hourly sky.'
+        assert self._wea is not None, 'SkyMatrix has no Wea and cannot be computed.'
+        if self.backend == 'numpy':
+            direct, diffuse = self._perez_matrices()
+            direct /= self.wea.timestep * 1000  # convert to kWh/m2
+            diffuse /= self.wea.timestep * 1000
+        else:
+            direct, diffuse = self._compute_hourly_gendaymtx()
+        self._hourly_values = (direct.astype(np.float32), diffuse.astype(np.float32))
+        self._hourly_sums = None
+
+    def period_values(self, hoys=None):
+        """Get the cumulative direct and diffuse values for a subset of the time steps.
+
+        Values are derived from the time-resolved sky without recomputing it. They
+        are summed with the prefix sums of the hourly values, so that each
+        contiguous run of time steps within the hoys costs only one subtraction per
+        sky patch. The time steps of the hoys are found with a lookup table that
+        is built along with the prefix sums. This makes it fast to query many
+        periods from one sky.
+
+        Args:
+            hoys: A list of numbers for the hours of the year to be summed. Only
+                the hoys that fall within a time step of the Wea are used, such
+                that the hoys of an AnalysisPeriod can be input here. If None,
+                all time steps of the Wea will be summed. (Default: None).
+
+        Returns:
+            A tuple with two tuples. The first contains the cumulative direct
+            radiation of each sky patch and the second contains the diffuse
+            radiation. Values are weighted with the benefit_matrix if it is set.
+        """
+        if self._hourly_sums is None:
+            self._hourly_sums = self._compute_hourly_sums()
+        dir_sums, dif_sums, step_lookup = self._hourly_sums
+        # group the time steps into contiguous runs of indices
+        if hoys is None:
+            starts, ends = np.array([0]), np.array([len(dir_sums) - 1])
+        else:
+            keys = np.floor(np.asarray(hoys, dtype=np.float64).reshape(-1) *
+                            self.wea.timestep + 1e-6).astype(np.int64)
+            keys = keys[(keys >= 0) & (keys < len(step_lookup))]
+            indices = np.unique(step_lookup[keys])
+            indices = indices[indices >= 0]
+            breaks = np.diff(indices) != 1
+            starts = indices[np.concatenate(([True], breaks))] \
+                if len(indices) != 0 else indices
+            ends = indices[np.concatenate((breaks, [True]))] + 1 \
+                if len(indices) != 0 else indices
+        # sum each run with the prefix sums
+        direct = (dir_sums[ends] - dir_sums[starts]).sum(axis=0)
+        diffuse = (dif_sums[ends] - dif_sums[starts]).sum(axis=0)
+        return tuple(direct.tolist()), tuple(diffuse.tolist())
+
+    def _compute_from_hourly(self):
+        """Compute the direct and diffuse values from the time-resolved values.
+
+        Each time step is weighted by +1, 0 or -1 from the benefit_matrix and all
+        of them are summed in one pass. This is only used when the hourly values
+        have already been computed, which avoids running gendaymtx again when
+        the benefit_matrix changes.
+        """
+        weights = self._benefit_weights()
+        return np.dot(weights, self.hourly_direct_values), \
+            np.dot(weights, self.hourly_diffuse_values)
+
+    def _compute_hourly_sums(self):
+        """Get float64 prefix sums of the hourly values weighted by benefit_matrix.
+
+        The prefix sums are returned along with a lookup array, which gives the
+        index of the time step for each whole timestep of the year (the hoy
+        multiplied by the timestep) or -1 if the Wea has no such time step.
+        """
+        weights = self._benefit_weights()[:, None]
+        sums = []
+        for values in (self.hourly_direct_values, self.hourly_diffuse_values):
+            prefix = np.zeros((len(values) + 1, values.shape[1]))
+            np.cumsum(values * weights, axis=0, out=prefix[1:])
+            sums.append(prefix)
+        keys = np.floor(np.array(self.wea.hoys, dtype=np.float64) *
+                        self.wea.timestep + 1e-6).astype(np.int64)
+        step_lookup = np.full(int(keys.max()) + 1 if len(keys) else 0, -1, np.int64)
+        step_lookup[keys] = np.arange(len(keys))
+        sums.append(step_lookup)
+        return tuple(sums)
+
+    def _benefit_weights(self):
+        """Get an array to weight harmful time steps negatively and neutral ones as 0.
+        """
+        if self.benefit_matrix is not None:
+            return np.array([0 if ben is None else (1 if ben else -1)
+                             for ben in self.benefit_matrix], dtype=np.float64)
+        return np.ones(len(self.wea))
+
+    def _tuple_values(self):
+        """Get tuples of the direct and diffuse values, which are derived lazily."""
+        if self._direct_values is None:
+            self.compute_sky()
+        if np is None:
+            return self._direct_values, self._diffuse_values
+        if self._value_tuples is None or \
+                self._value_tuples[0] is not self._direct_values:
+            self._value_tuples = (
+                self._direct_values, tuple(self._direct_values.tolist()),
+                tuple(self._diffuse_values.tolist()))
+        return self._value_tuples[1:]
+
+    def _cache_key(self):
+        """Get a hash of all inputs that affect the direct and diffuse values."""
+        loc = self.wea.location
+        benefit = tuple(self.benefit_matrix) if self.benefit_matrix is not None \
+            else None
+        return hash_values(
+            SKY_CACHE_VERSION, self.backend, self.high_density,
+            (loc.latitude, loc.longitude, loc.time_zone, loc.elevation),
+            self.wea.timestep, self.wea.is_leap_year, tuple(self.wea.hoys),
+            tuple(self.wea.direct_normal_irradiance.values),
+            tuple(self.wea.diffuse_horizontal_irradiance.values), benefit)
+
+    def _write_cache_entry(self, entry_folder):
+        """Write the direct and diffuse values to a folder of the sky cache."""
+        with open(os.path.join(entry_folder, 'sky.txt'), 'w') as f:
+            for values in (self._direct_values, self._diffuse_values):
+                f.write(','.join(repr(float(v)) for v in values) + '\n')
+
+    @staticmethod
+    def _read_cache_entry(entry_folder):
+        """Read the direct and diffuse values from a folder of the sky cache."""
+        with open(os.path.join(entry_folder, 'sky.txt')) as f:
+            lines = f.read().split('\n')
+        return tuple(tuple(float(v) for v in line.split(',')) for line in lines[:2])
+
+    def _compute_perez(self):
+        """Compute the direct and diffuse values of the sky patches with NumPy."""
+        direct, diffuse = self._perez_matrices()
+        # sum the time steps, weighting harmful ones negatively and neutral ones as 0
+        weights = self._benefit_weights()
+        weights /= self.wea.timestep * 1000  # convert to cumulative kWh/m2
+        return np.dot(weights, direct), np.dot(weights, diffuse)
+
+    def _perez_matrices(self):
+        """Get arrays of the Perez sky in W/m2 for each time step and sky patch."""
+        loc, dts = self.wea.location, self.wea.datetimes
+        return perez_sky_matrix(
+            loc.latitude, loc.longitude, loc.time_zone,
+            [dt.month for dt in dts], [dt.day for dt in dts],
+            [dt.float_hour for dt in dts], self.wea.direct_normal_irradiance.values,
+            self.wea.diffuse_horizontal_irradiance.values, self.high_density)
+
+    def _compute_gendaymtx(self):
+        """Compute the direct and diffuse values of the sky patches with gendaymtx."""
         # extract metadata needed for all calculations
         wea_duration = len(self.wea) / self.wea.timestep
         metd = self.wea.direct_normal_irradiance.header.metadata
@@ -520,57 +986,84 @@ class SkyMatrix(object):
             wea_file2 = None
 
         # execute the Radiance gendaymtx command
-        dir_vals, dif_vals = self._run_gendaymtx(wea_file, wea_duration)
+        if wea_file2 is None:
+            return self._run_gendaymtx([wea_file], wea_duration)[0]
         # if there's a second wea, then use it to compute radiation harm
-        if wea_file2 is not None:
-            dir_vals2, dif_vals2 = self._run_gendaymtx(wea_file2, wea_duration)
-            self._direct_values = tuple(db - dh for db, dh in zip(dir_vals, dir_vals2))
-            self._diffuse_values = tuple(db - dh for db, dh in zip(dif_vals, dif_vals2))
-        else:
-            self._direct_values = dir_vals
-            self._diffuse_values = dif_vals
+        (dir_vals, dif_vals), (dir_vals2, dif_vals2) = \
+            self._run_gendaymtx([wea_file, wea_file2], wea_duration)
+        dir_vals = tuple(db - dh for db, dh in zip(dir_vals, dir_vals2))
+        dif_vals = tuple(db - dh for db, dh in zip(dif_vals, dif_vals2))
+        return dir_vals, dif_vals
+
+    def _compute_hourly_gendaymtx(self):
+        """Compute arrays of the sky patch values at each time step with gendaymtx."""
+        metd = self.wea.direct_normal_irradiance.header.metadata
+        wea_basename = metd['city'].replace(' ', '_') if 'city' in metd else 'unnamed'
+        wea_file = self.wea.write(os.path.join(self.folder, wea_basename))
+        # each column of the output is the average of one time step
+        dir_vals, dif_vals = self._run_gendaymtx(
+            [wea_file], 1 / self.wea.timestep, cumulative=False)[0]
+        return dir_vals.T, dif_vals.T
 
-        # collect sky metadata like the north, which will be used by other operations
-        metadata = [self.north, self.ground_reflectance]
-        dts = self.wea.direct_normal_irradiance.datetimes
-        metadata.extend([dts[0], dts[-1]])
-        for key, val in self.wea.direct_normal_irradiance.header.metadata.items():
-            metadata.append('{} : {}'.format(key, val))
-        self._metadata = tuple(metadata)
+    def _run_gendaymtx(self, wea_files, wea_duration, cumulative=True):
+        """Run Wea files through gendaymtx and get direct and diffuse radiation.
 
-    def _run_gendaymtx(self, wea_file, wea_duration):
-        """Run a Wea file through gendaymtx and get direct and diffuse radiation.
+        All of the gendaymtx commands (a direct and a diffuse one for each Wea)
+        are launched together as concurrent processes and the output of each
+        process is read by its own thread such that no process waits on a full
+        output pipe. So the wall time is close to that of a single gendaymtx run.
 
         Args:
-            wea_file: Path to a Wea file to be run through gendaymtx.
+            wea_files: A list of paths to Wea files to be run through gendaymtx.
             wea_duration: Number for the duration of the Wea in hours. This is used
                 to convert between the average value output by the command and the
                 cumulative value that is needed for all ladybug analyses.
+            cumulative: A boolean to note whether the values of all time steps
+                of the Wea should be averaged into one value per patch (True) or
+                output as a NumPy array with one column for each time step (False),
+                which requires NumPy. (Default: True).
+
+        Returns:
+            A list with a tuple of direct and diffuse values for each Wea file.
         """
         assert GENDAYMTX_EXE is not None, 'No Radiance installation was found.'
         density = 2 if self.high_density else 1
         use_shell = True if os.name == 'nt' else False
-        # command for direct patches
-        cmds = [GENDAYMTX_EXE, '-m', str(density), '-d', '-O1', '-A', wea_file]
-        process = subprocess.Popen(cmds, stdout=subprocess.PIPE, shell=use_shell)
-        stdout = process.communicate()
-        dir_data_str = stdout[0]
-        # command for diffuse patches
-        cmds = [GENDAYMTX_EXE, '-m', str(density), '-s', '-O1', '-A', wea_file]
-        process = subprocess.Popen(cmds, stdout=subprocess.PIPE, shell=use_shell)
-        stdout = process.communicate()
-        diff_data_str = stdout[0]
-        # parse the data into a single matrix
-        dir_vals = self._parse_mtx_data(dir_data_str, wea_duration, density)
-        diff_vals = self._parse_mtx_data(diff_data_str, wea_duration, density)
-        return dir_vals, diff_vals
+        # request binary float output for time steps since it is fast to parse
+        if cumulative:
+            out_fmt, parse_func = ['-A'], self._parse_mtx_data
+        else:
+            out_fmt, parse_func = ['-of'], self._binary_mtx_array
+        # launch the commands for direct and diffuse patches of every Wea
+        processes = []
+        for wea_file in wea_files:
+            for comp in ('-d', '-s'):
+                cmds = [GENDAYMTX_EXE, '-m', str(density), comp, '-O1'] + \
+                    out_fmt + [wea_file]
+                processes.append(
+                    subprocess.Popen(cmds, stdout=subprocess.PIPE, shell=use_shell))
+        # collect the outputs of all processes at once and parse them into matrices
+        data_strs = [None] * len(processes)
+
+        def _collect(i):
+            data_strs[i] = processes[i].communicate()[0]
+        run_in_threads(_collect, [(i,) for i in range(len(processes))], len(processes))
+        sky_vals = []
+        for dir_data_str, diff_data_str in zip(data_strs[::2], data_strs[1::2]):
+            dir_vals = parse_func(dir_data_str, wea_duration, density)
+            diff_vals = parse_func(diff_data_str, wea_duration, density)
+            sky_vals.append((dir_vals, diff_vals))
+        return sky_vals
 
     def _parse_mtx_data(self, data_str, wea_duration, sky_density=1):
         """Parse a string of Radiance gendaymtx data to a list of radiation-per-patch.
 
         This function handles the removing of the header and the conversion of the
         RGB irradiance=per-steradian values to broadband radiation. It also removes
-        the first patch, which is the ground and is not used by Ladybug.
+        the first patch, which is the ground and is not used by Ladybug. When
+        NumPy is installed, all patches are converted at once with the same
+        order of operations as _broadband_radiation, which gives the exact
+        same values.
 
         Args:
             data_str: The string that has been output by gendaymtx to stdout.
@@ -579,9 +1072,15 @@ class SkyMatrix(object):
                 cumulative value that is needed for all ladybug analyses.
             sky_density: Integer (either 1 or 2) for the density.
         """
+        if np is not None:
+            return tuple(self._ascii_mtx_array(
+                data_str, wea_duration, sky_density)[:, 0].tolist())
+
         # split lines and remove the header, ground patch and last line break
+        # the header ends with an empty line and its length varies between versions
         data_lines = data_str.split(self.LINE_BREAK)
-        patch_lines = data_lines[9:-1]
+        header_end = data_lines.index(self.LINE_BREAK[:0])
+        patch_lines = data_lines[header_end + 2:-1]
 
         # loop through the rows and convert the radiation RGB values
         broadband_irr = []
@@ -594,6 +1093,76 @@ class SkyMatrix(object):
             patch_counter += row_patch_count
         return tuple(broadband_irr)
 
+    def _ascii_mtx_array(self, data_str, wea_duration, sky_density=1):
+        """Parse ASCII gendaymtx data to a NumPy array of radiation.
+
+        Args:
+            data_str: The string that has been output by gendaymtx to stdout.
+            wea_duration: Number for the duration in hours of each column of the
+                matrix, which converts the average values to radiation.
+            sky_density: Integer (either 1 or 2) for the density.
+
+        Returns:
+            A float64 array with one row for each sky patch (excluding the ground)
+            and one column for each column of the gendaymtx output.
+        """
+        header_end = data_str.index(self.LINE_BREAK * 2) + 2
+        rgb = np.array(data_str[header_end:].split(), dtype=np.float64)
+        return self._rgb_radiation(rgb, wea_duration, sky_density)
+
+    def _binary_mtx_array(self, data_str, wea_duration, sky_density=1):
+        """Parse binary float gendaymtx data to a NumPy array of radiation.
+
+        This is used for the output of gendaymtx with the -of option, which is much
+        faster to parse than ASCII output when there are many time steps. The
+        float32 values are more precise than the three significant digits of
+        the ASCII output and so the results differ from it by up to 0.5%.
+
+        Args:
+            data_str: The bytes that have been output by gendaymtx to stdout.
+            wea_duration: Number for the duration in hours of each column of the
+                matrix, which converts the average values to radiation.
+            sky_density: Integer (either 1 or 2) for the density.
+
+        Returns:
+            A float64 array with one row for each sky patch (excluding the ground)
+            and one column for each column of the gendaymtx output.
+        """
+        # split the header from the data and get the byte order of the floats
+        header_end = data_str.index(b'\n\n') + 2
+        header = data_str[:header_end]
+        if b'BYTEORDER=BigEndian' in header:
+            dtype = '>f4'
+        elif b'BYTEORDER=LittleEndian' in header:
+            dtype = '<f4'
+        else:
+            dtype = '=f4'
+        rgb = np.frombuffer(data_str, dtype=dtype, offset=header_end)
+        return self._rgb_radiation(rgb.astype(np.float64), wea_duration, sky_density)
+
+    def _rgb_radiation(self, rgb, wea_duration, sky_density=1):
+        """Convert a flat array of gendaymtx RGB values to an array of radiation.
+
+        This is the NumPy equivalent of _broadband_radiation for all patches and
+        columns at once, with the same order of operations such that the same
+        RGB values result in the exact same radiation values.
+
+        Args:
+            rgb: A flat float64 array of the RGB values of each patch (including
+                the ground) and column of the gendaymtx output.
+            wea_duration: Number for the duration in hours of each column of the
+                matrix, which converts the average values to radiation.
+            sky_density: Integer (either 1 or 2) for the density.
+        """
+        # remove the ground patch and convert the radiation RGB values
+        patch_count = sum(self.PATCHES_PER_ROW[sky_density]) + 1
+        rgb = rgb.reshape(patch_count, -1, 3)[1:]
+        w_val = 0.265074126 * rgb[:, :, 0] + 0.670114631 * rgb[:, :, 1] + \
+            0.064811243 * rgb[:, :, 2]
+        coeff = np.repeat(self.PATCH_ROW_COEFF[sky_density],
+                          self.PATCHES_PER_ROW[sky_density])
+        return w_val * coeff[:, None] * wea_duration / 1000
+
     def _broadband_radiation(
             self, patch_row_str, row_number, wea_duration, sky_density=1):
         """Parse a row of gendaymtx RGB patch data in W/sr/m2 to radiation in kWh/m2.
@@ -615,6 +1184,28 @@ class SkyMatrix(object):
         coeff = self.PATCH_ROW_COEFF[sky_density][row_number]
         return w_val * coeff * wea_duration / 1000
 
+    def to_bytes(self):
+        """Get the computed sky matrix as compact bytes.
+
+        The bytes contain the metadata, north, density, ground reflectance,
+        benefit_matrix and the direct and diffuse values as float32 but not the
+        Wea. They can be loaded with the from_bytes method.
+        """
+        metadata, direct, diffuse = self.data
+        header = {
+            'version': 1, 'north': self.north, 'high_density': self.high_density,
+            'ground_reflectance': self.ground_reflectance, 'backend': self.backend,
+            'wea_duration': self.wea_duration,
+            'metadata': list(metadata[:2]) +
+            [list(dt.to_array()) for dt in metadata[2:4]] + list(metadata[4:])
+        }
+        arrays = {'direct': ('<f4', direct), 'diffuse': ('<f4', diffuse)}
+        if self.benefit_matrix is not None:
+            benefit = [0 if ben is None else (1 if ben else -1)
+                       for ben in self.benefit_matrix]
+            arrays['benefit'] = ('<i1', benefit)
+        return to_container('SkyMatrix', header, arrays)
+
     def ToString(self):
         """Overwrite .NET ToString."""
         return self.__repr__()
@@ -625,15 +1216,42 @@ class SkyMatrix(object):
         return len(self._direct_values)
 
     def __getitem__(self, key):
-        if self._direct_values is None:
-            self.compute_sky()
-        return self._direct_values[key], self._diffuse_values[key]
+        direct, diffuse = self._tuple_values()
+        return direct[key], diffuse[key]
 
     def __iter__(self):
-        if self._direct_values is None:
-            self.compute_sky()
-        return zip(self._direct_values, self._diffuse_values)
+        return zip(*self._tuple_values())
 
     def __repr__(self):
         """Sky Matrix object representation."""
+        if self._wea is None:
+            cities = [m[7:] for m in self._metadata[4:] if m.startswith('city : ')]
+            return "SkyMatrix [%s]" % (cities[0] if cities else 'unnamed')
         return "SkyMatrix [%s]" % self.wea.location.city
+
+
+def _batch_sky_from_epw(arguments):
+    """Compute a SkyMatrix from an epw file as part of SkyMatrix.batch_from_epw."""
+    epw_file, hoys, north, high_density, ground_reflectance, backend, \
+        balance_temperature, balance_offset, folder, use_cache = arguments
+    if balance_temperature is None:
+        sky = SkyMatrix.from_epw(
+            epw_file, hoys, north, high_density, ground_reflectance)
+    else:
+        sky = SkyMatrix.from_epw_benefit(
+            epw_file, balance_temperature, balance_offset, hoys, north,
+            high_density, ground_reflectance)
+    sky.backend = backend
+    sky.use_cache = use_cache
+    # share the cache but write Wea files to a folder of the task to avoid clashes
+    sky.cache_folder = os.path.join(sky.folder if folder is None else folder, 'sky_cache')
+    if sky.backend == 'radiance':
+        sky.folder = tempfile.mkdtemp(prefix='sky_', dir=folder)
+        try:
+            sky.compute_sky()
+        finally:
+            shutil.rmtree(sky.folder, ignore_errors=True)
+    else:
+        sky.compute_sky()
+    sky.folder = folder
+    return epw_file, sky
@@ -14,7 +14,10 @@ from ladybug.graphic import GraphicContainer
 from ladybug.legend import LegendParameters
 from ladybug.color import Colorset
 
-from ..intersection import intersection_matrix
+from ..intersection import MATRIX_FORMATS, intersection_matrix, \
+    update_intersection_matrix, cluster_vectors
+from ..binary import to_container, from_container, matrix_to_arrays, \
+    matrix_from_arrays, mesh_to_arrays, mesh_from_arrays
 
 
 class DirectSunStudy(object):
@@ -48,6 +51,35 @@ class DirectSunStudy(object):
             their faces translated to Radiance polygons. For complex context geometry,
             Radiance meshes will use less memory but they take a longer time
             to prepare compared to polygons. (Default: False).
+        matrix_format: Text for the format in which the intersection matrix is
+            stored when NumPy is installed. Choose from the following.
+            (Default: dense).
+
+            * dense - a NumPy array of booleans
+            * packed - a PackedBoolMatrix, which uses 8 times less memory
+            * sparse - a SparseMatrix, which stores only the vectors that are seen
+            * auto - a SparseMatrix or a dense NumPy array depending on the
+              fraction of vectors that are seen
+        incremental: A boolean to note whether the intersection matrix should be
+            updated when the context_geometry is changed (True) instead of being
+            computed again for all sensors (False). When True, only the rays that
+            pass through the bounding boxes of the added and removed geometry
+            are traced again. (Default: False).
+        angular_tolerance: A number for the maximum angle in degrees between sun
+            vectors that are clustered together and traced as a single vector.
+            This can greatly reduce the number of traced vectors for sun vectors
+            at sub-hourly timesteps or over several years, which include many
+            nearly identical directions. The hours of each cluster are counted
+            for each of its vectors. If 0, the vectors are not clustered and
+            each of them is traced. (Default: 0).
+        matrix_cache: An optional path to a folder where the intersection matrix
+            is stored for use by later studies, including those run in other
+            processes, with the same sensors, context_geometry, sun vectors and
+            options that affect the matrix. Studies that find their matrix in
+            this folder load it without tracing any rays. The least recently
+            used matrices are deleted once the folder exceeds MATRIX_CACHE_SIZE
+            of the intersection module. If None, the matrix is traced for
+            every new study. (Default: None).
 
     Properties:
         * vectors
@@ -58,23 +90,37 @@ class DirectSunStudy(object):
         * by_vertex
         * sim_folder
         * use_radiance_mesh
+        * matrix_format
+        * incremental
+        * angular_tolerance
+        * max_angular_error
+        * cluster_ids
+        * matrix_cache
         * study_points
         * study_normals
         * intersection_matrix
+        * cluster_matrix
         * direct_sun_hours
+        * direct_sun_hours_array
     """
     __slots__ = (
         '_vectors', '_timestep', '_study_mesh', '_context_geometry',
         '_offset_distance', '_by_vertex', '_study_points', '_study_normals',
-        '_sim_folder', '_use_radiance_mesh', '_intersection_matrix', '_direct_sun_hours')
+        '_sim_folder', '_use_radiance_mesh', '_matrix_format', '_incremental',
+        '_matrix_cache', '_angular_tolerance', '_vector_clusters',
+        '_intersection_matrix', '_matrix_context', '_expanded_matrix',
+        '_direct_sun_hours', '_sun_hours_list')
 
     def __init__(
             self, vectors, study_mesh, context_geometry, timestep=1,
-            offset_distance=0, by_vertex=False, sim_folder=None, use_radiance_mesh=False):
+            offset_distance=0, by_vertex=False, sim_folder=None, use_radiance_mesh=False,
+            matrix_format='dense', incremental=False, angular_tolerance=0,
+            matrix_cache=None):
         """Initialize RadiationDome."""
         # set default values, which will be overwritten when the study is run
         self._offset_distance = float(offset_distance)
         self._by_vertex = bool(by_vertex)
+        self._incremental = bool(incremental)
         # set the key properties of the object
         self.vectors = vectors
         self.timestep = timestep
@@ -82,9 +128,43 @@ class DirectSunStudy(object):
         self.context_geometry = context_geometry
         self.sim_folder = sim_folder
         self.use_radiance_mesh = use_radiance_mesh
+        self.matrix_format = matrix_format
+        self.matrix_cache = matrix_cache
+        self.angular_tolerance = angular_tolerance
         # set default values, which will be overwritten when the study is run
         self._intersection_matrix = None
+        self._matrix_context = None
+        self._expanded_matrix = None
         self._direct_sun_hours = None
+        self._sun_hours_list = None
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Create a computed DirectSunStudy from bytes output by the to_bytes method.
+
+        The intersection matrix of the study is loaded as a view of the input
+        data without copying it when NumPy is installed, which is read-only if
+        the data is immutable bytes. The study has no context_geometry since its
+        effect is already captured by the intersection_matrix.
+
+        Args:
+            data: The bytes (or a bytearray) output by the to_bytes method.
+        """
+        header, arrays = from_container(data, 'DirectSunStudy')
+        to_list = (lambda a: a.tolist()) if np is not None else list
+        vectors = tuple(Vector3D(*v) for v in to_list(arrays['vectors']))
+        study = cls(
+            vectors, mesh_from_arrays(arrays), (), header['timestep'],
+            header['offset_distance'], header['by_vertex'], None,
+            header['use_radiance_mesh'], header['matrix_format'],
+            header['incremental'], header['angular_tolerance'])
+        cl_vecs = tuple(Vector3D(*v) for v in to_list(arrays['cluster_vectors']))
+        study._vector_clusters = \
+            (cl_vecs, to_list(arrays['cluster_ids']), header['max_angular_error'])
+        study._intersection_matrix = matrix_from_arrays(header['matrix'], arrays)
+        study._matrix_context = study._context_geometry
+        study._direct_sun_hours = arrays['direct_sun_hours']
+        return study
 
     @property
     def vectors(self):
@@ -103,6 +183,7 @@ class DirectSunStudy(object):
             assert isinstance(geo, Vector3D), 'Expected Vector3D for ' \
                 'DirectSunStudy vectors. Got {}.'.format(type(geo))
         self._vectors = value
+        self._vector_clusters = None
         self._intersection_matrix = None
         self._direct_sun_hours = None
 
@@ -148,7 +229,8 @@ class DirectSunStudy(object):
             assert isinstance(geo, (Face3D, Mesh3D)), 'Expected Face3D or Mesh3D for ' \
                 'DirectSunStudy context_geometry. Got {}.'.format(type(geo))
         self._context_geometry = value
-        self._intersection_matrix = None
+        if not self._incremental:
+            self._intersection_matrix = None
         self._direct_sun_hours = None
 
     @property
@@ -195,6 +277,77 @@ class DirectSunStudy(object):
     def use_radiance_mesh(self, value):
         self._use_radiance_mesh = bool(value)
 
+    @property
+    def matrix_format(self):
+        """Get or set text for the format in which the intersection matrix is stored.
+        """
+        return self._matrix_format
+
+    @matrix_format.setter
+    def matrix_format(self, value):
+        assert value in MATRIX_FORMATS, 'Expected one of {} for DirectSunStudy ' \
+            'matrix_format. Got {}.'.format(', '.join(MATRIX_FORMATS), value)
+        self._matrix_format = value
+        self._intersection_matrix = None
+        self._direct_sun_hours = None
+
+    @property
+    def incremental(self):
+        """Get or set a boolean for whether context changes update the matrix in place.
+        """
+        return self._incremental
+
+    @incremental.setter
+    def incremental(self, value):
+        self._incremental = bool(value)
+
+    @property
+    def angular_tolerance(self):
+        """Get or set a number for the maximum angle between clustered sun vectors.
+        """
+        return self._angular_tolerance
+
+    @angular_tolerance.setter
+    def angular_tolerance(self, value):
+        assert isinstance(value, (float, int)), 'Expected number for ' \
+            'DirectSunStudy angular_tolerance. Got {}.'.format(type(value))
+        assert value >= 0, 'DirectSunStudy angular_tolerance must be greater ' \
+            'than or equal to 0. Got {}.'.format(value)
+        self._angular_tolerance = value
+        self._vector_clusters = None
+        self._intersection_matrix = None
+        self._direct_sun_hours = None
+
+    @property
+    def max_angular_error(self):
+        """Get a number for the maximum angle between a sun vector and its cluster.
+
+        This is the largest angle in degrees between any of the input vectors
+        and the vector that was traced in its place.
+        """
+        return self._clusters()[2]
+
+    @property
+    def cluster_ids(self):
+        """Get a list of integers for the cluster that each of the vectors belongs to.
+
+        Each integer is the index of the column of the cluster_matrix that is
+        used for the vector.
+        """
+        return self._clusters()[1]
+
+    @property
+    def matrix_cache(self):
+        """Get or set text for the path where intersection matrices are cached."""
+        return self._matrix_cache
+
+    @matrix_cache.setter
+    def matrix_cache(self, value):
+        if value is not None:
+            assert isinstance(value, str), 'Expected file path string for ' \
+                'matrix_cache. Got {}.'.format(type(value))
+        self._matrix_cache = value
+
     @property
     def study_points(self):
         """Get a tuple of Point3Ds for the points of the study."""
@@ -207,14 +360,63 @@ class DirectSunStudy(object):
 
     @property
     def intersection_matrix(self):
-        """Get a list of lists for the intersection matrix computed by the study."""
-        if self._intersection_matrix is None:
+        """Get a list of lists for the intersection matrix computed by the study.
+
+        The matrix has one column for each of the input vectors, which is the
+        column of the cluster that the vector belongs to. When vectors are
+        clustered, this matrix is expanded from the cluster_matrix the first
+        time it is requested and it is kept along with the cluster_matrix.
+        The cluster_matrix and cluster_ids can be used instead in order to
+        avoid the memory of the expanded matrix.
+        """
+        int_mtx = self.cluster_matrix
+        cl_vecs, cluster_ids, _ = self._clusters()
+        if len(cl_vecs) == len(self._vectors):  # no vectors were clustered
+            return int_mtx
+        if self._expanded_matrix is None or self._expanded_matrix[0] is not int_mtx:
+            if isinstance(int_mtx, list):
+                exp_mtx = [[row[i] for i in cluster_ids] for row in int_mtx]
+            elif np is not None and isinstance(int_mtx, np.ndarray):
+                exp_mtx = int_mtx[:, cluster_ids]
+            else:
+                exp_mtx = int_mtx.take_columns(cluster_ids)
+            self._expanded_matrix = (int_mtx, exp_mtx)
+        return self._expanded_matrix[1]
+
+    @property
+    def cluster_matrix(self):
+        """Get the intersection matrix of the clustered vectors computed by the study.
+
+        The matrix has one column for each cluster of vectors, which is the
+        matrix that is traced and stored by the study. The cluster_ids note
+        the column used for each of the input vectors.
+        """
+        if self._intersection_matrix is None or \
+                self._matrix_context is not self._context_geometry:
             self._compute_intersection_matrix()
         return self._intersection_matrix
 
     @property
     def direct_sun_hours(self):
         """Get a list of values for the number of hours falling on the study_mesh."""
+        if self._direct_sun_hours is None:
+            self.compute()
+        if np is None:
+            return self._direct_sun_hours
+        if self._sun_hours_list is None or \
+                self._sun_hours_list[0] is not self._direct_sun_hours:
+            self._sun_hours_list = \
+                (self._direct_sun_hours, self._direct_sun_hours.tolist())
+        return self._sun_hours_list[1]
+
+    @property
+    def direct_sun_hours_array(self):
+        """Get a NumPy array of the number of hours falling on the study_mesh.
+
+        This is the array in which the results are stored, which is returned
+        without being copied.
+        """
+        assert np is not None, 'NumPy must be installed to get DirectSunStudy arrays.'
         if self._direct_sun_hours is None:
             self.compute()
         return self._direct_sun_hours
@@ -229,16 +431,26 @@ class DirectSunStudy(object):
         part of the study runs, which is particularly helpful for larger studies.
         """
         # compute the intersection matrix
-        if self._intersection_matrix is None:
+        if self._intersection_matrix is None or \
+                self._matrix_context is not self._context_geometry:
             self._compute_intersection_matrix()
-        # sum the intersection and sky matrices
+        # sum the intersection matrix, counting each cluster once for each vector
         t_step = self.timestep
+        cl_vecs, cluster_ids, _ = self._clusters()
+        counts = [0] * len(cl_vecs)
+        for c_id in cluster_ids:
+            counts[c_id] += 1
         if np is None:  # perform the calculation on float numbers
-            self._direct_sun_hours = \
-                [sum(int_list) / t_step for int_list in self._intersection_matrix]
+            self._direct_sun_hours = [
+                sum(c for v, c in zip(int_list, counts) if v) / t_step
+                for int_list in self._intersection_matrix]
+        elif len(cl_vecs) == len(self._vectors):  # no vectors were clustered
+            self._direct_sun_hours = np.asarray(
+                self._intersection_matrix.sum(axis=1) / t_step, dtype=np.float64)
         else:  # perform the calculation with numpy matrices
-            self._direct_sun_hours = \
-                (self._intersection_matrix.sum(axis=1) / t_step).tolist()
+            self._direct_sun_hours = np.asarray(
+                self._intersection_matrix.dot(np.array(counts)) / t_step,
+                dtype=np.float64)
 
     def draw(self, legend_parameters=None):
         """Draw a colored study_mesh, compass, graphic/legend, and title.
@@ -281,6 +493,32 @@ class DirectSunStudy(object):
 
         return colored_mesh, graphic, title
 
+    def to_bytes(self):
+        """Get the computed study as compact bytes.
+
+        The bytes contain the vectors, the study_mesh, the settings of the study,
+        the intersection_matrix and the direct_sun_hours but not the
+        context_geometry. They can be loaded with the from_bytes method.
+        """
+        if self._direct_sun_hours is None:
+            self.compute()
+        cl_vecs, cl_ids, max_error = self._clusters()
+        mtx_header, arrays = matrix_to_arrays(self._intersection_matrix)
+        header = {
+            'version': 1, 'timestep': self.timestep,
+            'offset_distance': self.offset_distance, 'by_vertex': self.by_vertex,
+            'use_radiance_mesh': self.use_radiance_mesh,
+            'matrix_format': self.matrix_format, 'incremental': self.incremental,
+            'angular_tolerance': self.angular_tolerance,
+            'max_angular_error': max_error, 'matrix': mtx_header
+        }
+        arrays.update(mesh_to_arrays(self.study_mesh))
+        arrays['vectors'] = ('<f8', [v.to_array() for v in self.vectors])
+        arrays['cluster_vectors'] = ('<f8', [v.to_array() for v in cl_vecs])
+        arrays['cluster_ids'] = ('<i4', cl_ids)
+        arrays['direct_sun_hours'] = ('<f8', self._direct_sun_hours)
+        return to_container('DirectSunStudy', header, arrays)
+
     def _reset_points(self):
         """Reset the study points and normals used in the study."""
         points = self._study_mesh.vertices if self._by_vertex else \
@@ -295,13 +533,34 @@ class DirectSunStudy(object):
         self._intersection_matrix = None
         self._direct_sun_hours = None
 
+    def _clusters(self):
+        """Get the clusters of the vectors used to compute the intersection matrix."""
+        if self._vector_clusters is None:
+            if self._angular_tolerance == 0:  # trace each of the vectors
+                self._vector_clusters = \
+                    (self._vectors, list(range(len(self._vectors))), 0)
+            else:
+                self._vector_clusters = \
+                    cluster_vectors(self._vectors, self._angular_tolerance)
+        return self._vector_clusters
+
     def _compute_intersection_matrix(self):
-        """Compute intersection matrix."""
-        rev_vecs = [v.reverse() for v in self.vectors]
-        self._intersection_matrix = intersection_matrix(
-            rev_vecs, self.study_points, self.study_normals,
-            self.context_geometry, self.offset_distance, numericalize=False,
-            sim_folder=self.sim_folder, use_radiance_mesh=self.use_radiance_mesh)
+        """Compute intersection matrix or update it for a change in context geometry."""
+        rev_vecs = [v.reverse() for v in self._clusters()[0]]
+        if self._intersection_matrix is not None and self._incremental:
+            self._intersection_matrix = update_intersection_matrix(
+                self._intersection_matrix, rev_vecs, self.study_points,
+                self.study_normals, self._matrix_context, self.context_geometry,
+                self.offset_distance, numericalize=False, sim_folder=self.sim_folder,
+                use_radiance_mesh=self.use_radiance_mesh)
+        else:
+            self._intersection_matrix = intersection_matrix(
+                rev_vecs, self.study_points, self.study_normals,
+                self.context_geometry, self.offset_distance, numericalize=False,
+                sim_folder=self.sim_folder, use_radiance_mesh=self.use_radiance_mesh,
+                matrix_format=self.matrix_format, matrix_cache=self.matrix_cache)
+        self._matrix_context = self.context_geometry
+        self._expanded_matrix = None  # incremental updates change the matrix in place
 
     def ToString(self):
         """Overwrite .NET ToString."""
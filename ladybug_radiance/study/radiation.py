@@ -15,7 +15,11 @@ from ladybug.graphic import GraphicContainer
 from ladybug.legend import LegendParameters
 from ladybug.color import Colorset
 
-from ..intersection import sky_intersection_matrix
+from ..intersection import MATRIX_FORMATS, sky_intersection_matrix, sky_vectors, \
+    update_intersection_matrix
+from ..binary import to_container, from_container, matrix_to_arrays, \
+    matrix_from_arrays, mesh_to_arrays, mesh_from_arrays
+from ..skymatrix import SkyMatrix
 
 
 class RadiationStudy(object):
@@ -55,6 +59,31 @@ class RadiationStudy(object):
             their faces translated to Radiance polygons. For complex context geometry,
             Radiance meshes will use less memory but they take a longer time
             to prepare compared to polygons. (Default: False).
+        matrix_format: Text for the format in which the intersection matrix is
+            stored when NumPy is installed. Choose from the following.
+            (Default: dense).
+
+            * dense - a NumPy array of the cosine between each normal and vector
+            * packed - a PackedBoolMatrix of whether each vector is seen, which
+              uses 64 times less memory and is weighted by the cosines during
+              the calculation of the radiation values
+            * sparse - a SparseMatrix of the cosines, which stores only the
+              patches that are seen and is best for heavily obstructed sensors
+            * auto - a SparseMatrix or a dense NumPy array depending on the
+              fraction of patches that are seen
+        incremental: A boolean to note whether the intersection matrix should be
+            updated when the context_geometry is changed (True) instead of being
+            computed again for all sensors (False). When True, only the rays that
+            pass through the bounding boxes of the added and removed geometry
+            are traced again. (Default: False).
+        matrix_cache: An optional path to a folder where the intersection matrix
+            is stored for use by later studies, including those run in other
+            processes, with the same sensors, context_geometry, sky patches and
+            options that affect the matrix. Studies that find their matrix in
+            this folder load it without tracing any rays. The least recently
+            used matrices are deleted once the folder exceeds MATRIX_CACHE_SIZE
+            of the intersection module. If None, the matrix is traced for
+            every new study. (Default: None).
 
     Properties:
         * sky_matrix
@@ -64,35 +93,71 @@ class RadiationStudy(object):
         * by_vertex
         * sim_folder
         * use_radiance_mesh
+        * matrix_format
+        * incremental
+        * matrix_cache
         * study_points
         * study_normals
         * intersection_matrix
         * radiation_values
         * irradiance_values
+        * radiation_array
+        * irradiance_array
         * metadata
         * is_benefit
     """
     __slots__ = (
         '_metadata', '_is_benefit', '_sky_matrix', '_study_mesh', '_context_geometry',
         '_offset_distance', '_by_vertex', '_study_points', '_study_normals',
-        '_sim_folder', '_use_radiance_mesh', '_intersection_matrix', '_radiation_values')
+        '_sim_folder', '_use_radiance_mesh', '_matrix_format', '_incremental',
+        '_matrix_cache', '_intersection_matrix', '_matrix_context',
+        '_radiation_values', '_radiation_list')
 
     def __init__(
             self, sky_matrix, study_mesh, context_geometry,
-            offset_distance=0, by_vertex=False, sim_folder=None, use_radiance_mesh=False):
+            offset_distance=0, by_vertex=False, sim_folder=None, use_radiance_mesh=False,
+            matrix_format='dense', incremental=False, matrix_cache=None):
         """Initialize RadiationStudy."""
         # set default values, which will be overwritten when the study is run
         self._offset_distance = float(offset_distance)
         self._by_vertex = bool(by_vertex)
+        self._incremental = bool(incremental)
         # set the key properties of the object
         self.sky_matrix = sky_matrix
         self.study_mesh = study_mesh
         self.context_geometry = context_geometry
         self.sim_folder = sim_folder
         self.use_radiance_mesh = use_radiance_mesh
+        self.matrix_format = matrix_format
+        self.matrix_cache = matrix_cache
         # set default values, which will be overwritten when the study is run
         self._intersection_matrix = None
+        self._matrix_context = None
         self._radiation_values = None
+        self._radiation_list = None
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Create a computed RadiationStudy from bytes output by the to_bytes method.
+
+        The intersection matrix of the study is loaded as a view of the input
+        data without copying it when NumPy is installed, which is read-only if
+        the data is immutable bytes. The study has no context_geometry since its
+        effect is already captured by the intersection_matrix.
+
+        Args:
+            data: The bytes (or a bytearray) output by the to_bytes method.
+        """
+        header, arrays = from_container(data, 'RadiationStudy')
+        sky_matrix = SkyMatrix.from_bytes(bytearray(arrays['sky_matrix']))
+        study = cls(
+            sky_matrix, mesh_from_arrays(arrays), (), header['offset_distance'],
+            header['by_vertex'], None, header['use_radiance_mesh'],
+            header['matrix_format'], header['incremental'])
+        study._intersection_matrix = matrix_from_arrays(header['matrix'], arrays)
+        study._matrix_context = study._context_geometry
+        study._radiation_values = arrays['radiation_values']
+        return study
 
     @property
     def sky_matrix(self):
@@ -137,7 +202,8 @@ class RadiationStudy(object):
             assert isinstance(geo, (Face3D, Mesh3D)), 'Expected Face3D or Mesh3D for ' \
                 'RadiationStudy context_geometry. Got {}.'.format(type(geo))
         self._context_geometry = value
-        self._intersection_matrix = None
+        if not self._incremental:
+            self._intersection_matrix = None
         self._radiation_values = None
 
     @property
@@ -184,6 +250,42 @@ class RadiationStudy(object):
     def use_radiance_mesh(self, value):
         self._use_radiance_mesh = bool(value)
 
+    @property
+    def matrix_format(self):
+        """Get or set text for the format in which the intersection matrix is stored.
+        """
+        return self._matrix_format
+
+    @matrix_format.setter
+    def matrix_format(self, value):
+        assert value in MATRIX_FORMATS, 'Expected one of {} for RadiationStudy ' \
+            'matrix_format. Got {}.'.format(', '.join(MATRIX_FORMATS), value)
+        self._matrix_format = value
+        self._intersection_matrix = None
+        self._radiation_values = None
+
+    @property
+    def incremental(self):
+        """Get or set a boolean for whether context changes update the matrix in place.
+        """
+        return self._incremental
+
+    @incremental.setter
+    def incremental(self, value):
+        self._incremental = bool(value)
+
+    @property
+    def matrix_cache(self):
+        """Get or set text for the path where intersection matrices are cached."""
+        return self._matrix_cache
+
+    @matrix_cache.setter
+    def matrix_cache(self, value):
+        if value is not None:
+            assert isinstance(value, str), 'Expected file path string for ' \
+                'matrix_cache. Got {}.'.format(type(value))
+        self._matrix_cache = value
+
     @property
     def study_points(self):
         """Get a tuple of Point3Ds for the points of the study."""
@@ -196,8 +298,14 @@ class RadiationStudy(object):
 
     @property
     def intersection_matrix(self):
-        """Get a list of lists for the intersection matrix computed by the study."""
-        if self._intersection_matrix is None:
+        """Get a list of lists for the intersection matrix computed by the study.
+
+        When NumPy is installed, this is a NumPy array or SparseMatrix of cosines
+        or, if the matrix_format is packed, a PackedBoolMatrix of whether each
+        patch is seen.
+        """
+        if self._intersection_matrix is None or \
+                self._matrix_context is not self._context_geometry:
             self._compute_intersection_matrix()
         return self._intersection_matrix
 
@@ -206,16 +314,39 @@ class RadiationStudy(object):
         """Get a list of values for the radiation results of the study in kWh/m2."""
         if self._radiation_values is None:
             self.compute()
-        return self._radiation_values
+        if np is None:
+            return self._radiation_values
+        if self._radiation_list is None or \
+                self._radiation_list[0] is not self._radiation_values:
+            self._radiation_list = \
+                (self._radiation_values, self._radiation_values.tolist())
+        return self._radiation_list[1]
 
     @property
     def irradiance_values(self):
         """Get a list of values for the irradiance results of the study in W/m2."""
-        factor = 1000 / self.sky_matrix.wea_duration \
-            if hasattr(self.sky_matrix, 'wea_duration') else \
-            1000 / (((self.metadata[3] - self.metadata[2]).total_seconds() / 3600) + 1)
+        if np is not None:
+            return self.irradiance_array.tolist()
+        factor = self._irradiance_factor()
         return [r * factor for r in self.radiation_values]
 
+    @property
+    def radiation_array(self):
+        """Get a NumPy array of the radiation results of the study in kWh/m2.
+
+        This is the array in which the results are stored, which is returned
+        without being copied.
+        """
+        assert np is not None, 'NumPy must be installed to get RadiationStudy arrays.'
+        if self._radiation_values is None:
+            self.compute()
+        return self._radiation_values
+
+    @property
+    def irradiance_array(self):
+        """Get a NumPy array of the irradiance results of the study in W/m2."""
+        return self.radiation_array * self._irradiance_factor()
+
     @property
     def metadata(self):
         """Get a tuple of information about the metadata assigned to the study."""
@@ -240,6 +371,9 @@ class RadiationStudy(object):
         if self.by_vertex:
             full_area = self.study_mesh.area * conversion_to_meters
             total = sum(self.radiation_values) / full_area
+        elif np is not None:
+            areas = np.array(self._study_mesh.face_areas) * conversion_to_meters
+            total = float(np.dot(self.radiation_array, areas))
         else:
             total = 0
             for rad, area in zip(self.radiation_values, self._study_mesh.face_areas):
@@ -256,25 +390,55 @@ class RadiationStudy(object):
         part of the study runs, which is particularly helpful for larger studies.
         """
         # compute the intersection matrix
-        if self._intersection_matrix is None:
+        if self._intersection_matrix is None or \
+                self._matrix_context is not self._context_geometry:
             self._compute_intersection_matrix()
         # get the total radiation from the sky matrix
-        mtx = self.sky_matrix.data
+        all_rad = self._sky_radiation(self.sky_matrix)
         if np is None:  # perform the calculation with float numbers
-            sky_rad = [dir_rad + dif_rad for dir_rad, dif_rad in zip(mtx[1], mtx[2])]
-            grd_val = (sum(sky_rad) / len(sky_rad)) * self.sky_matrix.ground_reflectance
-            ground_rad = [grd_val] * len(sky_rad)
-            all_rad = sky_rad + ground_rad
             self._radiation_values = [
                 sum(r * w for r, w in zip(pt_rel, all_rad))
                 for pt_rel in self._intersection_matrix
             ]
         else:  # perform the calculation with numpy matrices
-            sky_rad = np.array(mtx[1]) + np.array(mtx[2])
-            grd_val = (sky_rad.sum() / len(sky_rad)) * self.sky_matrix.ground_reflectance
-            ground_rad = np.full(len(sky_rad), grd_val)
-            all_rad = np.concatenate([sky_rad, ground_rad])
-            self._radiation_values = np.dot(self._intersection_matrix, all_rad).tolist()
+            self._radiation_values = \
+                np.asarray(self._radiation_dot(all_rad), dtype=np.float64)
+
+    def radiation_for_skies(self, sky_matrices):
+        """Get the radiation values of the study for several sky matrices at once.
+
+        The radiation of the sky and ground patches of all skies are stacked into
+        one matrix, which is multiplied with the intersection matrix of the study
+        in a single matrix-matrix product. This is much faster than running a
+        separate study for each sky (eg. monthly skies or benefit/harm variants).
+        Neither the sky_matrix nor the radiation_values of the study are changed.
+
+        Args:
+            sky_matrices: A list of SkyMatrix objects, which must have the same
+                number of patches and north as the sky_matrix of the study.
+
+        Returns:
+            A NumPy array with one row for each study point and one column for each
+            sky, which contains radiation in kWh/m2. When NumPy is not installed,
+            this is a list of lists.
+        """
+        patch_count, north = len(self.sky_matrix.data[1]), self.metadata[0]
+        for sky in sky_matrices:
+            metadata, direct, _ = sky.data
+            assert len(direct) == patch_count and metadata[0] == north, \
+                'All sky_matrices must have the same density and north as the ' \
+                'sky_matrix of the RadiationStudy.'
+        if self._intersection_matrix is None or \
+                self._matrix_context is not self._context_geometry:
+            self._compute_intersection_matrix()
+        all_rads = [self._sky_radiation(sky) for sky in sky_matrices]
+        if np is None:  # perform the calculation with float numbers
+            return [[sum(r * w for r, w in zip(pt_rel, all_rad)) for all_rad in all_rads]
+                    for pt_rel in self._intersection_matrix]
+        if len(all_rads) == 0:
+            return np.zeros((len(self.study_points), 0))
+        return np.asarray(
+            self._radiation_dot(np.column_stack(all_rads)), dtype=np.float64)
 
     def draw(self, legend_parameters=None, plot_irradiance=False):
         """Draw a colored study_mesh, compass, graphic/legend, and title.
@@ -336,6 +500,56 @@ class RadiationStudy(object):
 
         return colored_mesh, graphic, title
 
+    def to_bytes(self):
+        """Get the computed study as compact bytes.
+
+        The bytes contain the sky_matrix, the study_mesh, the settings of the study,
+        the intersection_matrix and the radiation_values but not the
+        context_geometry. They can be loaded with the from_bytes method.
+        """
+        if self._radiation_values is None:
+            self.compute()
+        mtx_header, arrays = matrix_to_arrays(self._intersection_matrix)
+        header = {
+            'version': 1, 'offset_distance': self.offset_distance,
+            'by_vertex': self.by_vertex, 'use_radiance_mesh': self.use_radiance_mesh,
+            'matrix_format': self.matrix_format, 'incremental': self.incremental,
+            'matrix': mtx_header
+        }
+        arrays.update(mesh_to_arrays(self.study_mesh))
+        arrays['sky_matrix'] = ('<u1', bytearray(self.sky_matrix.to_bytes()))
+        arrays['radiation_values'] = ('<f8', self._radiation_values)
+        return to_container('RadiationStudy', header, arrays)
+
+    def _sky_radiation(self, sky_matrix):
+        """Get the radiation of each sky patch followed by each ground patch."""
+        mtx = sky_matrix.data
+        if np is None:
+            sky_rad = [dir_rad + dif_rad for dir_rad, dif_rad in zip(mtx[1], mtx[2])]
+            grd_val = (sum(sky_rad) / len(sky_rad)) * sky_matrix.ground_reflectance
+            return sky_rad + [grd_val] * len(sky_rad)
+        if hasattr(sky_matrix, 'direct_array'):
+            sky_rad = np.add(sky_matrix.direct_array, sky_matrix.diffuse_array,
+                             dtype=np.float64)
+        else:
+            sky_rad = np.array(mtx[1]) + np.array(mtx[2])
+        grd_val = (sky_rad.sum() / len(sky_rad)) * sky_matrix.ground_reflectance
+        return np.concatenate([sky_rad, np.full(len(sky_rad), grd_val)])
+
+    def _radiation_dot(self, all_rad):
+        """Get the product of the intersection matrix with radiation values."""
+        if self.matrix_format == 'packed':  # weight the booleans by the cosines
+            normals = np.array([n.to_array() for n in self.study_normals])
+            vectors = np.array([v.to_array() for v in sky_vectors(self.sky_matrix)])
+            return self._intersection_matrix.cosine_dot(all_rad, normals, vectors)
+        return self._intersection_matrix.dot(all_rad)
+
+    def _irradiance_factor(self):
+        """Get a number to convert the radiation values to irradiance."""
+        return 1000 / self.sky_matrix.wea_duration \
+            if hasattr(self.sky_matrix, 'wea_duration') else \
+            1000 / (((self.metadata[3] - self.metadata[2]).total_seconds() / 3600) + 1)
+
     def _reset_points(self):
         """Reset the study points and normals used in the study."""
         points = self._study_mesh.vertices if self._by_vertex else \
@@ -351,11 +565,21 @@ class RadiationStudy(object):
         self._radiation_values = None
 
     def _compute_intersection_matrix(self):
-        """Compute intersection matrix."""
-        self._intersection_matrix = sky_intersection_matrix(
-            self.sky_matrix, self.study_points, self.study_normals,
-            self.context_geometry, self.offset_distance, numericalize=True,
-            sim_folder=self.sim_folder, use_radiance_mesh=self.use_radiance_mesh)
+        """Compute intersection matrix or update it for a change in context geometry."""
+        numericalize = self.matrix_format != 'packed'
+        if self._intersection_matrix is not None and self._incremental:
+            self._intersection_matrix = update_intersection_matrix(
+                self._intersection_matrix, sky_vectors(self.sky_matrix),
+                self.study_points, self.study_normals, self._matrix_context,
+                self.context_geometry, self.offset_distance, numericalize,
+                sim_folder=self.sim_folder, use_radiance_mesh=self.use_radiance_mesh)
+        else:
+            self._intersection_matrix = sky_intersection_matrix(
+                self.sky_matrix, self.study_points, self.study_normals,
+                self.context_geometry, self.offset_distance, numericalize,
+                sim_folder=self.sim_folder, use_radiance_mesh=self.use_radiance_mesh,
+                matrix_format=self.matrix_format, matrix_cache=self.matrix_cache)
+        self._matrix_context = self.context_geometry
 
     def ToString(self):
         """Overwrite .NET ToString."""
@@ -0,0 +1,54 @@
+# coding=utf-8
+import numpy as np
+
+from ladybug_geometry.geometry3d import Vector3D, Point3D, LineSegment3D, Face3D, \
+    Mesh3D
+
+from ladybug_radiance.bvh import BVH
+
+
+def test_bvh_init():
+    """Test the initialization of the BVH and its properties."""
+    context_geometry = Face3D.from_extrusion(
+        LineSegment3D.from_end_points(Point3D(-2, -2, 0), Point3D(2, -2, 0)),
+        Vector3D(0, 0, 2)
+    )
+    mesh = Mesh3D(
+        [Point3D(0, 0, 3), Point3D(1, 0, 3), Point3D(1, 1, 3), Point3D(0, 1, 3),
+         Point3D(2, 2, 3)],
+        [(0, 1, 2, 3), (1, 4, 2)]
+    )
+    bvh = BVH.from_geometry([context_geometry, mesh])
+
+    assert bvh.triangle_count == 5
+    assert len(bvh) == 5
+    assert bvh.triangles.shape == (5, 3, 3)
+    assert bvh.depth == 0
+
+    empty_bvh = BVH.from_geometry([])
+    assert empty_bvh.triangle_count == 0
+    assert not any(empty_bvh.occluded([(0, 0, 0)], [(0, 0, 1)]))
+
+
+def test_bvh_occluded():
+    """Test the occluded method against a brute force intersection."""
+    rng = np.random.RandomState(0)
+    triangles = rng.uniform(-10, 10, (200, 3, 3))
+    origins = rng.uniform(-10, 10, (500, 3))
+    directions = rng.normal(size=(500, 3))
+    bvh = BVH(triangles)
+    assert bvh.depth == 5
+
+    expected = []
+    for org, d in zip(origins, directions):
+        v0 = triangles[:, 0]
+        e1, e2 = triangles[:, 1] - v0, triangles[:, 2] - v0
+        p_vec = np.cross(d, e2)
+        det = (e1 * p_vec).sum(axis=1)
+        t_vec = org - v0
+        u = (t_vec * p_vec).sum(axis=1) / det
+        q_vec = np.cross(t_vec, e1)
+        v = (d * q_vec).sum(axis=1) / det
+        t = (e2 * q_vec).sum(axis=1) / det
+        expected.append(np.any((u >= 0) & (v >= 0) & (u + v <= 1) & (t > 1e-6)))
+    assert np.array_equal(bvh.occluded(origins, directions), expected)
@@ -0,0 +1,55 @@
+# coding=utf-8
+import os
+import time
+
+from ladybug_geometry.geometry3d import Vector3D, Point3D, LineSegment3D, Face3D
+
+from ladybug_radiance.cache import FileCache, hash_values, geometry_hash
+
+
+def _add_entry(cache, key, size):
+    """Add an entry with a single file of a given size to a cache."""
+    staging = cache.stage()
+    with open(os.path.join(staging, 'data.bin'), 'wb') as f:
+        f.write(b'0' * size)
+    return cache.add(key, staging)
+
+
+def test_file_cache(tmpdir):
+    """Test the FileCache get, add and eviction."""
+    cache = FileCache(str(tmpdir.join('cache')), max_size=250)
+    assert os.path.isdir(cache.folder)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+    entry_a = _add_entry(cache, 'a', 100)
+    assert cache.get('a') == entry_a
+    assert 'a' in cache
+    time.sleep(0.05)
+    _add_entry(cache, 'b', 100)
+    assert len(cache) == 2
+    assert cache.size == 200
+
+    time.sleep(0.05)
+    cache.get('a')  # mark entry a as recently used so b is evicted
+    time.sleep(0.05)
+    _add_entry(cache, 'c', 100)
+    assert sorted(cache.keys) == ['a', 'c']
+    assert cache.size <= cache.max_size
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_hash():
+    """Test the hashing of values and geometry."""
+    assert hash_values(1, 'a', (1.0, 2.0)) == hash_values(1, 'a', (1.0, 2.0))
+    assert hash_values(1, 'a', (1.0, 2.0)) != hash_values(1, 'a', (1.0, 2.5))
+
+    geo_1 = Face3D.from_extrusion(
+        LineSegment3D.from_end_points(Point3D(-2, -2, 0), Point3D(2, -2, 0)),
+        Vector3D(0, 0, 2)
+    )
+    geo_2 = geo_1.move(Vector3D(0, 0, 1))
+    assert geometry_hash([geo_1]) == geometry_hash([geo_1.duplicate()])
+    assert geometry_hash([geo_1]) != geometry_hash([geo_2])
@@ -1,11 +1,35 @@
 # coding=utf-8
+import os
+import sys
+import math
+import threading
+
+import pytest
 import numpy as np
 
-from ladybug_geometry.geometry3d import Vector3D, Point3D, LineSegment3D, Face3D
+from ladybug_geometry.geometry3d import Vector3D, Point3D, LineSegment3D, Face3D, \
+    Mesh3D, Plane
+
+from ladybug.viewsphere import view_sphere
 
 from ladybug_radiance.skymatrix import SkyMatrix
+from ladybug_radiance.matrix import PackedBoolMatrix, SparseMatrix
 from ladybug_radiance.visualize.radrose import RadiationRose
-from ladybug_radiance.intersection import sky_intersection_matrix
+import ladybug_radiance.intersection as intersection
+from ladybug_radiance.intersection import intersection_matrix, \
+    sky_intersection_matrix, update_intersection_matrix, cull_context_geometry, \
+    sky_vectors, cluster_vectors, binary_to_array, binary_mtx_dimension, _write_geometry
+
+
+def _radial_sensors_and_wall():
+    """Get sensors at the origin facing every 10 degrees and a wall next to them."""
+    normals = [Vector3D(0, 1, 0).rotate_xy(math.radians(a)) for a in range(0, 360, 10)]
+    points = [Point3D(0, 0, 0)] * len(normals)
+    context_geometry = Face3D.from_extrusion(
+        LineSegment3D.from_end_points(Point3D(-2, -2, 0), Point3D(2, -2, 0)),
+        Vector3D(0, 0, 2)
+    )
+    return points, normals, context_geometry
 
 
 def test_intersection():
@@ -33,3 +57,394 @@ def test_intersection():
     assert len(int_mtx[0]) == 290
     assert all(isinstance(v, float) for v in int_mtx[0])
     assert sum(int_mtx[0]) != 0
+
+
+def test_intersection_numpy():
+    """Test the intersection functions with the numpy backend."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky_from_epw = SkyMatrix.from_epw(epw_path)
+    points, normals, context_geometry = _radial_sensors_and_wall()
+
+    int_mtx = sky_intersection_matrix(
+        sky_from_epw, points, normals, [context_geometry],
+        backend='numpy')
+    assert len(int_mtx) == len(normals)
+    assert len(int_mtx[0]) == 290
+    assert int_mtx.dtype == np.bool_
+    assert not all(int_mtx[0])
+
+    num_mtx = sky_intersection_matrix(
+        sky_from_epw, points, normals, [context_geometry],
+        numericalize=True, backend='numpy')
+    assert len(num_mtx) == len(normals)
+    assert len(num_mtx[0]) == 290
+    assert all(isinstance(v, float) for v in num_mtx[0])
+    assert sum(num_mtx[0]) != 0
+    assert np.array_equal(num_mtx > 0, int_mtx)
+
+
+def test_intersection_octree_cache(tmpdir):
+    """Test the intersection function with an octree cache."""
+    points, normals, context_geometry = _radial_sensors_and_wall()
+    cache_folder = str(tmpdir.join('octrees'))
+
+    vectors = view_sphere.tregenza_dome_vectors
+    int_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], octree_cache=cache_folder)
+    assert len(os.listdir(cache_folder)) == 1
+    cached_mtx = intersection_matrix(
+        vectors, points[:10], normals[:10], [context_geometry],
+        octree_cache=cache_folder)
+    assert len(os.listdir(cache_folder)) == 1
+    assert np.array_equal(int_mtx[:10], cached_mtx)
+
+
+def test_intersection_matrix_cache(tmpdir, monkeypatch):
+    """Test the intersection function with a matrix cache."""
+    points, normals, context_geometry = _radial_sensors_and_wall()
+    cache_folder = str(tmpdir.join('matrices'))
+
+    vectors = view_sphere.tregenza_dome_vectors
+    matrices = {}
+    for mtx_format in ('dense', 'packed', 'sparse'):
+        matrices[mtx_format] = intersection_matrix(
+            vectors, points, normals, [context_geometry],
+            matrix_format=mtx_format, matrix_cache=cache_folder)
+    assert len(os.listdir(cache_folder)) == 3
+
+    def no_trace(*args):
+        raise AssertionError('Cached intersection matrix was traced.')
+    monkeypatch.setattr(intersection, '_radiance_intersection_matrix', no_trace)
+    cached_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], matrix_cache=cache_folder)
+    assert np.array_equal(matrices['dense'], cached_mtx)
+    cached_mtx[0] = False  # cached matrices can be updated in memory
+    packed_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry],
+        matrix_format='packed', matrix_cache=cache_folder)
+    assert isinstance(packed_mtx, PackedBoolMatrix)
+    assert np.array_equal(packed_mtx.to_array(), matrices['dense'])
+    sparse_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry],
+        matrix_format='sparse', matrix_cache=cache_folder)
+    assert isinstance(sparse_mtx, SparseMatrix)
+    assert np.array_equal(sparse_mtx.to_array() > 0, matrices['dense'])
+
+    # any change to the inputs traces the matrix again
+    with pytest.raises(AssertionError):
+        intersection_matrix(
+            vectors, points, normals, [context_geometry], offset_distance=0.1,
+            matrix_cache=cache_folder)
+    with pytest.raises(AssertionError):
+        intersection_matrix(
+            vectors, points, normals, [context_geometry.move(Vector3D(0, 0, 1))],
+            matrix_cache=cache_folder)
+    assert np.array_equal(matrices['dense'], intersection_matrix(
+        vectors, points, normals, [context_geometry], matrix_cache=cache_folder))
+
+
+def test_intersection_stream():
+    """Test the intersection function with sensors streamed through rcontrib."""
+    points, normals, context_geometry = _radial_sensors_and_wall()
+
+    vectors = view_sphere.tregenza_dome_vectors
+    int_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], numericalize=True)
+    stream_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], numericalize=True, stream=True)
+    assert stream_mtx.shape == int_mtx.shape
+    assert np.allclose(int_mtx, stream_mtx, atol=1e-3)
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='The fake rcontrib is a Unix script.')
+def test_intersection_stream_short_output(tmpdir, monkeypatch):
+    """Test that a stream with missing sensor results raises an error."""
+    # a fake rcontrib that outputs the results of one sensor and exits without error
+    fake_exe = str(tmpdir.join('rcontrib'))
+    with open(fake_exe, 'w') as f:
+        f.write('#!{}\nimport sys\nsys.stdin.buffer.read()\n'
+                'sys.stdout.buffer.write(bytes(12 * 3))\n'
+                'sys.stderr.write("fake rcontrib stopped")\n'.format(sys.executable))
+    os.chmod(fake_exe, 0o755)
+    monkeypatch.setattr(intersection, 'RCONTRIB_EXE', fake_exe)
+
+    points, normals = [Point3D(0, 0, 0)] * 2, [Vector3D(0, 0, 1)] * 2
+    builder = intersection._MatrixBuilder(2, 3, True, 'dense')
+    with pytest.raises(AssertionError, match='fake rcontrib stopped'):
+        intersection._stream_rcontrib(
+            str(tmpdir.join('scene.oct')), 'vectors.mod', points, normals, 3,
+            None, builder)
+
+
+def test_intersection_workers():
+    """Test the intersection function with several parallel rcontrib processes."""
+    points, normals, context_geometry = _radial_sensors_and_wall()
+
+    vectors = view_sphere.tregenza_dome_vectors
+    int_mtx = intersection_matrix(vectors, points, normals, [context_geometry])
+    par_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], workers=4)
+    assert par_mtx.shape == int_mtx.shape
+    assert np.array_equal(int_mtx, par_mtx)
+
+
+def test_intersection_packed():
+    """Test the intersection function with a packed matrix_format."""
+    points, normals, context_geometry = _radial_sensors_and_wall()
+
+    vectors = view_sphere.tregenza_dome_vectors
+    int_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], backend='numpy')
+    packed_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], backend='numpy',
+        matrix_format='packed')
+    assert isinstance(packed_mtx, PackedBoolMatrix)
+    assert packed_mtx.shape == int_mtx.shape
+    assert np.array_equal(packed_mtx.to_array(), int_mtx)
+    assert np.array_equal(packed_mtx.sum(axis=1), int_mtx.sum(axis=1))
+
+    with pytest.raises(AssertionError):
+        intersection_matrix(
+            vectors, points, normals, [context_geometry], numericalize=True,
+            backend='numpy', matrix_format='packed')
+
+
+def test_intersection_sparse():
+    """Test the intersection function with sparse and auto matrix_formats."""
+    points, normals, context_geometry = _radial_sensors_and_wall()
+
+    vectors = view_sphere.tregenza_dome_vectors
+    num_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], numericalize=True,
+        backend='numpy')
+    sparse_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], numericalize=True,
+        backend='numpy', matrix_format='sparse')
+    assert isinstance(sparse_mtx, SparseMatrix)
+    assert np.array_equal(sparse_mtx.to_array(), num_mtx)
+    assert sparse_mtx.density == np.count_nonzero(num_mtx) / num_mtx.size
+
+    auto_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], numericalize=True,
+        backend='numpy', matrix_format='auto')
+    assert isinstance(auto_mtx, np.ndarray)  # half of the vectors are seen
+    auto_mtx = intersection_matrix(
+        vectors, points, normals, [Face3D.from_rectangle(10, 10).move(
+            Vector3D(-5, -5, 0.5))], numericalize=True, backend='numpy',
+        matrix_format='auto')
+    assert isinstance(auto_mtx, SparseMatrix)
+
+
+def test_binary_to_array(tmpdir):
+    """Test the reading of binary Radiance matrices with and without mmap."""
+    values = np.arange(3 * 4 * 3, dtype=np.float32).reshape(3, 4, 3)
+    header = '#?RADIANCE\nrcontrib -fdf\nNROWS=3\nNCOLS=4\nNCOMP=3\n' \
+        'FORMAT=float\n\n'
+    mtx_file = str(tmpdir.join('results.mtx'))
+    with open(mtx_file, 'wb') as wf:
+        wf.write(header.encode('utf-8'))
+        wf.write(values.tobytes())
+
+    assert binary_mtx_dimension(mtx_file) == (3, 4, 3, 7)
+    array = binary_to_array(mtx_file)
+    assert np.array_equal(array, values)
+    mmap_array = binary_to_array(mtx_file, memory_map=True)
+    assert isinstance(mmap_array, np.memmap)
+    assert np.array_equal(mmap_array, values)
+    assert np.array_equal(binary_to_array(mtx_file, 3, 4, 3, 7), values)
+
+
+def test_write_geometry(tmpdir):
+    """Test that context geometry is written to the same polygons as each face."""
+    face = Face3D.from_rectangle(3, 1)
+    mesh = Mesh3D(
+        [Point3D(0, 0, 3), Point3D(1, 0, 3), Point3D(1, 1, 3), Point3D(0, 1, 3),
+         Point3D(2, 2.5, 3)],
+        [(0, 1, 2, 3), (1, 4, 2), (2, 4, 3)]
+    )
+    folder = str(tmpdir)
+    _write_geometry([mesh, face], folder, False, None)
+    with open(os.path.join(folder, 'geometry.rad')) as rf:
+        lines = rf.read().split('\n')
+
+    assert len(lines) == 5
+    coords = ' '.join(str(v) for pt in face.vertices for v in pt)
+    assert lines[1] == 'black polygon poly_1 0 0 12 {}'.format(coords)
+    for fi, f_geo in enumerate(mesh.face_vertices):
+        coords = ' '.join(str(v) for pt in f_geo for v in pt)
+        assert lines[fi + 2] == 'black polygon poly_1_{} 0 0 {} {}'.format(
+            fi, len(f_geo) * 3, coords)
+
+
+def test_intersection_concurrent():
+    """Test that intersection matrices can be computed in parallel threads."""
+    points, normals, context_geometry = _radial_sensors_and_wall()
+    vector_sets = [view_sphere.tregenza_dome_vectors, view_sphere.reinhart_dome_vectors]
+    cur_dir = os.getcwd()
+
+    results = [None] * 4
+
+    def _compute(i):
+        results[i] = intersection_matrix(
+            vector_sets[i % 2], points, normals, [context_geometry])
+    threads = [threading.Thread(target=_compute, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert os.getcwd() == cur_dir
+    for i, int_mtx in enumerate(results):
+        assert int_mtx.shape == (len(normals), len(vector_sets[i % 2]))
+        assert np.array_equal(int_mtx, results[i % 2])
+
+
+def test_intersection_back_face_culling():
+    """Test that vectors behind all sensors are skipped without changing results."""
+    normals = [Vector3D(0, 1, 0)] * 5 + [Vector3D(1, 0, 0)] * 5
+    points = [Point3D(x, 0, 1) for x in range(10)]
+    context_geometry = Face3D.from_extrusion(
+        LineSegment3D.from_end_points(Point3D(-2, 2, 0), Point3D(12, 2, 0)),
+        Vector3D(0, 0, 2)
+    )
+    vectors = view_sphere.tregenza_dome_vectors
+    rad_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], numericalize=True)
+    np_mtx = intersection_matrix(
+        vectors, points, normals, [context_geometry], numericalize=True,
+        backend='numpy')
+    assert rad_mtx.shape == (10, len(vectors))
+    behind = np.array([v.x <= 0 and v.y <= 0 for v in vectors])
+    assert np.all(rad_mtx[:, behind] == 0)
+    assert np.array_equal(rad_mtx > 0, np_mtx > 0)
+
+
+def test_update_intersection_matrix():
+    """Test the update of an intersection matrix after a change in context."""
+    points = [Point3D(x * 0.5, y * 0.5, 1) for x in range(-4, 5) for y in range(-4, 5)]
+    normals = [Vector3D(0, 0, 1)] * len(points)
+    context = [
+        Face3D.from_rectangle(4, 4, Plane(o=Point3D(x, y, z)))
+        for x, y, z in ((-8, 0, 6), (6, 0, 3), (0, 6, 8), (0, -9, 4))
+    ]
+    new_context = context[1:] + [Face3D.from_rectangle(3, 3, Plane(o=Point3D(-3, 3, 5)))]
+    vectors = view_sphere.tregenza_dome_vectors
+
+    for numericalize, matrix_format in ((True, 'dense'), (False, 'packed')):
+        int_mtx = intersection_matrix(
+            vectors, points, normals, context, numericalize=numericalize,
+            backend='numpy', matrix_format=matrix_format)
+        new_mtx = intersection_matrix(
+            vectors, points, normals, new_context, numericalize=numericalize,
+            backend='numpy', matrix_format=matrix_format)
+        updated = update_intersection_matrix(
+            int_mtx, vectors, points, normals, context, new_context,
+            numericalize=numericalize, backend='numpy')
+        assert updated is int_mtx
+        if matrix_format == 'packed':
+            updated, new_mtx = updated.to_array(), new_mtx.to_array()
+        assert np.array_equal(updated, new_mtx)
+
+
+def test_cull_context_geometry(tmpdir):
+    """Test the removal of context geometry that cannot block any rays."""
+    points = [Point3D(x, y, 0) for x in range(3) for y in range(3)]
+    normals = [Vector3D(0, 0, 1)] * len(points)
+    vectors = view_sphere.tregenza_dome_vectors
+    above = Face3D.from_rectangle(2, 2, Plane(o=Point3D(-0.5, -0.5, 5)))
+    below = Face3D.from_rectangle(2, 2, Plane(o=Point3D(0, 0, -5)))
+    far = Face3D.from_rectangle(200, 200, Plane(o=Point3D(-100, -100, 80)))
+    wall = Face3D.from_extrusion(
+        LineSegment3D.from_end_points(Point3D(-5, 10, 0), Point3D(5, 10, 0)),
+        Vector3D(0, 0, 4)
+    )
+    context = [above, below, far, wall]
+
+    kept, removed = cull_context_geometry(context, points, vectors, normals)
+    assert kept == [above, far, wall]
+    assert removed == 1
+    kept, removed = cull_context_geometry(
+        context, points, vectors, normals, max_distance=50)
+    assert kept == [above, wall]
+    assert removed == 2
+    kept, removed = cull_context_geometry(context, points, [Vector3D(0, 0, 1)])
+    assert kept == [above, far]
+    assert removed == 2
+    kept, removed = cull_context_geometry(context, points, [Vector3D(0, 0, -1)], normals)
+    assert kept == []
+    assert removed == 4
+
+    near_mtx = intersection_matrix(
+        vectors, points, normals, [above, wall], numericalize=True, backend='numpy')
+    cull_mtx = intersection_matrix(
+        vectors, points, normals, context, numericalize=True, backend='numpy',
+        max_distance=50)
+    assert np.array_equal(near_mtx, cull_mtx)
+    rad_mtx = intersection_matrix(
+        vectors, points, normals, context, numericalize=True, max_distance=50)
+    assert np.array_equal(near_mtx > 0, rad_mtx > 0)
+
+    # no geometry is removed with an octree cache so it is shared by all sensors
+    cache_folder = str(tmpdir.join('octrees'))
+    for pts in (points, [Point3D(0, 0, -10)]):
+        intersection_matrix(
+            vectors, pts, normals[:len(pts)], context, max_distance=50,
+            octree_cache=cache_folder)
+    assert len(os.listdir(cache_folder)) == 1
+
+
+def test_sky_intersection_hierarchical():
+    """Test the hierarchical intersection with a high density sky."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky_from_epw = SkyMatrix.from_epw(epw_path, north=30, high_density=True)
+    points = [Point3D(x, y, 0.5) for x in range(0, 10, 2) for y in range(0, 10, 2)]
+    normals = [Vector3D(0, 0, 1)] * len(points)
+    context_geometry = [
+        Face3D.from_extrusion(
+            LineSegment3D.from_end_points(Point3D(-5, 12, 0), Point3D(15, 12, 0)),
+            Vector3D(0, 0, 6)),
+        Face3D.from_rectangle(6, 6, Plane(o=Point3D(2, 2, 3)))
+    ]
+
+    # the radiance backend cosines are float32 values rescaled by rcontrib
+    h_matrices = {}
+    for backend, rtol in (('numpy', 1e-9), ('radiance', 1e-4)):
+        full_mtx = sky_intersection_matrix(
+            sky_from_epw, points, normals, context_geometry, numericalize=True,
+            backend=backend)
+        h_mtx = sky_intersection_matrix(
+            sky_from_epw, points, normals, context_geometry, numericalize=True,
+            backend=backend, hierarchical=True)
+        assert h_mtx.shape == full_mtx.shape == (len(points), 1154)
+        assert np.mean((h_mtx > 0) != (full_mtx > 0)) < 0.01
+        assert np.allclose(
+            h_mtx[h_mtx > 0], full_mtx[h_mtx > 0], rtol=rtol, atol=0)
+        h_matrices[backend] = h_mtx
+
+    packed_mtx = sky_intersection_matrix(
+        sky_from_epw, points, normals, context_geometry, backend='numpy',
+        matrix_format='packed', hierarchical=True)
+    assert isinstance(packed_mtx, PackedBoolMatrix)
+    assert np.array_equal(packed_mtx.to_array(), h_matrices['numpy'] > 0)
+
+    # without context, the visibility of the coarse patches is never mixed
+    open_mtx = sky_intersection_matrix(
+        sky_from_epw, points, normals, [], backend='numpy', hierarchical=True)
+    sky_seen = np.array([v.z > 0 for v in sky_vectors(sky_from_epw)])
+    assert np.array_equal(open_mtx, np.tile(sky_seen, (len(points), 1)))
+
+
+def test_cluster_vectors():
+    """Test the clustering of vectors with nearly the same direction."""
+    vectors = [Vector3D(0, 0, 1), Vector3D(1, 0, 0), Vector3D(0, 0, 2),
+               Vector3D(0.01, 0, 1), Vector3D(1, 0.01, 0)]
+    cl_vecs, cluster_ids, max_error = cluster_vectors(vectors)
+    assert len(cl_vecs) == 4
+    assert cluster_ids == [0, 1, 0, 2, 3]
+    assert max_error < 1e-6
+
+    cl_vecs, cluster_ids, max_error = cluster_vectors(vectors, 2)
+    assert len(cl_vecs) == 2
+    assert cluster_ids == [0, 1, 0, 0, 1]
+    assert 0 < max_error <= 2
+    assert all(abs(v.magnitude - 1) < 1e-9 for v in cl_vecs)
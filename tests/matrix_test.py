@@ -0,0 +1,102 @@
+# coding=utf-8
+import pytest
+import numpy as np
+
+from ladybug_radiance.matrix import PackedBoolMatrix, SparseMatrix
+
+
+def test_packed_bool_matrix():
+    """Test the PackedBoolMatrix class and its properties."""
+    array = np.random.RandomState(0).rand(50, 21) > 0.5
+    mtx = PackedBoolMatrix.from_array(array)
+
+    assert mtx.shape == (50, 21)
+    assert len(mtx) == 50
+    assert mtx.dtype == np.bool_
+    assert mtx.nbytes == 50 * 3
+    assert np.array_equal(mtx.to_array(), array)
+    assert np.array_equal(mtx[3], array[3])
+    assert np.array_equal(mtx[[1, 3]], array[[1, 3]])
+    assert np.array_equal(mtx[np.array([0, 49, 2])], array[[0, 49, 2]])
+    assert np.array_equal(mtx.rows(10, 20), array[10:20])
+    assert np.array_equal(mtx[5:9].to_array(), array[5:9])
+    assert all(np.array_equal(r1, r2) for r1, r2 in zip(mtx, array))
+
+    new_rows = np.random.RandomState(1).rand(2, 21) > 0.5
+    array[[7, 0]] = new_rows
+    mtx.set_rows([7, 0], new_rows)
+    assert np.array_equal(mtx.to_array(), array)
+
+    columns = [0, 3, 3, 20, 1]
+    assert np.array_equal(mtx.take_columns(columns).to_array(), array[:, columns])
+
+
+def test_packed_bool_matrix_math():
+    """Test the sums and products of the PackedBoolMatrix class."""
+    state = np.random.RandomState(0)
+    row_count = PackedBoolMatrix.ROW_CHUNK * 2 + 10  # test products over several chunks
+    array = state.rand(row_count, 21) > 0.5
+    mtx = PackedBoolMatrix.from_array(array)
+
+    assert np.array_equal(mtx.sum(axis=1), array.sum(axis=1))
+    assert np.array_equal(mtx.sum(axis=0), array.sum(axis=0))
+    assert mtx.sum() == array.sum()
+
+    vector, matrix = state.rand(21), state.rand(21, 4)
+    assert np.allclose(mtx.dot(vector), np.dot(array, vector))
+    assert np.allclose(mtx.dot(matrix), np.dot(array, matrix))
+
+    normals, vectors = state.rand(row_count, 3) - 0.5, state.rand(21, 3) - 0.5
+    cos_mtx = np.dot(normals, vectors.T)
+    cos_mtx[~array | (cos_mtx < 0)] = 0
+    assert np.allclose(mtx.cosine_dot(vector, normals, vectors), np.dot(cos_mtx, vector))
+
+
+def test_sparse_matrix():
+    """Test the SparseMatrix class and its properties."""
+    state = np.random.RandomState(0)
+    array = state.rand(50, 21)
+    array[array < 0.8] = 0
+    mtx = SparseMatrix.from_array(array)
+
+    assert mtx.shape == (50, 21)
+    assert len(mtx) == 50
+    assert mtx.dtype == np.float64
+    assert mtx.density == np.count_nonzero(array) / array.size
+    assert mtx.nbytes < array.nbytes
+    assert np.array_equal(mtx.to_array(), array)
+    assert np.array_equal(mtx[3], array[3])
+    assert np.array_equal(mtx[-1], array[-1])
+    assert np.array_equal(mtx.rows(10, 20), array[10:20])
+    assert np.array_equal(mtx[5:9].to_array(), array[5:9])
+    assert all(np.array_equal(r1, r2) for r1, r2 in zip(mtx, array))
+
+    stacked = SparseMatrix.from_row_blocks([mtx[:20], mtx[20:]])
+    assert np.array_equal(stacked.to_array(), array)
+
+    new_rows = state.rand(3, 21)
+    array[[4, 30, 2]] = new_rows
+    mtx.set_rows([4, 30, 2], new_rows)
+    assert np.array_equal(mtx.to_array(), array)
+
+    columns = [0, 3, 3, 20, 1]
+    assert np.array_equal(mtx.take_columns(columns).to_array(), array[:, columns])
+
+
+def test_sparse_matrix_math():
+    """Test the sums and products of the SparseMatrix class."""
+    state = np.random.RandomState(0)
+    array = state.rand(50, 21)
+    array[array < 0.8] = 0
+    mtx, bool_mtx = SparseMatrix.from_array(array), SparseMatrix.from_array(array > 0)
+
+    assert np.allclose(mtx.sum(axis=1), array.sum(axis=1))
+    assert np.allclose(mtx.sum(axis=0), array.sum(axis=0))
+    assert mtx.sum() == pytest.approx(array.sum())
+    assert np.array_equal(bool_mtx.sum(axis=1), (array > 0).sum(axis=1))
+    assert bool_mtx.sum() == np.count_nonzero(array)
+
+    vector, matrix = state.rand(21), state.rand(21, 4)
+    assert np.allclose(mtx.dot(vector), np.dot(array, vector))
+    assert np.allclose(mtx.dot(matrix), np.dot(array, matrix))
+    assert np.allclose(bool_mtx.dot(vector), np.dot(array > 0, vector))
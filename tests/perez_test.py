@@ -0,0 +1,95 @@
+# coding=utf-8
+import math
+
+import numpy as np
+import pytest
+
+from ladybug.epw import EPW
+from ladybug.location import Location
+from ladybug.sunpath import Sunpath
+from ladybug.viewsphere import view_sphere
+
+from ladybug_radiance.perez import patch_directions, solar_position, \
+    perez_sky_matrix
+from ladybug_radiance.skymatrix import SkyMatrix
+
+
+def test_patch_directions():
+    """Test that the patch directions match the ladybug view sphere."""
+    for high_density, count in ((False, 145), (True, 577)):
+        alt, azi, dom = patch_directions(high_density)
+        assert len(alt) == len(azi) == len(dom) == count
+        assert np.sum(dom) == pytest.approx(2 * math.pi, rel=1e-6)
+        vecs = view_sphere.reinhart_dome_vectors if high_density \
+            else view_sphere.tregenza_dome_vectors
+        for a, z, vec in zip(alt, azi, vecs):
+            dx, dy, dz = math.sin(z) * math.cos(a), math.cos(z) * math.cos(a), \
+                math.sin(a)
+            assert dx * vec.x + dy * vec.y + dz * vec.z > math.cos(math.radians(2))
+
+
+def test_solar_position():
+    """Test that the Radiance solar position matches the ladybug Sunpath."""
+    loc = Location('Chicago', latitude=41.78, longitude=-87.75, time_zone=-6)
+    sp = Sunpath.from_location(loc)
+    months, days, hours = [3, 6, 9, 12], [21, 21, 21, 21], [9.5, 12.5, 15.5, 11.5]
+    alt, azi, _ = solar_position(
+        loc.latitude, loc.longitude, loc.time_zone, months, days, hours)
+    for i, (m, d, h) in enumerate(zip(months, days, hours)):
+        sun = sp.calculate_sun(m, d, h)
+        assert math.degrees(alt[i]) == pytest.approx(sun.altitude, abs=1)
+        assert math.degrees(azi[i]) == pytest.approx(sun.azimuth, abs=1)
+
+
+def test_perez_sky_matrix():
+    """Test that the Perez sky matrix conserves the input irradiance."""
+    epw = EPW('./tests/assets/epw/chicago.epw')
+    loc = epw.location
+    dts = epw.direct_normal_radiation.datetimes
+    dni = epw.direct_normal_radiation.values
+    dhi = epw.diffuse_horizontal_radiation.values
+    direct, diffuse = perez_sky_matrix(
+        loc.latitude, loc.longitude, loc.time_zone,
+        [dt.month for dt in dts], [dt.day for dt in dts],
+        [dt.hour + 0.5 for dt in dts], dni, dhi)
+    assert direct.shape == diffuse.shape == (8760, 145)
+    assert np.all(direct >= 0) and np.all(diffuse >= 0)
+
+    # all of the direct normal irradiance is assigned to the patches near the sun
+    sun_up = np.asarray(dhi) > 0
+    assert np.sum(direct) == pytest.approx(np.sum(np.asarray(dni)[sun_up]), rel=1e-6)
+    # the diffuse sky integrates back to the diffuse horizontal irradiance
+    alt, _, _ = patch_directions()
+    assert np.sum(diffuse.dot(np.sin(alt))) == pytest.approx(sum(dhi), rel=1e-3)
+
+
+def test_perez_gendaymtx_reference():
+    """Test the numpy backend against the patches of a stored gendaymtx sky."""
+    with open('./tests/assets/sky/chicago_gendaymtx.csv') as ref_file:
+        ref_file.readline()
+        ref = np.array([[float(v) for v in line.split(',')] for line in ref_file])
+    sky = SkyMatrix.from_epw('./tests/assets/epw/chicago.epw')
+    sky.backend = 'numpy'
+    direct, diffuse = np.array(sky.direct_values), np.array(sky.diffuse_values)
+    assert direct.shape == diffuse.shape == (145,)
+    # each patch is within 2% of the brightest patch, since the direct sun is
+    # split over the patches nearest to the sun and the solar positions differ
+    # by up to 1 degree, and the totals are within 0.5%
+    for values, ref_values in ((direct, ref[:, 0]), (diffuse, ref[:, 1])):
+        assert np.all(np.abs(values - ref_values) <= 0.02 * ref_values.max())
+        assert np.sum(values) == pytest.approx(np.sum(ref_values), rel=5e-3)
+
+
+def test_sky_matrix_backend():
+    """Test the backend property of the SkyMatrix."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky = SkyMatrix.from_epw(epw_path, list(range(24)))
+    assert sky.backend == 'radiance'
+    sky.backend = 'numpy'
+    metadata, direct, diffuse = sky.data
+    assert len(direct) == len(diffuse) == 145
+    assert all(v >= 0 for v in direct)
+    assert sum(diffuse) > 0
+
+    with pytest.raises(AssertionError):
+        sky.backend = 'not_a_backend'
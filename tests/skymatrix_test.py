@@ -1,7 +1,15 @@
 # coding=utf-8
+import os
+import subprocess
+
+import numpy as np
+import pytest
+
+from ladybug.analysisperiod import AnalysisPeriod
 from ladybug.epw import EPW
 
-from ladybug_radiance.skymatrix import SkyMatrix
+import ladybug_radiance.skymatrix as skymatrix
+from ladybug_radiance.skymatrix import SkyMatrix, GENDAYMTX_EXE
 
 
 def test_from_epw():
@@ -114,3 +122,194 @@ def test_from_ashrae_clear_sky():
     for direct, diffuse in clear_sky:
         assert direct >= 0
         assert diffuse >= 0
+
+
+def test_sky_cache(tmpdir, monkeypatch):
+    """Test that computed skies are loaded from the cache."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky = SkyMatrix.from_epw(epw_path, list(range(24)))
+    sky.folder = str(tmpdir)
+    sky.use_cache = True
+    direct, diffuse = sky.direct_values, sky.diffuse_values
+    cache_folder = os.path.join(str(tmpdir), 'sky_cache')
+    assert len(os.listdir(cache_folder)) == 1
+
+    # a new sky with the same inputs uses the entry while other inputs add entries
+    new_sky = SkyMatrix.from_epw(epw_path, list(range(24)), north=20)
+    new_sky.folder = str(tmpdir)
+    new_sky.use_cache = True
+
+    def no_sky(*args, **kwargs):
+        raise AssertionError('Cached sky was computed.')
+    monkeypatch.setattr(SkyMatrix, '_run_gendaymtx', no_sky)
+    monkeypatch.setattr(SkyMatrix, '_compute_perez', no_sky)
+    assert new_sky.direct_values == direct
+    assert new_sky.diffuse_values == diffuse
+    assert new_sky.north == new_sky.metadata[0] == 20
+
+    # an entry that is evicted by another process while it is read is computed again
+    monkeypatch.undo()
+
+    def evicted_entry(entry_folder):
+        raise IOError('The cache entry was deleted.')
+    monkeypatch.setattr(SkyMatrix, '_read_cache_entry', staticmethod(evicted_entry))
+    evicted_sky = SkyMatrix.from_epw(epw_path, list(range(24)))
+    evicted_sky.folder = str(tmpdir)
+    evicted_sky.use_cache = True
+    assert evicted_sky.direct_values == direct
+    assert len(os.listdir(cache_folder)) == 1
+
+    monkeypatch.undo()
+    other_sky = SkyMatrix.from_epw(epw_path, list(range(48)))
+    other_sky.folder = str(tmpdir)
+    other_sky.use_cache = True
+    assert len(other_sky.direct_values) == 145
+    assert len(os.listdir(cache_folder)) == 2
+
+
+def test_parse_mtx_data(monkeypatch):
+    """Test that gendaymtx data parses to the same values with and without NumPy."""
+    sky = SkyMatrix.from_epw('./tests/assets/epw/chicago.epw', list(range(24)))
+    for density, count in ((1, 146), (2, 578)):
+        rgb = np.random.RandomState(density).rand(count, 3).astype(np.float32) * 100
+        header = b'#?RADIANCE\ngendaymtx\nLATLONG= 41.78 87.75\nNROWS=%d\n' \
+            b'NCOLS=1\nNCOMP=3\n' % count
+        text_data = header + b'FORMAT=ascii\n\n' + b''.join(
+            b'%r %r %r\n' % tuple(float(v) for v in row) for row in rgb)
+        bin_data = header + b'FORMAT=float\nBYTEORDER=LittleEndian\n\n' + \
+            rgb.astype('<f4').tobytes()
+        text_vals = sky._parse_mtx_data(text_data, 24, density)
+        bin_vals = tuple(sky._binary_mtx_array(bin_data, 24, density)[:, 0].tolist())
+        with monkeypatch.context() as m:
+            m.setattr(skymatrix, 'np', None)
+            py_vals = sky._parse_mtx_data(text_data, 24, density)
+        assert len(text_vals) == count - 1
+        assert text_vals == py_vals
+        assert bin_vals == text_vals
+
+
+@pytest.mark.skipif(GENDAYMTX_EXE is None or not os.path.isfile(GENDAYMTX_EXE),
+                    reason='Radiance gendaymtx is not installed.')
+def test_parse_gendaymtx_output(tmpdir, monkeypatch):
+    """Test the parsing of real ASCII and binary gendaymtx outputs."""
+    sky = SkyMatrix.from_epw('./tests/assets/epw/chicago.epw', list(range(4000, 4048)))
+    wea_file = str(tmpdir.join('sky.wea'))
+    sky.wea.write(wea_file)
+    for density, count in ((1, 145), (2, 577)):
+        for comp in ('-d', '-s'):
+            cmds = [GENDAYMTX_EXE, '-m', str(density), comp, '-O1', '-A']
+            text_data = subprocess.check_output(cmds + [wea_file])
+            bin_data = subprocess.check_output(cmds + ['-of', wea_file])
+            text_vals = sky._parse_mtx_data(text_data, 48, density)
+            bin_vals = sky._binary_mtx_array(bin_data, 48, density)[:, 0].tolist()
+            with monkeypatch.context() as m:
+                m.setattr(skymatrix, 'np', None)
+                assert sky._parse_mtx_data(text_data, 48, density) == text_vals
+            assert len(text_vals) == len(bin_vals) == count
+            assert sum(bin_vals) > 0
+            # the ASCII output of gendaymtx only has three significant digits
+            assert bin_vals == pytest.approx(text_vals, rel=5e-3, abs=1e-6)
+
+
+def test_hourly_sky():
+    """Test the time-resolved sky and the cumulative values of periods."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky = SkyMatrix.from_epw_benefit(epw_path)
+    assert sky.hourly_direct_values.shape == (8760, 145)
+    assert sky.hourly_diffuse_values.dtype == np.float32
+
+    direct, diffuse = sky.period_values()
+    assert direct == pytest.approx(sky.direct_values, abs=1e-3)
+    assert diffuse == pytest.approx(sky.diffuse_values, abs=1e-3)
+
+    # the values of a period match those of a sky built for the period
+    period = AnalysisPeriod(6, 1, 9, 8, 31, 17)
+    period_sky = SkyMatrix.from_epw_benefit(epw_path, hoys=period.hoys)
+    period_sky.compute_hourly_sky()  # sum the same binary gendaymtx values
+    direct, diffuse = sky.period_values(period.hoys)
+    assert direct == pytest.approx(period_sky.direct_values, abs=1e-3)
+    assert diffuse == pytest.approx(period_sky.diffuse_values, abs=1e-3)
+    assert sky.period_values([]) == ((0.0,) * 145, (0.0,) * 145)
+
+    # hoys outside of the time steps of the Wea are ignored
+    direct, diffuse = period_sky.period_values(list(range(-24, 8784)))
+    assert direct == pytest.approx(period_sky.direct_values, abs=1e-3)
+    assert diffuse == pytest.approx(period_sky.diffuse_values, abs=1e-3)
+
+
+def test_benefit_from_hourly(monkeypatch):
+    """Test that a new benefit_matrix reuses the time-resolved sky."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    epw = EPW(epw_path)
+    sky = SkyMatrix.from_epw_benefit(epw_path, balance_temperature=15)
+    base_direct = sky.direct_values
+    assert sky._hourly_values is None  # the hourly values are only computed on request
+    sky.compute_hourly_sky()
+
+    ref_sky = SkyMatrix.from_epw_benefit(epw_path, balance_temperature=18)
+    ref_sky.compute_hourly_sky()
+    ref_direct, ref_diffuse = ref_sky.direct_values, ref_sky.diffuse_values
+
+    def no_sky(*args, **kwargs):
+        raise AssertionError('The hourly sky was computed again.')
+    monkeypatch.setattr(SkyMatrix, '_run_gendaymtx', no_sky)
+    monkeypatch.setattr(SkyMatrix, '_perez_matrices', no_sky)
+    sky.benefit_matrix = SkyMatrix.benefit_matrix_from_temperature(
+        epw.dry_bulb_temperature, 18)
+    assert sky.direct_values != base_direct
+    assert sky.direct_values == pytest.approx(ref_direct, abs=1e-6)
+    assert sky.diffuse_values == pytest.approx(ref_diffuse, abs=1e-6)
+
+
+def test_batch_from_epw(tmpdir):
+    """Test the computation of several skies in parallel processes."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    hoys = list(range(24))
+    ref_sky = SkyMatrix.from_epw(epw_path, hoys)
+    skies = list(SkyMatrix.batch_from_epw(
+        [epw_path] * 3, workers=2, hoys=hoys, folder=str(tmpdir), use_cache=True))
+    assert len(skies) == 3
+    for path, sky in skies:
+        assert path == epw_path
+        assert isinstance(sky, SkyMatrix)
+        assert sky.direct_values == ref_sky.direct_values
+        assert sky.folder == str(tmpdir)
+    assert os.listdir(str(tmpdir)) == ['sky_cache']  # the task folders are removed
+    assert len(os.listdir(os.path.join(str(tmpdir), 'sky_cache'))) == 1
+
+    skies = list(SkyMatrix.batch_from_epw([epw_path], hoys=hoys, balance_temperature=15))
+    assert skies[0][1].benefit_matrix is not None
+
+
+def test_to_bytes():
+    """Test the serialization of the SkyMatrix to bytes."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky = SkyMatrix.from_epw_benefit(epw_path, hoys=list(range(48)), north=20)
+    new_sky = SkyMatrix.from_bytes(sky.to_bytes())
+
+    assert new_sky.wea is None
+    assert new_sky.north == 20
+    assert new_sky.wea_duration == sky.wea_duration == 48
+    assert new_sky.metadata == sky.metadata
+    assert new_sky.benefit_matrix == sky.benefit_matrix
+    assert new_sky.direct_values == pytest.approx(sky.direct_values, rel=1e-6)
+    assert new_sky.diffuse_values == pytest.approx(sky.diffuse_values, rel=1e-6)
+    assert len(new_sky) == 145
+    assert str(new_sky) == str(sky)
+    with pytest.raises(AssertionError):
+        new_sky.compute_sky()
+    with pytest.raises(AssertionError, match='benefit_matrix'):
+        new_sky.benefit_matrix = [True] * 48
+    assert new_sky.benefit_matrix == sky.benefit_matrix
+    assert new_sky.direct_values == pytest.approx(sky.direct_values, rel=1e-6)
+
+
+def test_arrays():
+    """Test the NumPy arrays of the SkyMatrix values."""
+    sky = SkyMatrix.from_epw('./tests/assets/epw/chicago.epw', list(range(24)))
+    assert isinstance(sky.direct_array, np.ndarray)
+    assert sky.direct_array is sky.direct_array  # the array is not copied
+    assert sky.direct_values == tuple(sky.direct_array.tolist())
+    assert sky.diffuse_values == tuple(sky.diffuse_array.tolist())
+    assert sky.direct_values is sky.direct_values  # the tuple is derived once
+    assert isinstance(sky[0][0], float)
@@ -1,4 +1,6 @@
 # coding=utf-8
+import os
+
 import pytest
 import numpy as np
 
@@ -9,11 +11,32 @@ from ladybug.location import Location
 from ladybug.sunpath import Sunpath
 from ladybug.graphic import GraphicContainer
 
+import ladybug_radiance.intersection as intersection
 from ladybug_radiance.skymatrix import SkyMatrix
+from ladybug_radiance.matrix import PackedBoolMatrix, SparseMatrix
 from ladybug_radiance.study.radiation import RadiationStudy
 from ladybug_radiance.study.directsun import DirectSunStudy
 
 
+def _study_mesh_and_wall():
+    """Get a 2x2 study mesh and a wall next to it to be used as context."""
+    mesh_2d = Mesh2D.from_grid(Point2D(-1, -1), 2, 2, 1, 1)
+    mesh = Mesh3D.from_mesh2d(mesh_2d)
+    context_geometry = Face3D.from_extrusion(
+        LineSegment3D.from_end_points(Point3D(-2, -2, 0), Point3D(2, -2, 0)),
+        Vector3D(0, 0, 2)
+    )
+    return mesh, context_geometry
+
+
+def _nyc_sun_vectors():
+    """Get the sun vectors of the noon analemma in New York."""
+    nyc = Location('New_York', country='USA', latitude=40.72, longitude=-74.02,
+                   time_zone=-5)
+    sp = Sunpath.from_location(nyc)
+    return [s.sun_vector for s in sp.analemma_suns(Time(12), True, True)]
+
+
 def test_radiation_study():
     """Test the RadiationStudy class."""
     epw_path = './tests/assets/epw/chicago.epw'
@@ -91,3 +114,207 @@ def test_direct_sun_study():
     assert isinstance(colored_mesh, Mesh3D)
     assert isinstance(graphic, GraphicContainer)
     assert title == 'Direct Sun Hours'
+
+
+def test_studies_packed():
+    """Test the RadiationStudy and DirectSunStudy with a packed matrix_format."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky_from_epw = SkyMatrix.from_epw(epw_path)
+    mesh, context_geometry = _study_mesh_and_wall()
+
+    rad_study = RadiationStudy(sky_from_epw, mesh, [context_geometry])
+    packed_study = RadiationStudy(
+        sky_from_epw, mesh, [context_geometry], matrix_format='packed')
+    assert packed_study.matrix_format == 'packed'
+    assert isinstance(packed_study.intersection_matrix, PackedBoolMatrix)
+    assert packed_study.radiation_values == \
+        pytest.approx(rad_study.radiation_values, rel=1e-3)
+
+    sun_vecs = _nyc_sun_vectors()
+    sun_study = DirectSunStudy(sun_vecs, mesh, [context_geometry])
+    packed_study = DirectSunStudy(
+        sun_vecs, mesh, [context_geometry], matrix_format='packed')
+    assert isinstance(packed_study.intersection_matrix, PackedBoolMatrix)
+    assert packed_study.direct_sun_hours == sun_study.direct_sun_hours
+
+
+def test_studies_sparse():
+    """Test the RadiationStudy and DirectSunStudy with a sparse matrix_format."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky_from_epw = SkyMatrix.from_epw(epw_path)
+    mesh, context_geometry = _study_mesh_and_wall()
+
+    rad_study = RadiationStudy(sky_from_epw, mesh, [context_geometry])
+    sparse_study = RadiationStudy(
+        sky_from_epw, mesh, [context_geometry], matrix_format='sparse')
+    assert isinstance(sparse_study.intersection_matrix, SparseMatrix)
+    assert sparse_study.radiation_values == \
+        pytest.approx(rad_study.radiation_values, rel=1e-6)
+
+    sun_vecs = _nyc_sun_vectors()
+    sun_study = DirectSunStudy(sun_vecs, mesh, [context_geometry])
+    sparse_study = DirectSunStudy(
+        sun_vecs, mesh, [context_geometry], matrix_format='sparse')
+    assert isinstance(sparse_study.intersection_matrix, SparseMatrix)
+    assert sparse_study.direct_sun_hours == sun_study.direct_sun_hours
+
+
+def test_direct_sun_study_incremental():
+    """Test the DirectSunStudy with incremental updates of the context geometry."""
+    sun_vecs = _nyc_sun_vectors()
+    mesh, context_geometry = _study_mesh_and_wall()
+    new_geometry = context_geometry.move(Vector3D(0, -1, 0))
+
+    sun_study = DirectSunStudy(sun_vecs, mesh, [context_geometry], incremental=True)
+    assert sun_study.incremental
+    int_mtx = sun_study.intersection_matrix
+    sun_study.context_geometry = [new_geometry]
+    assert sun_study.intersection_matrix is int_mtx
+
+    new_study = DirectSunStudy(sun_vecs, mesh, [new_geometry])
+    assert np.array_equal(sun_study.intersection_matrix, new_study.intersection_matrix)
+    assert sun_study.direct_sun_hours == new_study.direct_sun_hours
+
+
+def test_direct_sun_study_angular_tolerance():
+    """Test the DirectSunStudy with clustering of nearly identical sun vectors."""
+    nyc = Location('New_York', country='USA', latitude=40.72, longitude=-74.02,
+                   time_zone=-5)
+    sp = Sunpath.from_location(nyc)
+    suns = [sp.calculate_sun_from_hoy(4000 + i / 12) for i in range(12 * 24 * 7)]
+    sun_vecs = [s.sun_vector for s in suns if s.is_during_day]
+    mesh, context_geometry = _study_mesh_and_wall()
+
+    sun_study = DirectSunStudy(sun_vecs, mesh, [context_geometry], timestep=12)
+    cl_study = DirectSunStudy(
+        sun_vecs, mesh, [context_geometry], timestep=12, angular_tolerance=2)
+    assert cl_study.angular_tolerance == 2
+    assert 0 < cl_study.max_angular_error <= 2
+    assert sun_study.max_angular_error == 0
+    assert sun_study.cluster_ids == list(range(len(sun_vecs)))
+    assert sun_study.intersection_matrix is sun_study.cluster_matrix
+    int_mtx = cl_study.intersection_matrix
+    assert int_mtx is cl_study.intersection_matrix
+    assert int_mtx.shape == (len(mesh.faces), len(sun_vecs))
+    assert cl_study.cluster_matrix.shape[1] == max(cl_study.cluster_ids) + 1 < \
+        len(sun_vecs)
+    assert np.mean(int_mtx != sun_study.intersection_matrix) < 0.01
+    for cl_hrs, hrs in zip(cl_study.direct_sun_hours, sun_study.direct_sun_hours):
+        assert cl_hrs == pytest.approx(hrs, abs=1)
+
+    packed_study = DirectSunStudy(
+        sun_vecs, mesh, [context_geometry], timestep=12, angular_tolerance=2,
+        matrix_format='packed')
+    assert np.array_equal(packed_study.intersection_matrix.to_array(), int_mtx)
+    assert packed_study.direct_sun_hours == cl_study.direct_sun_hours
+
+
+def test_studies_to_bytes():
+    """Test the serialization of the RadiationStudy and DirectSunStudy to bytes."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky_from_epw = SkyMatrix.from_epw_benefit(epw_path, hoys=list(range(24)))
+    mesh, context_geometry = _study_mesh_and_wall()
+    sun_vecs = _nyc_sun_vectors()
+
+    for mtx_format in ('dense', 'packed', 'sparse'):
+        rad_study = RadiationStudy(
+            sky_from_epw, mesh, [context_geometry], matrix_format=mtx_format)
+        new_study = RadiationStudy.from_bytes(rad_study.to_bytes())
+        assert new_study.matrix_format == mtx_format
+        assert new_study.is_benefit
+        assert new_study.radiation_values == rad_study.radiation_values
+        assert len(new_study.study_mesh.faces) == len(mesh.faces)
+        assert np.array_equal(np.asarray(new_study.intersection_matrix.sum(axis=1)),
+                              np.asarray(rad_study.intersection_matrix.sum(axis=1)))
+        new_study.compute()  # the results are computed again from the loaded matrix
+        assert new_study.radiation_values == \
+            pytest.approx(rad_study.radiation_values, rel=1e-5)
+
+        sun_study = DirectSunStudy(
+            sun_vecs, mesh, [context_geometry], matrix_format=mtx_format,
+            angular_tolerance=1)
+        new_study = DirectSunStudy.from_bytes(sun_study.to_bytes())
+        assert new_study.direct_sun_hours == sun_study.direct_sun_hours
+        assert new_study.max_angular_error == sun_study.max_angular_error
+        new_study.compute()
+        assert new_study.direct_sun_hours == sun_study.direct_sun_hours
+
+
+def test_studies_arrays():
+    """Test the NumPy arrays of the RadiationStudy and DirectSunStudy results."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky_from_epw = SkyMatrix.from_epw(epw_path, hoys=list(range(24)))
+    mesh, context_geometry = _study_mesh_and_wall()
+
+    rad_study = RadiationStudy(sky_from_epw, mesh, [context_geometry])
+    rad_array = rad_study.radiation_array
+    assert isinstance(rad_array, np.ndarray) and rad_array.dtype == np.float64
+    assert rad_study.radiation_array is rad_array
+    assert rad_study.radiation_values == rad_array.tolist()
+    assert rad_study.irradiance_values == \
+        pytest.approx(rad_study.irradiance_array.tolist())
+    assert rad_study.irradiance_array[0] == pytest.approx(rad_array[0] * 1000 / 24)
+    assert rad_study.total_radiation() == \
+        pytest.approx(sum(r * a for r, a in zip(rad_array, mesh.face_areas)))
+
+    sun_vecs = _nyc_sun_vectors()
+    sun_study = DirectSunStudy(sun_vecs, mesh, [context_geometry])
+    hours = sun_study.direct_sun_hours_array
+    assert isinstance(hours, np.ndarray)
+    assert sun_study.direct_sun_hours == hours.tolist()
+
+
+def test_radiation_for_skies():
+    """Test the evaluation of several skies against one intersection matrix."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    skies = [SkyMatrix.from_epw(epw_path, hoys=list(range(m * 730, m * 730 + 48)))
+             for m in range(3)]
+    skies.append(SkyMatrix.from_epw_benefit(epw_path, hoys=list(range(4000, 4048))))
+    mesh, context_geometry = _study_mesh_and_wall()
+
+    for mtx_format in ('dense', 'packed', 'sparse'):
+        rad_study = RadiationStudy(
+            skies[0], mesh, [context_geometry], matrix_format=mtx_format)
+        results = rad_study.radiation_for_skies(skies)
+        assert results.shape == (len(mesh.faces), len(skies))
+        for i, sky in enumerate(skies):
+            sky_study = RadiationStudy(
+                sky, mesh, [context_geometry], matrix_format=mtx_format)
+            assert results[:, i].tolist() == \
+                pytest.approx(sky_study.radiation_values, rel=1e-9)
+        assert rad_study.radiation_for_skies([]).shape == (len(mesh.faces), 0)
+
+    with pytest.raises(AssertionError):
+        rad_study.radiation_for_skies([SkyMatrix.from_epw(epw_path, north=20)])
+
+
+def test_studies_matrix_cache(tmpdir, monkeypatch):
+    """Test the studies with an intersection matrix cache."""
+    epw_path = './tests/assets/epw/chicago.epw'
+    sky_from_epw = SkyMatrix.from_epw(epw_path, hoys=list(range(4000, 4048)))
+    sun_vecs = _nyc_sun_vectors()
+    mesh, context_geometry = _study_mesh_and_wall()
+    cache_folder = str(tmpdir.join('matrices'))
+
+    rad_study = RadiationStudy(
+        sky_from_epw, mesh, [context_geometry], matrix_cache=cache_folder)
+    assert rad_study.matrix_cache == cache_folder
+    sun_study = DirectSunStudy(
+        sun_vecs, mesh, [context_geometry], matrix_cache=cache_folder)
+    rad_values, sun_hours = rad_study.radiation_values, sun_study.direct_sun_hours
+    assert len(os.listdir(cache_folder)) == 2
+
+    def no_trace(*args):
+        raise AssertionError('Cached intersection matrix was traced.')
+    monkeypatch.setattr(intersection, '_radiance_intersection_matrix', no_trace)
+    rad_study = RadiationStudy(
+        sky_from_epw, mesh, [context_geometry], matrix_cache=cache_folder)
+    assert rad_study.radiation_values == rad_values
+    sun_study = DirectSunStudy(
+        sun_vecs, mesh, [context_geometry], matrix_cache=cache_folder)
+    assert sun_study.direct_sun_hours == sun_hours
+    sun_study = DirectSunStudy(
+        sun_vecs, mesh, [context_geometry], offset_distance=0.1,
+        matrix_cache=cache_folder)
+    with pytest.raises(AssertionError):
+        sun_study.direct_sun_hours